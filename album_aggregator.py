@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from telegram import Message
+
+logger = logging.getLogger(__name__)
+
+# Максимальное количество элементов в альбоме Telegram
+MAX_ALBUM_SIZE = 10
+
+
+class Album:
+    """Альбом: сообщения с общим media_group_id"""
+
+    def __init__(self, chat_id: int, media_group_id: str):
+        self.chat_id = chat_id
+        self.media_group_id = media_group_id
+        self.messages: List[Message] = []
+        self._closed = asyncio.Event()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def message_id(self) -> int:
+        """Идентификатор первого сообщения альбома"""
+        return min(message.message_id for message in self.messages)
+
+    @property
+    def closed(self) -> bool:
+        """Альбом закрыт для новых элементов"""
+        return self._closed.is_set()
+
+    async def wait_closed(self) -> List[Message]:
+        """Ожидает закрытия альбома и возвращает сообщения по порядку"""
+        await self._closed.wait()
+        return sorted(self.messages, key=lambda message: message.message_id)
+
+
+class AlbumAggregator:
+    """
+    Собирает элементы альбома в одно задание
+
+    Telegram присылает элементы альбома отдельными сообщениями подряд.
+    Альбом закрывается, когда в течение window секунд не приходит новых
+    элементов или когда набрано MAX_ALBUM_SIZE элементов.
+    """
+
+    def __init__(self, window: float = 1.0):
+        self.window = window
+        self._albums: Dict[Tuple[int, str], Album] = {}
+
+    def add(self, message: Message) -> Optional[Album]:
+        """
+        Добавляет элемент альбома
+
+        Returns:
+            Новый альбом, если сообщение стало его первым элементом
+            (его нужно поставить в конвейер), иначе None
+        """
+        key = (message.chat_id, message.media_group_id)
+        album = self._albums.get(key)
+        created = album is None
+        if created:
+            album = self._albums[key] = Album(message.chat_id, message.media_group_id)
+
+        album.messages.append(message)
+        if len(album.messages) >= MAX_ALBUM_SIZE:
+            self._close(key)
+        else:
+            self._schedule_close(key, album)
+
+        return album if created else None
+
+    def close(self, chat_id: int, media_group_id: str) -> None:
+        """Закрывает альбом, не дожидаясь окна, если известно, что элементов больше не будет"""
+        self._close((chat_id, media_group_id))
+
+    def _schedule_close(self, key: Tuple[int, str], album: Album) -> None:
+        """Переносит закрытие альбома на window секунд после последнего элемента"""
+        if album._timer is not None:
+            album._timer.cancel()
+        album._timer = asyncio.get_running_loop().call_later(self.window, self._close, key)
+
+    def _close(self, key: Tuple[int, str]) -> None:
+        """Закрывает альбом; опоздавшие элементы попадут в новый альбом"""
+        album = self._albums.pop(key, None)
+        if album is None:
+            return
+        if album._timer is not None:
+            album._timer.cancel()
+            album._timer = None
+        logger.debug("Album %s closed with %s items", album.media_group_id, len(album.messages))
+        album._closed.set()
@@ -0,0 +1,105 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BandwidthScheduler:
+    """
+    Бюджет трафика в байтах за минуту (token bucket)
+
+    Ожидающие передачи получают бюджет от меньших к большим, поэтому
+    небольшие посты не стоят в очереди за тяжелым видео. Файл больше
+    минутного бюджета ждет полного бюджета и забирает его целиком.
+    """
+
+    def __init__(self, bytes_per_minute: int, name: str = 'transfer'):
+        """
+        Args:
+            bytes_per_minute: Бюджет в байтах за минуту (0 - без ограничения)
+            name: Название направления для логов
+        """
+        self.capacity = max(0, bytes_per_minute)
+        self.rate = self.capacity / 60.0
+        self.name = name
+        self.tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._order = itertools.count()
+        self._changed = asyncio.Event()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        """Ограничение включено"""
+        return self.capacity > 0
+
+    @property
+    def waiting(self) -> int:
+        """Количество передач, ожидающих бюджета"""
+        return len(self._waiters)
+
+    def _refill(self) -> None:
+        """Пополняет бюджет за прошедшее время"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, size: int) -> None:
+        """Ожидает, пока в бюджете найдется size байт, и списывает их"""
+        if not self.enabled or not size or size <= 0:
+            return
+
+        self._refill()
+        if not self._waiters and self.tokens >= min(size, self.capacity):
+            self.tokens -= size
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (size, next(self._order), future))
+        self._changed.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+        started = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Бюджет уже списан, но передача не состоится
+                self.tokens += size
+            else:
+                self._waiters = [waiter for waiter in self._waiters if waiter[2] is not future]
+                heapq.heapify(self._waiters)
+            raise
+
+        logger.debug("%s of %s bytes waited %.1fs for bandwidth budget", self.name, size, time.monotonic() - started)
+
+    async def _dispatch(self) -> None:
+        """Выдает бюджет ожидающим передачам, начиная с самой маленькой"""
+        while self._waiters:
+            self._changed.clear()
+            self._refill()
+
+            size, _, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+
+            needed = min(size, self.capacity)
+            if self.tokens >= needed:
+                heapq.heappop(self._waiters)
+                self.tokens -= size
+                future.set_result(None)
+                continue
+
+            # Ждем пополнения или появления передачи меньшего размера
+            delay = (needed - self.tokens) / self.rate
+            try:
+                await asyncio.wait_for(self._changed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
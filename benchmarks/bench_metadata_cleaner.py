@@ -0,0 +1,578 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк MetadataCleaner и проверка, что после очистки не остается координат
+
+Генерирует JPEG/PNG/TIFF/BMP/WebP/MP4 от миниатюры до 48 Мп с метаданными
+(EXIF с GPS, текстовые поля с координатами) и без них, прогоняет через
+clean_file_metadata и clean_image_metadata и для каждого случая выводит
+время на MB, пиковую память и размер результата. Если в очищенном файле
+остались координаты, скрипт завершается с кодом 1.
+
+Аудио (MP3 с ID3v2/APEv2/ID3v1, FLAC с VORBIS_COMMENT и обложкой, Ogg Opus
+и Vorbis с комментариями на нескольких страницах) дополнительно сверяется
+побайтно с тем же файлом без тегов, а у страниц Ogg проверяются контрольные
+суммы и нумерация: очищенный файл должен остаться корректным контейнером.
+
+Пример:
+    python benchmarks/bench_metadata_cleaner.py --sizes thumb,1mp,12mp --repeat 5 --json cleaner.json
+"""
+
+import argparse
+import base64
+import filecmp
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import exifread
+from PIL import Image, PngImagePlugin
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from metadata_cleaner import MetadataCleaner
+
+# Размеры изображений: от миниатюры до 48 Мп
+SIZES = {
+    'thumb': (160, 120),
+    '1mp': (1280, 800),
+    '12mp': (4000, 3000),
+    '48mp': (8000, 6000)
+}
+
+FORMATS = ('jpeg', 'png', 'tiff', 'bmp', 'webp', 'mp4', 'mp3', 'flac', 'opus', 'ogg')
+
+# Форматы, которые не могут хранить метаданные: для них готовится только вариант без них
+NO_METADATA_FORMATS = {'bmp'}
+
+# Аудио: очищенный файл сравнивается с тем же файлом без тегов; ogg - Vorbis
+AUDIO_FORMATS = {'mp3', 'flac', 'opus', 'ogg'}
+
+# Форматы с дополнительным вариантом: тег ID3v2 перед файлом и метаданные внутри
+ID3_PREFIX_FORMATS = {'flac'}
+
+# Форматы, которые clean_image_metadata не обрабатывает
+NON_IMAGE_FORMATS = {'mp4'} | AUDIO_FORMATS
+
+# Координаты в текстовом виде; их не должно быть в очищенном файле ни в каком поле
+GPS_SENTINEL = '+55.7558+037.6173/'
+
+GPS_IFD = {1: 'N', 2: (55.0, 45.0, 20.88), 3: 'E', 4: (37.0, 37.0, 2.28)}
+
+XMP_PACKET = (
+    '<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+    '<rdf:Description xmlns:exif="http://ns.adobe.com/exif/1.0/" exif:GPSLatitude="55,45.348N" '
+    f'exif:GPSLongitude="37,37.038E" exif:UserComment="{GPS_SENTINEL}"/></rdf:RDF></x:xmpmeta>'
+)
+
+
+# --- Тестовые файлы ---
+
+def _make_image(width: int, height: int) -> Image.Image:
+    """Изображение из шума и градиентов: сжимается примерно как фотография"""
+    gradient = Image.linear_gradient('L')
+    return Image.merge('RGB', (
+        Image.effect_noise((width, height), 48),
+        gradient.resize((width, height)),
+        gradient.transpose(Image.Transpose.ROTATE_90).resize((width, height))
+    ))
+
+
+def _exif() -> Image.Exif:
+    exif = Image.Exif()
+    exif[0x010F] = 'Benchmark Camera'
+    exif[0x0110] = 'BC-1'
+    exif[0x0132] = '2024:01:01 12:00:00'
+    exif[0x010E] = f'Shot at {GPS_SENTINEL}'
+    exif[0x8825] = GPS_IFD
+    return exif
+
+
+def _box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack('>I', 8 + len(payload)) + box_type + payload
+
+
+def _write_mp4(path: Path, size: int, with_metadata: bool) -> None:
+    """MP4 заданного размера; с метаданными - даты в mvhd, udta с названием и координатами ©xyz"""
+    ftyp = _box(b'ftyp', b'isom' + struct.pack('>I', 512) + b'isomiso2mp41')
+    timestamp = 3786825600 if with_metadata else 0
+    mvhd = _box(b'mvhd', bytes(4) + struct.pack('>IIII', timestamp, timestamp, 1000, 10000) + bytes(80))
+    moov_payload = mvhd
+    if with_metadata:
+        title = _box(b'\xa9nam', _box(b'data', struct.pack('>II', 1, 0) + b'Benchmark video'))
+        location = _box(b'\xa9xyz', struct.pack('>HH', len(GPS_SENTINEL), 0x15C7) + GPS_SENTINEL.encode())
+        moov_payload += _box(b'udta', location + _box(b'meta', bytes(4) + _box(b'ilst', title)))
+    header = ftyp + _box(b'moov', moov_payload)
+
+    mdat_size = max(0, size - len(header) - 8)
+    chunk = os.urandom(1024 * 1024)
+    with open(path, 'wb') as f:
+        f.write(header)
+        f.write(struct.pack('>I', 8 + mdat_size) + b'mdat')
+        for offset in range(0, mdat_size, len(chunk)):
+            f.write(chunk[:min(len(chunk), mdat_size - offset)])
+
+
+# --- Аудио ---
+
+def _syncsafe(value: int) -> bytes:
+    """Синхробезопасное целое ID3v2.4"""
+    return bytes((value >> shift) & 0x7F for shift in (21, 14, 7, 0))
+
+
+def _id3v2_tag() -> bytes:
+    """ID3v2.4 с названием, координатами в TXXX и комментарием"""
+    def frame(frame_id: bytes, payload: bytes) -> bytes:
+        return frame_id + _syncsafe(len(payload)) + b'\x00\x00' + payload
+
+    frames = (
+        frame(b'TIT2', b'\x03Benchmark track')
+        + frame(b'TXXX', b'\x03GPS\x00' + GPS_SENTINEL.encode())
+        + frame(b'COMM', b'\x03eng\x00' + f'Recorded at {GPS_SENTINEL}'.encode())
+    )
+    return b'ID3\x04\x00\x00' + _syncsafe(len(frames)) + frames
+
+
+def _ape_tag() -> bytes:
+    """APEv2 с заголовком и футером"""
+    value = GPS_SENTINEL.encode()
+    items = struct.pack('<II', len(value), 0) + b'Location\x00' + value
+    size = len(items) + 32
+
+    def block(flags: int) -> bytes:
+        return b'APETAGEX' + struct.pack('<IIII', 2000, size, 1, flags) + bytes(8)
+
+    # Бит 31 - у тега есть заголовок, бит 29 - это заголовок
+    return block(0xA0000000) + items + block(0x80000000)
+
+
+def _id3v1_tag() -> bytes:
+    comment = GPS_SENTINEL.encode().ljust(30, b'\x00')
+    return b'TAG' + b'Benchmark track'.ljust(30, b'\x00') + bytes(60) + b'2024' + comment + b'\xff'
+
+
+def _write_mp3(path: Path, size: int, with_metadata: bool) -> None:
+    """MP3 из кадров MPEG-1 Layer III 128 kbps со случайными данными"""
+    # Данные кадров одинаковы у вариантов с тегами и без них
+    rng = random.Random(size)
+    frame_size = 144 * 128000 // 44100
+    with open(path, 'wb') as f:
+        if with_metadata:
+            f.write(_id3v2_tag())
+        for _ in range(max(1, size // frame_size)):
+            f.write(b'\xff\xfb\x90\x00' + rng.randbytes(frame_size - 4))
+        if with_metadata:
+            f.write(_ape_tag() + _id3v1_tag())
+
+
+def _cover_art() -> bytes:
+    """Обложка: JPEG с EXIF и координатами, больше одной страницы Ogg после base64"""
+    buffer = io.BytesIO()
+    _make_image(256, 256).save(buffer, 'JPEG', quality=95, exif=_exif().tobytes())
+    return buffer.getvalue()
+
+
+def _picture_block() -> bytes:
+    """Блок PICTURE FLAC (тот же формат хранится в METADATA_BLOCK_PICTURE Ogg)"""
+    mime, data = b'image/jpeg', _cover_art()
+    return (
+        struct.pack('>II', 3, len(mime)) + mime + struct.pack('>I', 0)
+        + struct.pack('>IIIII', 256, 256, 24, 0, len(data)) + data
+    )
+
+
+def _vorbis_comments(with_picture: bool) -> bytes:
+    """Список комментариев Vorbis (vendor и поля) - общий для FLAC, Opus и Vorbis"""
+    fields = [b'TITLE=Benchmark track', f'LOCATION={GPS_SENTINEL}'.encode()]
+    if with_picture:
+        fields.append(b'METADATA_BLOCK_PICTURE=' + base64.b64encode(_picture_block()))
+    vendor = b'Benchmark encoder'
+    payload = struct.pack('<I', len(vendor)) + vendor + struct.pack('<I', len(fields))
+    return payload + b''.join(struct.pack('<I', len(field)) + field for field in fields)
+
+
+def _write_flac(path: Path, size: int, with_metadata: bool, id3_prefix: bool = False) -> None:
+    """
+    FLAC: STREAMINFO, SEEKTABLE и случайные данные кадров; с метаданными - комментарии, обложка и PADDING
+
+    С id3_prefix перед сигнатурой fLaC пишется тег ID3v2, как делают некоторые программы
+    """
+    rng = random.Random(size)
+    total_samples = 44100 * 60
+    # Частота 20 бит, каналы - 1 (3 бита), бит на отсчет - 1 (5 бит), число отсчетов 36 бит
+    packed = (44100 << 44) | (1 << 41) | (15 << 36) | total_samples
+    streaminfo = struct.pack('>HH', 4096, 4096) + bytes(6) + packed.to_bytes(8, 'big') + bytes(16)
+    seektable = struct.pack('>QQH', 0, 0, 4096)
+
+    blocks = [(0, streaminfo)]
+    if with_metadata:
+        blocks.append((4, _vorbis_comments(with_picture=False)))
+    blocks.append((3, seektable))
+    if with_metadata:
+        blocks += [(6, _picture_block()), (1, bytes(1024))]
+
+    with open(path, 'wb') as f:
+        if id3_prefix:
+            f.write(_id3v2_tag())
+        f.write(b'fLaC')
+        for index, (block_type, payload) in enumerate(blocks):
+            last = 0x80 if index == len(blocks) - 1 else 0
+            f.write(bytes([block_type | last]) + len(payload).to_bytes(3, 'big') + payload)
+        f.write(rng.randbytes(size))
+
+
+def _make_crc_table() -> List[int]:
+    table = []
+    for byte in range(256):
+        crc = byte << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else crc << 1
+        table.append(crc & 0xFFFFFFFF)
+    return table
+
+
+# Таблица CRC-32 Ogg (полином 0x04C11DB7, без отражения); считается независимо от format_strippers
+_OGG_CRC_TABLE = _make_crc_table()
+
+
+def _ogg_crc(data: bytes) -> int:
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xFFFFFFFF) ^ _OGG_CRC_TABLE[(crc >> 24) ^ byte]
+    return crc
+
+
+def _ogg_pages(serial: int, groups: List[Tuple[List[bytes], int]]) -> bytes:
+    """
+    Раскладывает пакеты по страницам Ogg
+
+    Каждая группа (пакеты, granule) начинается с новой страницы; страницы,
+    на которых не завершается ни один пакет, получают granule -1.
+    """
+    pages = []
+    for packets, granule in groups:
+        segments = []
+        for packet in packets:
+            for offset in range(0, len(packet) - len(packet) % 255, 255):
+                segments.append(packet[offset:offset + 255])
+            segments.append(packet[len(packet) - len(packet) % 255:])
+        continued = False
+        for start in range(0, len(segments), 255):
+            chunk = segments[start:start + 255]
+            lacing = bytes(len(segment) for segment in chunk)
+            completes = any(value < 255 for value in lacing)
+            pages.append([0x01 if continued else 0, granule if completes else -1, lacing, b''.join(chunk)])
+            continued = lacing[-1] == 255
+
+    pages[0][0] |= 0x02
+    pages[-1][0] |= 0x04
+    output = bytearray()
+    for sequence, (header_type, granule, lacing, body) in enumerate(pages):
+        page = bytearray(
+            b'OggS' + struct.pack('<BBqIIIB', 0, header_type, granule, serial, sequence, 0, len(lacing))
+            + lacing + body
+        )
+        struct.pack_into('<I', page, 22, _ogg_crc(bytes(page)))
+        output += page
+    return bytes(output)
+
+
+def _write_ogg(path: Path, size: int, with_metadata: bool, codec: str) -> None:
+    """
+    Ogg Opus или Vorbis со случайными аудиопакетами
+
+    Без метаданных пакет комментариев пустой (без vendor), как после очистки.
+    С метаданными комментарии с обложкой занимают несколько страниц, а у Vorbis
+    последняя из них содержит и заголовок setup.
+    """
+    rng = random.Random(size)
+    comments = _vorbis_comments(with_picture=True) if with_metadata else struct.pack('<II', 0, 0)
+    if codec == 'opus':
+        head = b'OpusHead' + struct.pack('<BBHIhB', 1, 2, 312, 48000, 0, 0)
+        groups = [([head], 0), ([b'OpusTags' + comments], 0)]
+        samples = 960
+    else:
+        head = b'\x01vorbis' + struct.pack('<IBIiiiBB', 0, 2, 44100, 0, 128000, 0, 0xB8, 1)
+        setup = b'\x05vorbis' + rng.randbytes(3000)
+        groups = [([head], 0), ([b'\x03vorbis' + comments + b'\x01', setup], 0)]
+        samples = 1024
+
+    granule = 0
+    packet_size = 1000
+    packets = [rng.randbytes(packet_size) for _ in range(max(1, size // packet_size))]
+    for start in range(0, len(packets), 4):
+        chunk = packets[start:start + 4]
+        granule += samples * len(chunk)
+        groups.append((chunk, granule))
+
+    with open(path, 'wb') as f:
+        f.write(_ogg_pages(0x5EED, groups))
+
+
+def ogg_errors(path: str) -> List[str]:
+    """Проверяет контрольные суммы, нумерацию и флаги страниц Ogg"""
+    errors = []
+    data = Path(path).read_bytes()
+    offset = 0
+    expected_sequence: Dict[int, int] = {}
+    header_type = 0
+    while offset < len(data):
+        if data[offset:offset + 4] != b'OggS':
+            return errors + [f"no Ogg page at offset {offset}"]
+        _, header_type, _, serial, sequence, crc, segments = struct.unpack_from('<BBqIIIB', data, offset + 4)
+        end = offset + 27 + segments + sum(data[offset + 27:offset + 27 + segments])
+        page = bytearray(data[offset:end])
+        struct.pack_into('<I', page, 22, 0)
+        if _ogg_crc(bytes(page)) != crc:
+            errors.append(f"bad CRC in page {sequence}")
+        if sequence != expected_sequence.get(serial, 0):
+            errors.append(f"page {sequence} out of sequence")
+        if (header_type & 0x02) != (0x02 if serial not in expected_sequence else 0):
+            errors.append(f"wrong BOS flag in page {sequence}")
+        expected_sequence[serial] = sequence + 1
+        offset = end
+    if not header_type & 0x04:
+        errors.append("last page has no EOS flag")
+    return errors[:3]
+
+
+def audio_errors(path: str, file_format: str, reference: Path) -> List[str]:
+    """Признаки поврежденного контейнера: очищенный файл должен совпасть с файлом без тегов"""
+    errors = ogg_errors(path) if file_format in ('opus', 'ogg') else []
+    if not filecmp.cmp(path, reference, shallow=False):
+        errors.append("output differs from untagged file")
+    return errors
+
+
+def write_fixture(path: Path, file_format: str, size: Tuple[int, int], with_metadata: bool,
+                  id3_prefix: bool = False) -> None:
+    width, height = size
+    if file_format == 'mp4':
+        # Видео примерно по байту на пиксель кадра соответствующего размера
+        _write_mp4(path, width * height, with_metadata)
+        return
+    # Аудио по байту на 8 пикселей: от нескольких KB до 6 MB (несколько минут MP3)
+    if file_format == 'mp3':
+        _write_mp3(path, width * height // 8, with_metadata)
+        return
+    if file_format == 'flac':
+        _write_flac(path, width * height // 8, with_metadata, id3_prefix)
+        return
+    if file_format in ('opus', 'ogg'):
+        _write_ogg(path, width * height // 8, with_metadata, 'opus' if file_format == 'opus' else 'vorbis')
+        return
+
+    image = _make_image(width, height)
+    options: Dict = {}
+    if with_metadata:
+        exif = _exif().tobytes()
+        if file_format == 'jpeg':
+            options = {'exif': exif, 'comment': f'Location {GPS_SENTINEL}'}
+        elif file_format == 'png':
+            info = PngImagePlugin.PngInfo()
+            info.add_text('Comment', f'Location {GPS_SENTINEL}')
+            info.add_itxt('XML:com.adobe.xmp', XMP_PACKET)
+            options = {'exif': exif, 'pnginfo': info}
+        elif file_format == 'webp':
+            options = {'exif': exif, 'xmp': XMP_PACKET.encode()}
+        elif file_format == 'tiff':
+            options = {'exif': exif}
+    if file_format == 'jpeg':
+        options['quality'] = 90
+    image.save(path, file_format.upper(), **options)
+
+
+# --- Проверка утечек ---
+
+def find_leaks(path: str, with_metadata: bool) -> List[str]:
+    """Возвращает признаки координат и метаданных, оставшихся в файле"""
+    leaks = []
+    found = MetadataCleaner.scan_file_metadata(path)
+    if found:
+        leaks.append(f"scanner: {', '.join(sorted(found))}")
+
+    with open(path, 'rb') as f:
+        gps_tags = [tag for tag in exifread.process_file(f, details=False) if tag.startswith('GPS')]
+    if gps_tags:
+        leaks.append(f"exifread: {', '.join(gps_tags[:3])}")
+
+    try:
+        with Image.open(path) as image:
+            if image.getexif().get_ifd(0x8825):
+                leaks.append("pillow: GPS IFD")
+    except Exception:
+        pass
+
+    if with_metadata:
+        data = Path(path).read_bytes()
+        for marker in (GPS_SENTINEL.encode(), GPS_SENTINEL.encode('utf-16-le'), b'GPSLatitude'):
+            if marker in data:
+                leaks.append(f"raw bytes: {marker[:20]!r}")
+    return leaks
+
+
+# --- Замеры ---
+
+def _run_method(method: str, source: str, output: str) -> str:
+    if method == 'clean_image_metadata':
+        return MetadataCleaner.clean_image_metadata(source, output)
+    return MetadataCleaner.clean_file_metadata(source, output)
+
+
+def _memory_status(field: str) -> int:
+    """Значение из /proc/self/status в байтах (Linux): VmRSS - текущий RSS, VmHWM - пиковый"""
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1]) * 1024
+    raise KeyError(field)
+
+
+def measure_memory(method: str, source: str, output: str) -> Tuple[int, int]:
+    """
+    Выполняется в отдельном процессе: пик памяти Python (tracemalloc) и прирост пикового RSS
+
+    tracemalloc не видит буферы изображений Pillow, поэтому прирост RSS выводится отдельно.
+    ru_maxrss не подходит: он наследуется от родителя через fork/exec.
+    """
+    logging.disable(logging.CRITICAL)
+    baseline_rss = _memory_status('VmRSS')
+    tracemalloc.start()
+    _run_method(method, source, output)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, max(0, _memory_status('VmHWM') - baseline_rss)
+
+
+def run_case(pool: ProcessPoolExecutor, fixture: Path, work_dir: Path, method: str,
+             with_metadata: bool, repeat: int, file_format: str, reference: Optional[Path] = None) -> dict:
+    input_size = fixture.stat().st_size
+    output = str(work_dir / f'{fixture.name}.{method}.out')
+
+    timings = []
+    result_path = None
+    for _ in range(repeat):
+        if os.path.exists(output):
+            os.unlink(output)
+        started = time.perf_counter()
+        result_path = _run_method(method, str(fixture), output)
+        timings.append(time.perf_counter() - started)
+
+    python_peak, rss_growth = pool.submit(measure_memory, method, str(fixture), output).result()
+    seconds = statistics.median(timings)
+    leaks = find_leaks(result_path, with_metadata)
+    if reference is not None:
+        leaks += audio_errors(result_path, file_format, reference)
+    return {
+        'input_bytes': input_size,
+        'median_ms': round(seconds * 1000, 3),
+        'ms_per_mb': round(seconds * 1000 / (input_size / 1048576), 3),
+        'python_peak_bytes': python_peak,
+        'rss_growth_bytes': rss_growth,
+        'output_bytes': os.path.getsize(result_path),
+        'rewritten': result_path != str(fixture),
+        'leaks': leaks
+    }
+
+
+def print_row(case: dict) -> None:
+    mb = 1048576
+    verdict = 'FAIL: ' + '; '.join(case['leaks']) if case['leaks'] else 'ok'
+    print(
+        f"{case['format']:<5} {case['size']:<6} {case['variant']:<7} {case['method']:<21} "
+        f"{case['input_bytes'] / mb:>9.2f} {case['median_ms']:>10.2f} {case['ms_per_mb']:>9.2f} "
+        f"{case['python_peak_bytes'] / mb:>8.2f} {case['rss_growth_bytes'] / mb:>8.1f} "
+        f"{case['output_bytes'] / mb:>9.2f}  {verdict}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='MetadataCleaner micro-benchmark and leak check')
+    parser.add_argument('--formats', default=','.join(FORMATS), help='comma-separated: ' + ','.join(FORMATS))
+    parser.add_argument('--sizes', default=','.join(SIZES), help='comma-separated: ' + ','.join(SIZES))
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per case (median is reported)')
+    parser.add_argument('--fixtures-dir', help='keep generated fixtures here and reuse them on later runs')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    formats = [item for item in args.formats.split(',') if item]
+    sizes = [item for item in args.sizes.split(',') if item]
+    unknown = set(formats) - set(FORMATS) | set(sizes) - set(SIZES)
+    if unknown:
+        parser.error(f"unknown formats or sizes: {', '.join(sorted(unknown))}")
+
+    # Очистка пишет в лог каждый файл; exifread ругается на форматы без EXIF
+    logging.disable(logging.CRITICAL)
+
+    temp_dir = Path(tempfile.mkdtemp(prefix='bench_cleaner_'))
+    fixtures_dir = Path(args.fixtures_dir) if args.fixtures_dir else temp_dir / 'fixtures'
+    fixtures_dir.mkdir(parents=True, exist_ok=True)
+    work_dir = temp_dir / 'work'
+    work_dir.mkdir()
+
+    print(f"{'fmt':<5} {'size':<6} {'variant':<7} {'method':<21} {'input MB':>9} {'median ms':>10} "
+          f"{'ms/MB':>9} {'py peak':>8} {'RSS +MB':>8} {'output MB':>9}  result")
+
+    results = []
+    # Отдельный процесс на каждый замер памяти: пиковый RSS процесса не уменьшается
+    pool_options = {'max_workers': 1, 'mp_context': get_context('spawn'), 'max_tasks_per_child': 1}
+    try:
+        with ProcessPoolExecutor(**pool_options) as pool:
+            for file_format in formats:
+                for size in sizes:
+                    variants = [('meta', True), ('clean', False)]
+                    if file_format in NO_METADATA_FORMATS:
+                        variants = [('clean', False)]
+                    elif file_format in ID3_PREFIX_FORMATS:
+                        variants.append(('id3', True))
+                    for variant, with_metadata in variants:
+                        fixture = fixtures_dir / f'{size}_{variant}.{file_format}'
+                        if not fixture.exists():
+                            write_fixture(fixture, file_format, SIZES[size], with_metadata, variant == 'id3')
+                        if with_metadata and not find_leaks(str(fixture), True):
+                            raise RuntimeError(f"Fixture {fixture} has no metadata to strip")
+
+                        reference = None
+                        if file_format in AUDIO_FORMATS:
+                            # Эталон для аудио - тот же файл без тегов
+                            reference = fixtures_dir / f'{size}_clean.{file_format}'
+                            if not reference.exists():
+                                write_fixture(reference, file_format, SIZES[size], False)
+
+                        methods = ['clean_file_metadata']
+                        if file_format not in NON_IMAGE_FORMATS:
+                            methods.append('clean_image_metadata')
+                        for method in methods:
+                            case = {'format': file_format, 'size': size, 'variant': variant, 'method': method}
+                            case.update(run_case(pool, fixture, work_dir, method, with_metadata, args.repeat,
+                                                 file_format, reference))
+                            print_row(case)
+                            results.append(case)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    leaked = [case for case in results if case['leaks']]
+    if leaked:
+        print(f"\n{len(leaked)} cases leaked metadata or produced a broken file")
+        sys.exit(1)
+    print(f"\nNo metadata leaks or broken files in {len(results)} cases")
+
+
+if __name__ == '__main__':
+    main()
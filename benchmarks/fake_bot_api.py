@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+Локальная замена Telegram Bot API для нагрузочного тестирования
+
+Отдает синтетические посты канала через getUpdates, файлы через getFile
+и /file/bot<token>/..., принимает send* и copyMessage. Задержка ответа
+и скорость передачи файлов настраиваются. Время от появления поста
+в getUpdates до его публикации записывается и отдается на /bench/stats.
+
+С --local-dir сервер ведет себя как telegram-bot-api --local: getFile
+возвращает абсолютный путь к файлу в этой директории, а send* принимают
+пути file:// вместо загрузки содержимого.
+
+После setWebhook обновления по порядку отправляются POST-запросами на
+зарегистрированный адрес с заголовком секретного токена, а getUpdates,
+как и у Telegram, отвечает 409 до deleteWebhook. Перед доставкой сервер
+отправляет один запрос с неверным токеном и запоминает код ответа.
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import re
+import struct
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+from urllib.parse import unquote
+
+import aiohttp
+from aiohttp import web
+from PIL import Image
+
+# Метка поста в тексте или подписи, по которой публикация сопоставляется с исходным постом
+MARKER_PATTERN = re.compile(r'bench #(\d+)')
+
+CHUNK_SIZE = 64 * 1024
+
+# Заголовок с secret_token из setWebhook
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+# Пауза перед повторной доставкой после ошибки webhook
+WEBHOOK_RETRY_DELAY = 0.5
+# Ожидание незавершенных запросов при остановке: бенчмарк к этому моменту уже закончен
+SHUTDOWN_TIMEOUT = 1.0
+
+# Поле сообщения для каждого метода отправки
+SEND_METHODS = {
+    'sendPhoto': 'photo',
+    'sendVideo': 'video',
+    'sendDocument': 'document',
+    'sendAnimation': 'animation',
+    'sendVideoNote': 'video_note',
+    'sendVoice': 'voice',
+    'sendAudio': 'audio'
+}
+
+
+def make_photo(size: int) -> bytes:
+    """JPEG из шума примерно заданного размера с EXIF и координатами GPS"""
+    side = max(16, int((size / 0.75) ** 0.5))
+    image = Image.frombytes('RGB', (side, side), os.urandom(side * side * 3))
+    exif = Image.Exif()
+    exif[0x010F] = 'Benchmark Camera'
+    exif[0x0132] = '2024:01:01 12:00:00'
+    exif[0x8825] = {1: 'N', 2: (55.0, 45.0, 21.0), 3: 'E', 4: (37.0, 37.0, 4.0)}
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality=85, exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def _box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack('>I', 8 + len(payload)) + box_type + payload
+
+
+def make_video(size: int) -> bytes:
+    """MP4 заданного размера: ftyp, moov с датами и udta, mdat со случайными данными"""
+    ftyp = _box(b'ftyp', b'isom' + struct.pack('>I', 512) + b'isomiso2mp41')
+    # mvhd версии 0: даты создания/изменения, масштаб, длительность, матрица и next_track_id
+    mvhd = _box(b'mvhd', bytes(4) + struct.pack('>IIII', 3786825600, 3786825600, 1000, 10000) + bytes(80))
+    title = _box(b'\xa9nam', _box(b'data', struct.pack('>II', 1, 0) + b'Benchmark video'))
+    udta = _box(b'udta', _box(b'meta', bytes(4) + _box(b'ilst', title)))
+    moov = _box(b'moov', mvhd + udta)
+    header = ftyp + moov
+    return header + _box(b'mdat', os.urandom(max(0, size - len(header) - 8)))
+
+
+def source_chat_ids(first: int, count: int) -> List[int]:
+    """ID исходных каналов: посты распределяются между ними по кругу"""
+    return [first - 1000 * index for index in range(max(1, count))]
+
+
+class FakeBotApi:
+    """HTTP-сервер, отвечающий на запросы бота как Bot API"""
+
+    def __init__(self, token: str, source_chat_id: int, latency: float = 0.0,
+                 download_rate: float = 0.0, upload_rate: float = 0.0,
+                 photo_size: int = 200 * 1024, video_size: int = 2 * 1024 * 1024,
+                 album_size: int = 3, seed: int = 0, local_dir: Optional[str] = None, sources: int = 1):
+        self.token = token
+        self.source_chat_ids = source_chat_ids(source_chat_id, sources)
+        self.latency = latency
+        # Байт в секунду на одну передачу (0 - без ограничения)
+        self.download_rate = download_rate
+        self.upload_rate = upload_rate
+        self.album_size = album_size
+        self.random = random.Random(seed)
+        self.blobs = {'photo': make_photo(photo_size), 'video': make_video(video_size)}
+        # Режим --local: файлы лежат на диске, клиент читает их сам
+        self.local_paths: Dict[str, str] = {}
+        if local_dir:
+            os.makedirs(local_dir, exist_ok=True)
+            for kind, data in self.blobs.items():
+                path = os.path.join(os.path.abspath(local_dir), kind)
+                with open(path, 'wb') as f:
+                    f.write(data)
+                self.local_paths[kind] = path
+
+        self.updates: List[dict] = []
+        # Обновления до этого номера подтверждены смещением getUpdates
+        self.confirmed = 0
+        self._new_updates = asyncio.Event()
+        self._next_message_id = 1
+        self._next_sent_id = 1
+        # Номер поста -> время появления в getUpdates; исходный message_id -> номер поста
+        self.available: Dict[int, float] = {}
+        self.source_posts: Dict[int, int] = {}
+        self.latencies: Dict[int, float] = {}
+        self.last_done: Optional[float] = None
+        self.requests = Counter()
+        self.bytes_downloaded = 0
+        self.bytes_uploaded = 0
+        # Зарегистрированный webhook и задача доставки обновлений на него
+        self.webhook_url = ''
+        self.webhook_secret = ''
+        self._webhook_task: Optional[asyncio.Task] = None
+        self.webhook_delivered = 0
+        self.webhook_errors = 0
+        # Код ответа бота на запрос с неверным секретным токеном
+        self.webhook_forged_status: Optional[int] = None
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=1024 ** 3)
+        app.router.add_route('*', f'/bot{self.token}/{{method}}', self._handle_method)
+        # Клиент кодирует ':' в токене в пути файла, поэтому токен сверяется после декодирования
+        app.router.add_get('/file/{bot_token}/{path:.*}', self._handle_download)
+        app.router.add_post('/bench/load', self._handle_load)
+        app.router.add_get('/bench/stats', self._handle_stats)
+        app.on_shutdown.append(self._on_shutdown)
+        return app
+
+    async def _on_shutdown(self, app: web.Application) -> None:
+        # Задача доставки держит соединение с ботом и не дает серверу завершиться
+        self._set_webhook('', '')
+
+    # --- Синтетические посты ---
+
+    def _channel_post(self, post: int, **fields) -> dict:
+        message_id = self._next_message_id
+        self._next_message_id += 1
+        self.source_posts[message_id] = post
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {
+                'id': self.source_chat_ids[post % len(self.source_chat_ids)], 'type': 'channel',
+                'title': 'Benchmark source'
+            }
+        }
+        message.update(fields)
+        return message
+
+    def _media_fields(self, kind: str, post: int, index: int = 0) -> dict:
+        size = len(self.blobs[kind])
+        file_id = f'{kind}_{post}_{index}'
+        media = {'file_id': file_id, 'file_unique_id': f'u{file_id}', 'file_size': size}
+        if kind == 'photo':
+            return {'photo': [dict(media, width=1280, height=1280)]}
+        return {'video': dict(media, width=1280, height=720, duration=10, mime_type='video/mp4')}
+
+    def _make_post(self, kind: str, post: int) -> List[dict]:
+        marker = f'bench #{post}'
+        if kind == 'text':
+            return [self._channel_post(post, text=f'{marker} ' + 'lorem ipsum ' * 20)]
+        if kind == 'album':
+            return [
+                self._channel_post(
+                    post, media_group_id=f'album{post}',
+                    **self._media_fields('photo', post, index),
+                    **({'caption': marker} if index == 0 else {})
+                )
+                for index in range(self.album_size)
+            ]
+        return [self._channel_post(post, caption=marker, **self._media_fields(kind, post))]
+
+    async def _feed(self, messages: int, mix: Dict[str, float], rate: float) -> None:
+        kinds, weights = list(mix), list(mix.values())
+        start = len(self.available)
+        for post in range(start, start + messages):
+            kind = self.random.choices(kinds, weights)[0]
+            self.available[post] = time.time()
+            for message in self._make_post(kind, post):
+                self.updates.append({'update_id': len(self.updates) + 1, 'channel_post': message})
+            self._new_updates.set()
+            if rate:
+                await asyncio.sleep(1 / rate)
+
+    # --- Обработчики ---
+
+    async def _handle_load(self, request: web.Request) -> web.Response:
+        """Ставит в очередь getUpdates заданное число постов"""
+        params = await request.json()
+        asyncio.create_task(self._feed(params['messages'], params['mix'], params.get('rate', 0)))
+        return web.json_response({'ok': True})
+
+    async def _handle_stats(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            'loaded': len(self.available),
+            'done': len(self.latencies),
+            'latencies': list(self.latencies.values()),
+            'first_available': min(self.available.values(), default=None),
+            'last_done': self.last_done,
+            'requests': dict(self.requests),
+            'bytes_downloaded': self.bytes_downloaded,
+            'bytes_uploaded': self.bytes_uploaded,
+            'webhook_url': self.webhook_url,
+            'webhook_delivered': self.webhook_delivered,
+            'webhook_errors': self.webhook_errors,
+            'webhook_forged_status': self.webhook_forged_status,
+            'photo_size': len(self.blobs['photo']),
+            'video_size': len(self.blobs['video'])
+        })
+
+    async def _handle_download(self, request: web.Request) -> web.StreamResponse:
+        if unquote(request.match_info['bot_token']) != f'bot{self.token}':
+            return web.Response(status=404)
+        kind = request.match_info['path'].split('/', 1)[0]
+        data = self.blobs.get(kind)
+        if data is None:
+            return web.Response(status=404)
+        await asyncio.sleep(self.latency)
+
+        response = web.StreamResponse(headers={'Content-Length': str(len(data))})
+        await response.prepare(request)
+        for offset in range(0, len(data), CHUNK_SIZE):
+            chunk = data[offset:offset + CHUNK_SIZE]
+            await response.write(chunk)
+            if self.download_rate:
+                await asyncio.sleep(len(chunk) / self.download_rate)
+        await response.write_eof()
+        self.bytes_downloaded += len(data)
+        return response
+
+    async def _handle_method(self, request: web.Request) -> web.Response:
+        method = request.match_info['method']
+        self.requests[method] += 1
+        params = await request.post()
+        await asyncio.sleep(self.latency)
+
+        if method in SEND_METHODS or method == 'sendMediaGroup':
+            size = (request.content_length or 0) + self._local_upload_size(method, params)
+            self.bytes_uploaded += size
+            if self.upload_rate:
+                await asyncio.sleep(size / self.upload_rate)
+
+        if method == 'getUpdates':
+            if self.webhook_url:
+                return self._error(409, "Conflict: can't use getUpdates method while webhook is active; "
+                                        "use deleteWebhook to delete the webhook first")
+            return self._ok(await self._get_updates(params))
+        if method == 'getWebhookInfo':
+            return self._ok({
+                'url': self.webhook_url, 'has_custom_certificate': False,
+                'pending_update_count': len(self.updates) - self.confirmed
+            })
+        if method == 'setWebhook':
+            self._set_webhook(params.get('url', ''), params.get('secret_token', ''))
+            return self._ok(True)
+        if method == 'deleteWebhook':
+            self._set_webhook('', '')
+            if params.get('drop_pending_updates') in ('true', 'True', '1'):
+                self.confirmed = len(self.updates)
+            return self._ok(True)
+        if method == 'getMe':
+            return self._ok({'id': 1, 'is_bot': True, 'first_name': 'Benchmark', 'username': 'benchmark_bot'})
+        if method == 'getFile':
+            kind = params['file_id'].split('_', 1)[0]
+            return self._ok({
+                'file_id': params['file_id'],
+                'file_unique_id': f"u{params['file_id']}",
+                'file_size': len(self.blobs[kind]),
+                'file_path': self.local_paths.get(kind) or f"{kind}/{params['file_id']}"
+            })
+        if method == 'sendMessage':
+            self._published(params.get('text'))
+            return self._ok(self._sent_message(params, text=params.get('text', '')))
+        if method in SEND_METHODS:
+            self._published(params.get('caption'))
+            return self._ok(self._sent_message(params, **self._sent_media(SEND_METHODS[method])))
+        if method == 'sendMediaGroup':
+            media = json.loads(params['media'])
+            for item in media:
+                self._published(item.get('caption'))
+            return self._ok([self._sent_message(params, **self._sent_media(item['type'])) for item in media])
+        if method == 'copyMessage':
+            post = self.source_posts.get(int(params['message_id']))
+            if post is not None:
+                self._done(post)
+            return self._ok({'message_id': self._sent_id()})
+        return self._ok(True)
+
+    @staticmethod
+    def _local_upload_size(method: str, params) -> int:
+        """Размер файлов, переданных путями file:// (режим --local)"""
+        if method == 'sendMediaGroup':
+            references = [item.get('media', '') for item in json.loads(params['media'])]
+        else:
+            references = [params.get(SEND_METHODS[method], '')]
+        return sum(
+            os.path.getsize(unquote(reference[len('file://'):]))
+            for reference in references if isinstance(reference, str) and reference.startswith('file://')
+        )
+
+    async def _get_updates(self, params) -> List[dict]:
+        offset = max(1, int(params.get('offset', 1)))
+        limit = int(params.get('limit', 100))
+        if 'offset' in params:
+            self.confirmed = max(self.confirmed, min(offset - 1, len(self.updates)))
+        offset = max(offset, self.confirmed + 1)
+        if len(self.updates) < offset:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get('timeout', 0)))
+            except asyncio.TimeoutError:
+                pass
+        return self.updates[offset - 1:offset - 1 + limit]
+
+    # --- Webhook ---
+
+    def _set_webhook(self, url: str, secret: str) -> None:
+        """Регистрирует или удаляет webhook и перезапускает доставку"""
+        self.webhook_url, self.webhook_secret = url, secret
+        if self._webhook_task is not None:
+            self._webhook_task.cancel()
+            self._webhook_task = None
+        if url:
+            self._webhook_task = asyncio.create_task(self._deliver_updates(url, secret))
+
+    async def _deliver_updates(self, url: str, secret: str) -> None:
+        """Отправляет неподтвержденные обновления на webhook по одному, как Telegram"""
+        async with aiohttp.ClientSession() as session:
+            # Запрос с неверным токеном бот должен отклонить, не обрабатывая
+            try:
+                async with session.post(url, json={'update_id': 0},
+                                        headers={SECRET_TOKEN_HEADER: secret + 'forged'}) as response:
+                    self.webhook_forged_status = response.status
+            except aiohttp.ClientError:
+                pass
+
+            while True:
+                if self.confirmed >= len(self.updates):
+                    self._new_updates.clear()
+                    if self.confirmed >= len(self.updates):
+                        await self._new_updates.wait()
+                    continue
+
+                update = self.updates[self.confirmed]
+                try:
+                    async with session.post(url, json=update, headers={SECRET_TOKEN_HEADER: secret}) as response:
+                        delivered = response.status == 200
+                except aiohttp.ClientError:
+                    delivered = False
+                if delivered:
+                    self.confirmed += 1
+                    self.webhook_delivered += 1
+                else:
+                    self.webhook_errors += 1
+                    await asyncio.sleep(WEBHOOK_RETRY_DELAY)
+
+    # --- Ответы ---
+
+    def _published(self, text: Optional[str]) -> None:
+        match = MARKER_PATTERN.search(text or '')
+        if match:
+            self._done(int(match.group(1)))
+
+    def _done(self, post: int) -> None:
+        if post in self.latencies or post not in self.available:
+            return
+        self.last_done = time.time()
+        self.latencies[post] = self.last_done - self.available[post]
+
+    def _sent_id(self) -> int:
+        self._next_sent_id += 1
+        return self._next_sent_id
+
+    def _sent_message(self, params, **fields) -> dict:
+        message = {
+            'message_id': self._sent_id(),
+            'date': int(time.time()),
+            'chat': {'id': int(params['chat_id']), 'type': 'channel', 'title': 'Benchmark target'}
+        }
+        message.update(fields)
+        return message
+
+    def _sent_media(self, field: str) -> dict:
+        file_id = f'sent_{self._next_sent_id}'
+        media = {'file_id': file_id, 'file_unique_id': f'u{file_id}'}
+        if field == 'photo':
+            return {'photo': [dict(media, width=1280, height=1280)]}
+        return {field: dict(media, width=1280, height=720, duration=10, length=240)}
+
+    @staticmethod
+    def _ok(result) -> web.Response:
+        return web.json_response({'ok': True, 'result': result})
+
+    @staticmethod
+    def _error(code: int, description: str) -> web.Response:
+        return web.json_response({'ok': False, 'error_code': code, 'description': description}, status=code)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Telegram Bot API for benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--token', default='123456:benchmark')
+    parser.add_argument('--source-chat-id', type=int, default=-1001000000001)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='delay added to every request')
+    parser.add_argument('--download-mbps', type=float, default=0.0, help='MB/s per download (0 - unlimited)')
+    parser.add_argument('--upload-mbps', type=float, default=0.0, help='MB/s per upload (0 - unlimited)')
+    parser.add_argument('--photo-kb', type=int, default=200)
+    parser.add_argument('--video-kb', type=int, default=2048)
+    parser.add_argument('--album-size', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--local-dir', help='emulate telegram-bot-api --local with files in this directory')
+    parser.add_argument('--sources', type=int, default=1, help='number of source channels')
+    args = parser.parse_args()
+
+    api = FakeBotApi(
+        token=args.token,
+        source_chat_id=args.source_chat_id,
+        latency=args.latency_ms / 1000,
+        download_rate=args.download_mbps * 1024 * 1024,
+        upload_rate=args.upload_mbps * 1024 * 1024,
+        photo_size=args.photo_kb * 1024,
+        video_size=args.video_kb * 1024,
+        album_size=args.album_size,
+        seed=args.seed,
+        local_dir=args.local_dir,
+        sources=args.sources
+    )
+    web.run_app(api.build_app(), host=args.host, port=args.port, access_log=None, print=None,
+               shutdown_timeout=SHUTDOWN_TIMEOUT)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+"""
+Сквозной бенчмарк ретрансляции против локального fake_bot_api.py
+
+Запускает замену Bot API в отдельном процессе, подключает к ней
+TelegramRelayBot и прогоняет через него синтетические посты канала
+(текст, фото, альбомы, видео). Выводит сообщений в секунду, p50/p95/p99
+задержки ретрансляции и пиковое потребление памяти процессом бота.
+
+С --webhook бот принимает обновления через webhook: замена Bot API
+доставляет их POST-запросами с секретным токеном на локальный порт бота;
+посты подаются после setWebhook, а прогон без доставленных обновлений
+считается неудачным.
+
+Пример:
+    python benchmarks/relay_benchmark.py --messages 500 --mix text=40,photo=30,album=20,video=10
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import aiohttp
+
+from fake_bot_api import source_chat_ids
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCHMARKS_DIR.parent))
+
+TOKEN = '123456:benchmark'
+SOURCE_CHAT_ID = -1001000000001
+TARGET_CHAT_ID = -1001000000002
+WEBHOOK_SECRET = 'benchmark-secret'
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """Разбирает состав нагрузки: text=40,photo=30,album=20,video=10"""
+    mix = {}
+    for item in value.split(','):
+        kind, _, weight = item.partition('=')
+        if kind.strip() not in ('text', 'photo', 'album', 'video'):
+            raise argparse.ArgumentTypeError(f"Unknown post type: {kind}")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def configure_environment(args, work_dir: Path, server_url: str) -> None:
+    """Задает конфигурацию бота до импорта config.py"""
+    os.environ.update({
+        'BOT_TOKEN': TOKEN,
+        'BOT_API_BASE_URL': f'{server_url}/bot',
+        'BOT_API_FILE_URL': f'{server_url}/file/bot',
+        'BOT_API_LOCAL_MODE': 'true' if args.local else 'false',
+        'SOURCE_CHANNEL_ID': str(SOURCE_CHAT_ID),
+        'TARGET_CHANNEL_ID': str(TARGET_CHAT_ID),
+        # Несколько исходных каналов ретранслируются в один целевой
+        'ROUTES': ';'.join(f'{source}:{TARGET_CHAT_ID}' for source in source_chat_ids(SOURCE_CHAT_ID, args.sources))
+        if args.sources > 1 else '',
+        'UPDATE_MODE': 'webhook' if args.webhook else 'polling',
+        'PROXY_URL': '',
+        'TEMP_DIR': str(work_dir / 'temp'),
+        'JOURNAL_PATH': '',
+        'UPLOAD_CACHE_DB': '',
+        'METRICS_PORT': '0',
+        'LOG_FILE': '',
+        # Уровень логов процессов-воркеров
+        'LOG_LEVEL': args.log_level.upper()
+    })
+    if args.webhook:
+        port = free_port()
+        os.environ.update({
+            'WEBHOOK_URL': f'http://127.0.0.1:{port}',
+            'WEBHOOK_LISTEN': '127.0.0.1',
+            'WEBHOOK_PORT': str(port),
+            'WEBHOOK_SECRET': WEBHOOK_SECRET
+        })
+    if not args.flood_control:
+        # Лимиты Telegram ограничили бы замер 20 сообщениями в минуту на канал
+        os.environ.update({'FLOOD_GLOBAL_RATE': '1000000', 'FLOOD_CHAT_RATE': '100000000'})
+    for item in args.env:
+        key, _, value = item.partition('=')
+        os.environ[key] = value
+
+
+async def wait_for_server(session: aiohttp.ClientSession, url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            async with session.get(f'{url}/bench/stats') as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("Fake Bot API server did not start")
+        await asyncio.sleep(0.1)
+
+
+async def run_benchmark(args, server_url: str) -> dict:
+    # Модули бота читают конфигурацию при импорте
+    from metrics import get_metrics
+    from supervisor import Supervisor
+    from telegram_bot import TelegramRelayBot
+
+    async with aiohttp.ClientSession() as session:
+        await wait_for_server(session, server_url)
+
+        load = {'messages': args.messages, 'mix': args.mix, 'rate': args.rate}
+        if args.backlog:
+            # Посты накоплены до запуска бота, как после простоя
+            async with session.post(f'{server_url}/bench/load', json=dict(load, rate=0)) as response:
+                response.raise_for_status()
+            while True:
+                async with session.get(f'{server_url}/bench/stats') as response:
+                    if (await response.json())['loaded'] >= args.messages:
+                        break
+                await asyncio.sleep(0.05)
+
+        started = time.time()
+        if args.workers > 1:
+            # Каналы распределяются между процессами-воркерами
+            bot = Supervisor(args.workers)
+            bot_task = asyncio.create_task(bot.run())
+        else:
+            bot = TelegramRelayBot()
+            bot_task = asyncio.create_task(bot.start())
+
+        if not args.backlog:
+            if args.workers > 1:
+                # Посты подаются после первого heartbeat воркеров: запуск процессов не входит в замер
+                while not all(worker.snapshot for worker in bot.workers) and not bot_task.done():
+                    await asyncio.sleep(0.1)
+            if args.webhook:
+                # Иначе посты, поданные до setWebhook, заберет догоняющий getUpdates и webhook останется без работы
+                while not bot_task.done():
+                    async with session.get(f'{server_url}/bench/stats') as response:
+                        if (await response.json())['webhook_url']:
+                            break
+                    await asyncio.sleep(0.05)
+            async with session.post(f'{server_url}/bench/load', json=load) as response:
+                response.raise_for_status()
+
+        deadline = time.monotonic() + args.timeout
+        while True:
+            async with session.get(f'{server_url}/bench/stats') as response:
+                stats = await response.json()
+            if stats['done'] >= args.messages or time.monotonic() > deadline or bot_task.done():
+                break
+            await asyncio.sleep(0.2)
+
+        bot.request_stop()
+        await bot_task
+
+    # Длительность этапов: (сумма, количество) по этапу и типу медиа
+    totals: Dict[str, List[float]] = {}
+    if args.workers > 1:
+        # Метрики воркеров известны по последнему снимку, переданному supervisor
+        for worker in bot.workers:
+            for entry in worker.snapshot:
+                if entry['name'] != 'relay_stage_duration_seconds':
+                    continue
+                for (stage, media_type), (_, total, count) in entry['samples']:
+                    item = totals.setdefault(f'{stage}/{media_type}', [0.0, 0])
+                    item[0] += total
+                    item[1] += count
+    else:
+        for (stage, media_type), histogram in get_metrics().stage_seconds.items():
+            totals[f'{stage}/{media_type}'] = [histogram.sum, histogram.count]
+    stages = {
+        name: {'count': count, 'mean_ms': round(total / count * 1000, 2) if count else 0.0}
+        for name, (total, count) in totals.items()
+    }
+
+    latencies = stats['latencies']
+    # Для накопленных постов время считается от запуска бота, а не от их появления
+    first = started if args.backlog else stats['first_available'] or time.time()
+    elapsed = (stats['last_done'] or time.time()) - first
+    return {
+        'messages': args.messages,
+        'relayed': stats['done'],
+        'mix': args.mix,
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_s': round(stats['done'] / elapsed, 2) if elapsed > 0 else 0.0,
+        'latency_ms': {
+            name: round(percentile(latencies, percent) * 1000, 1)
+            for name, percent in (('p50', 50), ('p95', 95), ('p99', 99))
+        },
+        # ru_maxrss в Linux в килобайтах; процессы пула очистки и воркеры не учитываются
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'bytes_downloaded': stats['bytes_downloaded'],
+        'bytes_uploaded': stats['bytes_uploaded'],
+        'requests': stats['requests'],
+        'webhook': {
+            'delivered': stats['webhook_delivered'],
+            'errors': stats['webhook_errors'],
+            'forged_status': stats['webhook_forged_status']
+        } if args.webhook else None,
+        'stages': stages
+    }
+
+
+def print_report(report: dict) -> None:
+    latency = report['latency_ms']
+    print(f"Relayed:      {report['relayed']}/{report['messages']} posts in {report['elapsed_s']}s")
+    print(f"Throughput:   {report['messages_per_s']} msg/s")
+    print(f"Latency:      p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms")
+    print(f"Peak RSS:     {report['peak_rss_mb']} MB")
+    print(f"Traffic:      {report['bytes_downloaded'] / 1048576:.1f} MB down, {report['bytes_uploaded'] / 1048576:.1f} MB up")
+    print(f"API requests: {', '.join(f'{method}={count}' for method, count in sorted(report['requests'].items()))}")
+    if report['webhook']:
+        webhook = report['webhook']
+        print(f"Webhook:      {webhook['delivered']} updates delivered, {webhook['errors']} failed deliveries, "
+              f"forged secret -> HTTP {webhook['forged_status']}")
+    for name, stage in sorted(report['stages'].items()):
+        print(f"  {name:<24} {stage['count']:>6} x {stage['mean_ms']:>9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end relay benchmark against a fake Bot API')
+    parser.add_argument('--messages', type=int, default=300, help='number of channel posts')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('text=40,photo=30,album=20,video=10'),
+                        help='post mix, e.g. text=40,photo=30,album=20,video=10')
+    parser.add_argument('--rate', type=float, default=0.0, help='posts per second (0 - all at once)')
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='Bot API response delay')
+    parser.add_argument('--download-mbps', type=float, default=0.0, help='MB/s per download (0 - unlimited)')
+    parser.add_argument('--upload-mbps', type=float, default=0.0, help='MB/s per upload (0 - unlimited)')
+    parser.add_argument('--photo-kb', type=int, default=200)
+    parser.add_argument('--video-kb', type=int, default=2048)
+    parser.add_argument('--album-size', type=int, default=3)
+    parser.add_argument('--flood-control', action='store_true', help='keep Telegram rate limits enabled')
+    parser.add_argument('--backlog', action='store_true',
+                        help='queue all posts before the bot starts to measure catch-up after downtime')
+    parser.add_argument('--local', action='store_true',
+                        help='emulate a local Bot API server: files are read from disk instead of downloaded')
+    parser.add_argument('--webhook', action='store_true',
+                        help='receive updates via webhook pushed by the fake Bot API instead of polling')
+    parser.add_argument('--sources', type=int, default=1, help='number of source channels')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes; source channels are sharded between them')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra bot setting, e.g. --env RELAY_WORKERS=8')
+    parser.add_argument('--timeout', type=float, default=300.0, help='seconds to wait for all posts')
+    parser.add_argument('--log-level', default='WARNING')
+    parser.add_argument('--json', help='write the report to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=args.log_level.upper())
+
+    work_dir = Path(tempfile.mkdtemp(prefix='relay_benchmark_'))
+    port = free_port()
+    server_url = f'http://127.0.0.1:{port}'
+    command = [
+        sys.executable, str(BENCHMARKS_DIR / 'fake_bot_api.py'),
+        '--port', str(port), '--token', TOKEN, '--source-chat-id', str(SOURCE_CHAT_ID),
+        '--latency-ms', str(args.latency_ms),
+        '--download-mbps', str(args.download_mbps), '--upload-mbps', str(args.upload_mbps),
+        '--photo-kb', str(args.photo_kb), '--video-kb', str(args.video_kb), '--album-size', str(args.album_size),
+        '--sources', str(args.sources)
+    ]
+    if args.local:
+        # Как у telegram-bot-api --local: файлы лежат на общем с ботом диске
+        command += ['--local-dir', str(work_dir / 'bot_api_files')]
+    server = subprocess.Popen(command)
+
+    cwd = os.getcwd()
+    try:
+        configure_environment(args, work_dir, server_url)
+        # bot_stats.json и временные файлы бота остаются в рабочей директории бенчмарка
+        os.chdir(work_dir)
+        report = asyncio.run(run_benchmark(args, server_url))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if report['webhook'] and not args.backlog and not report['webhook']['delivered']:
+        # С --backlog посты забирает догоняющий getUpdates, без него их должен доставить webhook
+        sys.exit('Webhook mode delivered no updates')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from telegram import Bot, File, Message
+
+from album_aggregator import AlbumAggregator
+from relay_pipeline import RelayJob, RelayPipeline
+
+logger = logging.getLogger(__name__)
+
+# Секунд между сообщениями о ходе догоняющей обработки
+PROGRESS_INTERVAL = 10.0
+# Секунд между проверками завершения догоняемых постов
+CHECK_INTERVAL = 0.5
+# Максимальный размер пачки getUpdates
+MAX_BATCH_SIZE = 100
+
+
+def _format_duration(seconds: float) -> str:
+    """Форматирует длительность: 1h02m, 3m15s, 42s"""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds}s"
+
+
+class FilePrefetcher:
+    """
+    Заранее запрашивает get_file для медиа из пачки обновлений
+
+    Результаты хранятся до первого обращения; ошибка предварительного
+    запроса не передается вызывающему коду - файл запрашивается заново.
+    """
+
+    def __init__(self, concurrency: int = 16):
+        self._semaphore = asyncio.Semaphore(max(1, concurrency))
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def prefetch(self, bot: Bot, file_ids: List[str]) -> None:
+        """Запускает get_file для файлов, которые еще не запрошены"""
+        for file_id in file_ids:
+            if file_id not in self._tasks:
+                self._tasks[file_id] = asyncio.create_task(self._fetch(bot, file_id))
+
+    async def _fetch(self, bot: Bot, file_id: str) -> Optional[File]:
+        async with self._semaphore:
+            try:
+                return await bot.get_file(file_id)
+            except Exception as e:
+                logger.debug("Prefetching file %s failed: %s", file_id, e)
+                return None
+
+    async def get_file(self, bot: Bot, file_id: str) -> File:
+        """Возвращает заранее полученный File или запрашивает его"""
+        task = self._tasks.pop(file_id, None)
+        if task is not None:
+            file = await task
+            if file is not None:
+                return file
+        return await bot.get_file(file_id)
+
+    def clear(self) -> None:
+        """Отменяет и забывает невостребованные запросы"""
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks.clear()
+
+
+class BacklogCatchUp:
+    """
+    Догоняющая обработка обновлений, накопившихся за время простоя
+
+    До запуска polling или webhook обновления забираются пачками getUpdates.
+    Каждая пачка фиксируется в журнале одной транзакцией, get_file для ее медиа
+    запрашивается параллельно, а подготовка постов идет с повышенным числом
+    воркеров конвейера, но не дальше prefetch постов от публикации.
+    Публикация остается упорядоченной и ограничена только лимитами отправки.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        pipeline: RelayPipeline,
+        albums: AlbumAggregator,
+        accept: Callable[[List[Message]], Awaitable[List[Message]]],
+        enqueue: Callable[[Message], Awaitable[Optional[RelayJob]]],
+        media_file_ids: Callable[[Message], List[str]],
+        prefetcher: FilePrefetcher,
+        batch_size: int = 100,
+        prefetch: int = 16,
+    ):
+        """
+        Args:
+            bot: Бот для getUpdates
+            pipeline: Конвейер ретрансляции
+            albums: Сборщик альбомов, в который enqueue добавляет элементы
+            accept: Отбирает сообщения маршрутов и фиксирует их в журнале
+            enqueue: Ставит сообщение в конвейер (None - элемент уже поставленного альбома)
+            media_file_ids: file_id медиа сообщения, которые придется скачивать
+            prefetcher: Общий с подготовкой медиа кэш get_file
+            batch_size: Обновлений в одном запросе getUpdates (до 100)
+            prefetch: Постов, готовящихся одновременно впереди публикации
+        """
+        self.bot = bot
+        self.pipeline = pipeline
+        self.albums = albums
+        self.accept = accept
+        self.enqueue = enqueue
+        self.media_file_ids = media_file_ids
+        self.prefetcher = prefetcher
+        self.batch_size = min(max(1, batch_size), MAX_BATCH_SIZE)
+        self.prefetch = max(1, prefetch)
+
+        self.pending = 0
+        self.fetched = 0
+        # Обновлений, сообщения которых уже поставлены в конвейер или отброшены
+        self.processed = 0
+        self.jobs: List[RelayJob] = []
+        self.fetching = False
+        self._started = 0.0
+        self._workers = pipeline.workers_count
+        self._reporter: Optional[asyncio.Task] = None
+
+    @property
+    def published(self) -> int:
+        """Завершенных постов из догоняемых"""
+        return sum(1 for job in self.jobs if job.done)
+
+    async def run(self, stop_event: asyncio.Event) -> None:
+        """
+        Забирает и ставит в конвейер все накопившиеся обновления
+
+        Возвращается, когда очередь обновлений Telegram пуста и прием
+        обновлений можно запускать; публикация продолжается в фоне.
+        """
+        info = await self.bot.get_webhook_info()
+        if info.url:
+            # getUpdates недоступен, пока установлен webhook; накопленные обновления сохраняются
+            await self.bot.delete_webhook(drop_pending_updates=False)
+        self.pending = info.pending_update_count
+        if not self.pending:
+            logger.info("No pending updates, catch-up skipped")
+            return
+
+        logger.info(f"Catching up on {self.pending} pending updates")
+        self._started = time.monotonic()
+        self.fetching = True
+        self.pipeline.resize(max(self._workers, self.prefetch))
+        self._reporter = asyncio.create_task(self._report_loop(), name="catch-up-progress")
+
+        offset = None
+        drained = False
+        # Незакрытый альбом каждого канала: ID канала -> media_group_id
+        open_albums: Dict[int, str] = {}
+        try:
+            while not stop_event.is_set():
+                updates = await self.bot.get_updates(offset=offset, limit=self.batch_size, timeout=0)
+                if not updates:
+                    drained = True
+                    break
+                offset = updates[-1].update_id + 1
+                self.fetched += len(updates)
+
+                messages = [update.message or update.channel_post for update in updates]
+                accepted = await self.accept([message for message in messages if message])
+                self.prefetcher.prefetch(
+                    self.bot, [file_id for message in accepted for file_id in self.media_file_ids(message)]
+                )
+                logger.debug("Catch-up batch: %s updates, %s messages accepted", len(updates), len(accepted))
+
+                accepted_ids = {(message.chat_id, message.message_id) for message in accepted}
+                for message in messages:
+                    self.processed += 1
+                    if not message or (message.chat_id, message.message_id) not in accepted_ids:
+                        continue
+                    open_album = open_albums.get(message.chat_id)
+                    if open_album is None or open_album != message.media_group_id:
+                        if open_album is not None:
+                            # Накопленные обновления канала идут подряд: следующее сообщение
+                            # завершает альбом без ожидания ALBUM_WINDOW
+                            self.albums.close(message.chat_id, open_albums.pop(message.chat_id))
+                        # Элементы начатого альбома не ждут: иначе альбом закрылся бы по таймеру неполным
+                        await self.pipeline.wait_in_flight_below(self.prefetch)
+                    if message.media_group_id:
+                        open_albums[message.chat_id] = message.media_group_id
+                    job = await self.enqueue(message)
+                    if job is not None:
+                        self.jobs.append(job)
+        finally:
+            self.fetching = False
+            if drained:
+                for chat_id, media_group_id in open_albums.items():
+                    self.albums.close(chat_id, media_group_id)
+            if offset is not None and not drained:
+                # Подтверждаем принятые пачки: они уже в журнале и не должны прийти повторно
+                try:
+                    await self.bot.get_updates(offset=offset, limit=1, timeout=0)
+                except Exception as e:
+                    logger.warning(f"Cannot confirm caught-up updates: {e}")
+
+        logger.info(
+            f"Catch-up fetched {self.fetched} updates ({len(self.jobs)} posts) in "
+            f"{_format_duration(time.monotonic() - self._started)}, publishing continues in background"
+        )
+
+    async def _report_loop(self) -> None:
+        """Сообщает о ходе обработки и завершает ее, когда опубликованы все догоняемые посты"""
+        next_report = time.monotonic() + PROGRESS_INTERVAL
+        while self.fetching or self.published < len(self.jobs):
+            await asyncio.sleep(CHECK_INTERVAL)
+            if time.monotonic() >= next_report:
+                self._log_progress()
+                next_report += PROGRESS_INTERVAL
+
+        self._restore()
+        self._log_finished()
+
+    def _log_progress(self) -> None:
+        elapsed = time.monotonic() - self._started
+        published = self.published
+        rate = published / elapsed if elapsed > 0 else 0.0
+
+        # Оставшиеся посты: в конвейере плюс еще не обработанные обновления в той же пропорции
+        remaining = len(self.jobs) - published
+        if self.processed:
+            remaining += max(0, self.pending - self.processed) * len(self.jobs) / self.processed
+        eta = _format_duration(remaining / rate) if rate else "unknown"
+
+        logger.info(
+            f"Catch-up: {self.processed}/{self.pending} updates processed, {published}/{len(self.jobs)} posts published, "
+            f"{rate:.1f} posts/s, ETA {eta}"
+        )
+
+    def _log_finished(self) -> None:
+        elapsed = time.monotonic() - self._started
+        logger.info(
+            f"Catch-up finished: {len(self.jobs)} posts in {_format_duration(elapsed)}"
+            f" ({len(self.jobs) / elapsed if elapsed > 0 else 0.0:.1f} posts/s)"
+        )
+
+    def _restore(self) -> None:
+        """Возвращает конвейеру обычное число воркеров и забывает лишние get_file"""
+        self.pipeline.resize(self._workers)
+        self.prefetcher.clear()
+
+    async def stop(self) -> None:
+        """Прекращает отслеживание хода обработки; вызывается до остановки конвейера"""
+        if self._reporter is None:
+            return
+        if not self._reporter.done():
+            self._reporter.cancel()
+            await asyncio.gather(self._reporter, return_exceptions=True)
+            self._restore()
+            if self.fetching or self.published < len(self.jobs):
+                logger.info(f"Catch-up interrupted: {self.published}/{len(self.jobs)} posts published")
+            else:
+                self._log_finished()
+        self._reporter = None
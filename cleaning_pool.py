@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from logging.handlers import QueueListener
+from typing import Any, Callable, Optional, Set, Tuple
+
+from logging_setup import configure_child_logging, forward_child_logs
+from metadata_cleaner import MetadataCleaner
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз повторять задачу, потерянную при пересоздании пула из-за чужой задачи
+RESUBMIT_LIMIT = 2
+
+
+class CleaningExecutor:
+    """Пул для очистки метаданных вне цикла событий"""
+
+    def __init__(self, kind: str = 'process', workers: int = 0, timeout: float = 60.0):
+        """
+        Args:
+            kind: 'process' (ProcessPoolExecutor) или 'thread' (ThreadPoolExecutor)
+            workers: Количество воркеров (0 - по числу ядер)
+            timeout: Максимальное время одной задачи в секундах (0 - без ограничения)
+        """
+        if kind not in ('process', 'thread'):
+            raise ValueError(f"Unknown cleaner executor type: {kind}")
+
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.timeout = timeout or None
+        self._executor: Optional[Executor] = None
+        # Задач в пуле не больше, чем воркеров: каждая сразу начинает выполняться,
+        # поэтому timeout отсчитывает время работы, а не ожидание в очереди пула
+        self._slots = asyncio.Semaphore(self.workers)
+        # Номер текущего пула: по нему задача узнает, что пул пересоздан без ее участия
+        self._generation = 0
+        # Записи процессов пула передаются через эту очередь в логирование родителя
+        self._log_queue: Optional[multiprocessing.Queue] = None
+        self._log_listener: Optional[QueueListener] = None
+
+    def _create_executor(self) -> Executor:
+        """Создает пул нужного типа"""
+        if self.kind == 'process':
+            if self._log_queue is None:
+                self._log_queue = multiprocessing.Queue()
+                self._log_listener = forward_child_logs(self._log_queue)
+            return ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=configure_child_logging,
+                initargs=(self._log_queue, logging.getLogger().level)
+            )
+        return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='cleaner')
+
+    @property
+    def executor(self) -> Executor:
+        """Возвращает пул, создавая его при первом обращении"""
+        if self._executor is None:
+            self._executor = self._create_executor()
+            logger.info(f"Metadata cleaner pool started: {self.kind}, {self.workers} workers")
+        return self._executor
+
+    async def run(self, func: Callable, *args: Any) -> Any:
+        """
+        Выполняет функцию в пуле с ограничением по времени
+
+        Задачи, прерванные пересозданием пула из-за чужого таймаута, выполняются заново.
+
+        Raises:
+            asyncio.TimeoutError: если задача не уложилась в timeout
+            RuntimeError: если пул сломался во время выполнения задачи
+        """
+        loop = asyncio.get_running_loop()
+        async with self._slots:
+            for attempt in range(RESUBMIT_LIMIT + 1):
+                generation = self._generation
+                future = loop.run_in_executor(self.executor, func, *args)
+                try:
+                    return await asyncio.wait_for(future, self.timeout)
+                except asyncio.TimeoutError:
+                    # Зависший процесс нельзя прервать по отдельности, поэтому пул пересоздается
+                    logger.error(f"Metadata cleaning timed out after {self.timeout}s, restarting pool")
+                    self._restart()
+                    raise
+                except (asyncio.CancelledError, BrokenExecutor) as e:
+                    if isinstance(e, asyncio.CancelledError) and asyncio.current_task().cancelling():
+                        # Отменена сама вызывающая задача
+                        raise
+                    if generation == self._generation:
+                        if isinstance(e, asyncio.CancelledError):
+                            raise RuntimeError("Metadata cleaning task was cancelled") from None
+                        # Процесс пула завершился аварийно: без замены пул не примет новые задачи
+                        logger.error(f"Metadata cleaner pool is broken, restarting it: {e}")
+                        self._restart()
+                    if attempt < RESUBMIT_LIMIT:
+                        logger.warning("Metadata cleaning interrupted by a pool restart, resubmitting")
+            raise RuntimeError("Metadata cleaning interrupted by repeated pool restarts")
+
+    async def clean_file(self, file_path: str, output_path: str) -> Tuple[str, Optional[Set[str]]]:
+        """
+        Проверяет файл и при наличии метаданных очищает его в пуле
+
+        Returns:
+            Путь к файлу для отправки и найденные классы метаданных
+        """
+        return await self.run(MetadataCleaner.clean_file_metadata_if_needed, file_path, output_path)
+
+    async def clean_bytes(self, data: bytes) -> Tuple[bytes, Optional[Set[str]]]:
+        """
+        Проверяет и очищает файл, находящийся в памяти
+
+        Returns:
+            Байты для отправки и найденные классы метаданных
+        """
+        return await self.run(MetadataCleaner.clean_bytes_metadata_if_needed, data)
+
+    def _restart(self) -> None:
+        """Отменяет ожидающие задачи и заменяет пул новым"""
+        executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        self._generation += 1
+
+        if isinstance(executor, ProcessPoolExecutor):
+            # Завершаем зависшие процессы, иначе они продолжат занимать ядра
+            for process in list(getattr(executor, '_processes', {}).values()):
+                process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Останавливает пул, отменяя еще не начатые задачи"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+        if self._log_listener is not None:
+            # Дописываем записи, отправленные процессами пула до остановки
+            self._log_listener.stop()
+            self._log_listener = None
+            self._log_queue = None
@@ -1,4 +1,6 @@
 import os
+import re
+from typing import Dict, List
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,6 +13,22 @@ class Config:
     SOURCE_CHANNEL_ID = os.getenv('SOURCE_CHANNEL_ID')  # Закрытый канал
     TARGET_CHANNEL_ID = os.getenv('TARGET_CHANNEL_ID')  # Публичный канал
     
+    # Routing table: "source:target1,target2;source2:target3" (если пусто - SOURCE_CHANNEL_ID -> TARGET_CHANNEL_ID)
+    ROUTES = os.getenv('ROUTES', '')
+    
+    # Update Mode: polling или webhook
+    UPDATE_MODE = os.getenv('UPDATE_MODE', 'polling').lower()
+    WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # Публичный адрес, например https://bot.example.com
+    WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+    WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+    WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+    WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')  # Секретный токен (A-Z, a-z, 0-9, _ и -)
+    
+    # Bot API Server: свой сервер telegram-bot-api вместо api.telegram.org (пусто - публичный API)
+    BOT_API_BASE_URL = os.getenv('BOT_API_BASE_URL', '')  # Например http://localhost:8081/bot
+    BOT_API_FILE_URL = os.getenv('BOT_API_FILE_URL', '')  # Пусто - выводится из BOT_API_BASE_URL
+    BOT_API_LOCAL_MODE = os.getenv('BOT_API_LOCAL_MODE', 'false').lower() == 'true'  # Сервер запущен с --local
+    
     # Proxy Configuration (optional for testing)
     PROXY_URL = os.getenv('PROXY_URL')  # SOCKS5 proxy URL (optional)
     PROXY_USERNAME = os.getenv('PROXY_USERNAME', '')
@@ -20,17 +38,139 @@ class Config:
     ENABLE_METADATA_CLEANING = os.getenv('ENABLE_METADATA_CLEANING', 'true').lower() == 'true'
     LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
     
+    # Logging Settings
+    LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()  # text или json
+    LOG_FILE = os.getenv('LOG_FILE', 'bot.log')  # Пусто - только stdout
+    LOG_SAMPLE_RATE = float(os.getenv('LOG_SAMPLE_RATE', '1.0'))  # Доля сохраняемых DEBUG-записей
+    
     # File Settings
     TEMP_DIR = os.getenv('TEMP_DIR', './temp')
     MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', '50')) * 1024 * 1024  # 50MB default
     
+    # Image Profile Settings: фото уменьшаются и перекодируются перед загрузкой
+    IMAGE_MAX_EDGE = int(os.getenv('IMAGE_MAX_EDGE', '2560'))  # Длинная сторона в пикселях (0 - отправлять как есть)
+    IMAGE_FORMAT = os.getenv('IMAGE_FORMAT', 'jpeg').lower()  # jpeg или webp
+    IMAGE_QUALITY = int(os.getenv('IMAGE_QUALITY', '87'))
+    IMAGE_TARGET_SIZE = int(os.getenv('IMAGE_TARGET_SIZE', '0')) * 1024  # KB (0 - без ограничения)
+    IMAGE_MIN_QUALITY = int(os.getenv('IMAGE_MIN_QUALITY', '60'))  # Нижняя граница качества при подборе под размер
+    IMAGE_DOCUMENTS = os.getenv('IMAGE_DOCUMENTS', 'false').lower() == 'true'  # Перекодировать и JPEG, отправленные файлом
+    
+    # Statistics Settings
+    STATS_FILE = os.getenv('STATS_FILE', 'bot_stats.json')  # Файл статистики монитора
+    STATS_FLUSH_INTERVAL = float(os.getenv('STATS_FLUSH_INTERVAL', '30'))  # Секунд между сохранениями bot_stats.json
+    
+    # Metrics Settings
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # Порт /metrics в формате Prometheus (0 - отключено)
+    METRICS_LISTEN = os.getenv('METRICS_LISTEN', '127.0.0.1')
+    
+    # Relay Pipeline Settings
+    RELAY_WORKERS = int(os.getenv('RELAY_WORKERS', '4'))  # Параллельная подготовка сообщений
+    RELAY_QUEUE_SIZE = int(os.getenv('RELAY_QUEUE_SIZE', '100'))  # Сообщений от приема до публикации
+    
+    # Metadata Cleaner Pool Settings
+    CLEANER_EXECUTOR = os.getenv('CLEANER_EXECUTOR', 'process').lower()  # process или thread
+    CLEANER_WORKERS = int(os.getenv('CLEANER_WORKERS', '0'))  # 0 - по числу ядер
+    CLEANER_TIMEOUT = float(os.getenv('CLEANER_TIMEOUT', '60'))  # Секунд на один файл
+    
+    # Journal Settings
+    JOURNAL_PATH = os.getenv('JOURNAL_PATH', 'relay_journal.db')  # Пусто - журнал отключен
+    JOURNAL_FLUSH_INTERVAL = float(os.getenv('JOURNAL_FLUSH_INTERVAL', '0.05'))  # Секунд между фиксациями пачек
+    SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '30'))  # Секунд на дообработку при остановке
+    
+    # Catch-Up Settings
+    CATCHUP_ENABLED = os.getenv('CATCHUP_ENABLED', 'true').lower() == 'true'  # Догонять накопившиеся обновления при запуске
+    CATCHUP_BATCH = int(os.getenv('CATCHUP_BATCH', '100'))  # Обновлений в одном getUpdates (до 100)
+    CATCHUP_PREFETCH = int(os.getenv('CATCHUP_PREFETCH', '16'))  # Постов, готовящихся впереди публикации
+    
+    # Worker Process Settings
+    WORKERS = int(os.getenv('WORKERS', '1'))  # Процессов-воркеров (1 - все в одном процессе)
+    WORKER_HEARTBEAT_TIMEOUT = float(os.getenv('WORKER_HEARTBEAT_TIMEOUT', '30'))  # Секунд без heartbeat до перезапуска воркера
+    
+    # Album Settings
+    ALBUM_WINDOW = float(os.getenv('ALBUM_WINDOW', '1.0'))  # Секунд ожидания следующего элемента альбома
+    
+    # In-Memory Processing Settings
+    MEMORY_SPILL_THRESHOLD = int(os.getenv('MEMORY_SPILL_THRESHOLD', '5')) * 1024 * 1024  # Файлы больше - через диск (0 - всегда диск)
+    MEMORY_BUDGET = int(os.getenv('MEMORY_BUDGET', '64')) * 1024 * 1024  # Всего MB файлов в памяти одновременно
+    
+    # Flood Control Settings
+    FLOOD_GLOBAL_RATE = float(os.getenv('FLOOD_GLOBAL_RATE', '30'))  # Сообщений в секунду на бота
+    FLOOD_CHAT_RATE = float(os.getenv('FLOOD_CHAT_RATE', '20'))  # Сообщений в минуту в один канал
+    FLOOD_MAX_RETRIES = int(os.getenv('FLOOD_MAX_RETRIES', '5'))  # Повторов после RetryAfter
+    
+    # Bandwidth Settings
+    DOWNLOAD_BUDGET_PER_MINUTE = int(os.getenv('DOWNLOAD_BUDGET_PER_MINUTE', '0')) * 1024 * 1024  # MB в минуту (0 - без ограничения)
+    UPLOAD_BUDGET_PER_MINUTE = int(os.getenv('UPLOAD_BUDGET_PER_MINUTE', '0')) * 1024 * 1024  # MB в минуту (0 - без ограничения)
+    
+    # Deduplication Settings
+    DEDUP_WINDOW = float(os.getenv('DEDUP_WINDOW', '0')) * 3600  # Часов, в течение которых повтор отбрасывается (0 - отключено)
+    DEDUP_INDEX_SIZE = int(os.getenv('DEDUP_INDEX_SIZE', '10000'))  # Ключей в памяти
+    DEDUP_DB = os.getenv('DEDUP_DB', '')  # Путь к SQLite (пусто - только память)
+    DEDUP_PERCEPTUAL = os.getenv('DEDUP_PERCEPTUAL', 'false').lower() == 'true'  # Сравнивать фото по dHash (может совпасть у похожих фото)
+    DEDUP_TEXT = os.getenv('DEDUP_TEXT', 'true').lower() == 'true'  # Учитывать нормализованный текст
+    
+    # Upload Cache Settings
+    UPLOAD_CACHE_SIZE = int(os.getenv('UPLOAD_CACHE_SIZE', '1024'))  # Записей в памяти
+    UPLOAD_CACHE_DB = os.getenv('UPLOAD_CACHE_DB', '')  # Путь к SQLite (пусто - только память)
+    
+    @classmethod
+    def get_routes(cls) -> Dict[int, List[int]]:
+        """
+        Возвращает таблицу маршрутов: ID исходного канала -> ID целевых каналов
+        
+        Raises:
+            ValueError: если ROUTES или ID каналов заданы неверно
+        """
+        if not cls.ROUTES.strip():
+            return {int(cls.SOURCE_CHANNEL_ID): [int(cls.TARGET_CHANNEL_ID)]}
+        
+        routes: Dict[int, List[int]] = {}
+        for route in cls.ROUTES.split(';'):
+            if not route.strip():
+                continue
+            source, separator, targets = route.partition(':')
+            target_ids = [int(target) for target in targets.split(',') if target.strip()]
+            if not separator or not target_ids:
+                raise ValueError(f"Invalid route (expected source:target1,target2): {route.strip()}")
+            
+            # Повторяющиеся цели одного источника получают сообщение один раз
+            route_targets = routes.setdefault(int(source), [])
+            route_targets.extend(target for target in target_ids if target not in route_targets)
+        
+        if not routes:
+            raise ValueError("ROUTES does not contain any route")
+        return routes
+    
     @classmethod
     def validate(cls):
         """Validate required configuration"""
-        required_vars = ['BOT_TOKEN', 'SOURCE_CHANNEL_ID', 'TARGET_CHANNEL_ID']
+        required_vars = ['BOT_TOKEN'] if cls.ROUTES.strip() else ['BOT_TOKEN', 'SOURCE_CHANNEL_ID', 'TARGET_CHANNEL_ID']
         missing = [var for var in required_vars if not getattr(cls, var)]
         
         if missing:
             raise ValueError(f"Missing required environment variables: {', '.join(missing)}")
         
+        try:
+            cls.get_routes()
+        except ValueError as e:
+            raise ValueError(f"Invalid channel routing: {e}")
+        
+        if cls.BOT_API_LOCAL_MODE and not cls.BOT_API_BASE_URL:
+            raise ValueError("BOT_API_LOCAL_MODE requires BOT_API_BASE_URL of a self-hosted Bot API server")
+        
+        if cls.IMAGE_FORMAT not in ('jpeg', 'webp'):
+            raise ValueError(f"Unknown IMAGE_FORMAT: {cls.IMAGE_FORMAT}")
+        
+        if cls.LOG_FORMAT not in ('text', 'json'):
+            raise ValueError(f"Unknown LOG_FORMAT: {cls.LOG_FORMAT}")
+        
+        if cls.UPDATE_MODE not in ('polling', 'webhook'):
+            raise ValueError(f"Unknown UPDATE_MODE: {cls.UPDATE_MODE}")
+        if cls.UPDATE_MODE == 'webhook':
+            missing = [var for var in ('WEBHOOK_URL', 'WEBHOOK_SECRET') if not getattr(cls, var)]
+            if missing:
+                raise ValueError(f"Missing required environment variables for webhook mode: {', '.join(missing)}")
+            if not re.fullmatch(r'[A-Za-z0-9_-]{1,256}', cls.WEBHOOK_SECRET):
+                raise ValueError("WEBHOOK_SECRET must be 1-256 characters: A-Z, a-z, 0-9, _ and -")
+        
         return True
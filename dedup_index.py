@@ -0,0 +1,243 @@
+import asyncio
+import hashlib
+import io
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+# Размер файла, читаемого при хешировании за один раз
+READ_CHUNK_SIZE = 1024 * 1024
+# Сторона уменьшенного изображения для разностного хеша (dHash): (N + 1) x N пикселей
+DHASH_SIZE = 8
+# Минимальное расстояние Хэмминга dHash от хешей однотонного изображения (все нули или все единицы):
+# хеши ближе к ним у однотонной графики и простых скриншотов совпадают у разных картинок
+MIN_DHASH_DISTANCE = 10
+# Через сколько новых записей удалять из базы записи старше окна
+PRUNE_EVERY = 1000
+
+_NON_WORD = re.compile(r'[\W_]+')
+
+
+def content_key(source: Union[bytes, str]) -> str:
+    """Ключ SHA-256 очищенного содержимого (байты или путь к файлу)"""
+    digest = hashlib.sha256()
+    if isinstance(source, bytes):
+        digest.update(source)
+    else:
+        with open(source, 'rb') as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+                digest.update(chunk)
+    return f"sha256:{digest.hexdigest()}"
+
+
+def perceptual_key(source: Union[bytes, str]) -> Optional[str]:
+    """
+    Ключ разностного хеша изображения (dHash)
+
+    Не меняется при перекодировании, изменении размера и небольших
+    правках яркости, поэтому находит повторно загруженные копии фото.
+
+    Returns:
+        Ключ или None, если изображение не удалось декодировать или в нем
+        слишком мало перепадов яркости, чтобы отличать его от других
+    """
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+            # JPEG декодируется сразу в уменьшенном размере и в оттенках серого
+            img.draft('L', (DHASH_SIZE * 8, DHASH_SIZE * 8))
+            pixels = list(img.convert('L').resize((DHASH_SIZE + 1, DHASH_SIZE), Image.LANCZOS).getdata())
+    except Exception as e:
+        logger.debug("Cannot compute perceptual hash: %s", e)
+        return None
+
+    value = 0
+    for row in range(DHASH_SIZE):
+        for column in range(DHASH_SIZE):
+            left = pixels[row * (DHASH_SIZE + 1) + column]
+            value = (value << 1) | (left > pixels[row * (DHASH_SIZE + 1) + column + 1])
+
+    bits = bin(value).count('1')
+    if min(bits, DHASH_SIZE * DHASH_SIZE - bits) < MIN_DHASH_DISTANCE:
+        return None
+    return f"dhash:{value:016x}"
+
+
+def text_key(text: str) -> Optional[str]:
+    """
+    Ключ нормализованного текста: регистр, пунктуация и пробелы не учитываются
+
+    Returns:
+        Ключ или None для текста без букв и цифр
+    """
+    normalized = _NON_WORD.sub(' ', unicodedata.normalize('NFKC', text).casefold()).strip()
+    if not normalized:
+        return None
+    return f"text:{hashlib.sha256(normalized.encode('utf-8')).hexdigest()}"
+
+
+def file_key(file_unique_id: str) -> str:
+    """Ключ исходного файла Telegram (для медиа, отправляемых без скачивания)"""
+    return f"file:{file_unique_id}"
+
+
+class DedupIndex:
+    """
+    Индекс уже опубликованного содержимого для отбрасывания дубликатов
+
+    Пост описывается частями (медиафайлы и текст); у каждой части может
+    быть несколько ключей (file_unique_id, хеш содержимого, dHash), и часть
+    считается повтором, если совпал любой из них. Ключи живут window секунд
+    и действуют в пределах scope (набора целевых каналов): одно и то же
+    содержимое из разных маршрутов не считается повтором.
+    В памяти хранится ограниченное число ключей (LRU), опционально - в SQLite
+    между перезапусками. Запросы к SQLite выполняются в отдельном потоке,
+    а новые ключи записываются в базу пачками в фоне.
+    """
+
+    def __init__(self, window: float, capacity: int = 10000, db_path: Optional[str] = None):
+        """
+        Args:
+            window: Сколько секунд опубликованное содержимое считается недавним (0 - индекс отключен)
+            capacity: Ключей в памяти
+            db_path: Путь к SQLite (None - только память)
+        """
+        self.window = max(0.0, window)
+        self.capacity = max(1, capacity)
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        self._added_since_prune = 0
+        self.duplicates = 0
+        # Ключи, еще не записанные в базу, и фоновая задача записи
+        self._pending: List[Tuple[str, float]] = []
+        self._writer: Optional[asyncio.Task] = None
+
+        self._db: Optional[sqlite3.Connection] = None
+        # Соединение используется из потоков asyncio.to_thread
+        self._db_lock = threading.Lock()
+        if db_path and self.enabled:
+            self._db = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS dedup_index (key TEXT PRIMARY KEY, seen_at REAL NOT NULL)"
+            )
+            self._prune()
+
+    @property
+    def enabled(self) -> bool:
+        """Индекс включен"""
+        return self.window > 0
+
+    @staticmethod
+    def _scoped(scope: str, keys: List[str]) -> List[str]:
+        return [f"{scope}|{key}" for key in keys]
+
+    async def is_duplicate(self, parts: List[List[str]], scope: str = '') -> bool:
+        """Проверяет, что каждая часть поста уже публиковалась в пределах окна и scope"""
+        if not self.enabled or not parts:
+            return False
+        parts = [self._scoped(scope, keys) for keys in parts]
+        threshold = time.time() - self.window
+        missing = [key for keys in parts for key in keys if not self._seen(key, threshold)]
+        if missing and self._db is not None:
+            try:
+                found = await asyncio.to_thread(self._load, missing, threshold)
+            except sqlite3.Error as e:
+                logger.error(f"Error reading dedup index: {e}")
+                found = {}
+            for key, seen_at in found.items():
+                self._remember(key, seen_at)
+
+        if all(any(self._seen(key, threshold) for key in keys) for keys in parts):
+            self.duplicates += 1
+            return True
+        return False
+
+    def remember(self, parts: List[List[str]], scope: str = '') -> None:
+        """Запоминает ключи опубликованного поста; в базу они записываются в фоне"""
+        if not self.enabled:
+            return
+        now = time.time()
+        keys = [key for part in parts for key in self._scoped(scope, part)]
+        for key in keys:
+            self._remember(key, now)
+
+        if self._db is not None and keys:
+            self._pending.extend((key, now) for key in keys)
+            if self._writer is None or self._writer.done():
+                self._writer = asyncio.create_task(self._write_pending(), name="dedup-index-writer")
+
+    def _seen(self, key: str, threshold: float) -> bool:
+        """Ключ есть в памяти и встречался не раньше threshold"""
+        seen_at = self._entries.get(key)
+        if seen_at is None:
+            return False
+        if seen_at >= threshold:
+            self._entries.move_to_end(key)
+            return True
+        del self._entries[key]
+        return False
+
+    def _load(self, keys: List[str], threshold: float) -> Dict[str, float]:
+        """Читает из базы недавние ключи (выполняется в отдельном потоке)"""
+        placeholders = ', '.join('?' * len(keys))
+        with self._db_lock:
+            rows = self._db.execute(
+                f"SELECT key, seen_at FROM dedup_index WHERE key IN ({placeholders}) AND seen_at >= ?",
+                (*keys, threshold)
+            ).fetchall()
+        return dict(rows)
+
+    async def _write_pending(self) -> None:
+        """Записывает накопленные ключи, пока они появляются"""
+        while self._pending and self._db is not None:
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._write_batch, batch)
+            except sqlite3.Error as e:
+                logger.error(f"Error saving dedup index entries: {e}")
+
+    def _write_batch(self, batch: List[Tuple[str, float]]) -> None:
+        """Вставляет пачку ключей одной транзакцией (выполняется в отдельном потоке)"""
+        with self._db_lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO dedup_index (key, seen_at) VALUES (?, ?)", batch)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._added_since_prune += len(batch)
+            if self._added_since_prune >= PRUNE_EVERY:
+                self._prune()
+
+    def _remember(self, key: str, seen_at: float) -> None:
+        """Добавляет ключ в память, вытесняя самый давно использованный"""
+        self._entries[key] = seen_at
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def _prune(self) -> None:
+        """Удаляет из базы ключи старше окна"""
+        self._db.execute("DELETE FROM dedup_index WHERE seen_at < ?", (time.time() - self.window,))
+        self._added_since_prune = 0
+
+    async def close(self) -> None:
+        """Дописывает накопленные ключи и закрывает базу данных"""
+        if self._writer is not None:
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+        if self._db is not None:
+            if self._pending:
+                await self._write_pending()
+            self._db.close()
+            self._db = None
@@ -0,0 +1,164 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Union
+
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Ожидание, начиная с которого задержка отправки попадает в лог
+SLOW_WAIT_SECONDS = 1.0
+
+
+class TokenBucket:
+    """Token bucket: capacity запросов с пополнением rate запросов в секунду"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        """Пополняет токены за прошедшее время"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self, cost: float = 1.0) -> float:
+        """Сколько секунд ждать, пока хватит токенов на запрос стоимостью cost"""
+        self._refill()
+        needed = min(cost, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def consume(self, cost: float = 1.0) -> None:
+        """Списывает токены; запрос дороже capacity уводит баланс в минус"""
+        self._refill()
+        self.tokens -= cost
+
+
+class _ChatState:
+    """Очередь отправки в один чат"""
+
+    def __init__(self, rate_per_minute: float):
+        self.bucket = TokenBucket(rate_per_minute / 60.0, rate_per_minute)
+        self.lock = asyncio.Lock()
+        self.parked_until = 0.0
+
+
+class FloodControl:
+    """
+    Планировщик исходящих запросов с учетом лимитов Telegram
+
+    Общий лимит бота (около 30 сообщений в секунду) и лимит на чат
+    (около 20 сообщений в минуту для каналов) соблюдаются заранее.
+    При RetryAfter очередь чата ставится на паузу на указанное время,
+    после чего запрос повторяется, а не теряется.
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate_per_minute: float = 20, max_retries: int = 5):
+        """
+        Args:
+            global_rate: Запросов в секунду на всего бота
+            chat_rate_per_minute: Сообщений в минуту в один чат
+            max_retries: Сколько раз повторять запрос после RetryAfter
+        """
+        self.chat_rate_per_minute = chat_rate_per_minute
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, global_rate)
+        self._global_lock = asyncio.Lock()
+        self._chats: Dict[Union[int, str], _ChatState] = {}
+
+        self.waiting = 0
+        self.requests = 0
+        self.retries = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        """Количество запросов, ожидающих отправки"""
+        return self.waiting
+
+    @property
+    def average_wait(self) -> float:
+        """Среднее время ожидания перед отправкой в секундах"""
+        return self.total_wait / self.requests if self.requests else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Статистика очереди для логов и проверки здоровья"""
+        return {
+            "queue_depth": self.waiting,
+            "requests": self.requests,
+            "retries": self.retries,
+            "average_wait": round(self.average_wait, 3),
+            "max_wait": round(self.max_wait, 3)
+        }
+
+    async def call(self, chat_id: Union[int, str], request: Callable[[], Awaitable[Any]], cost: int = 1) -> Any:
+        """
+        Выполняет запрос к чату с соблюдением лимитов
+
+        Args:
+            chat_id: Чат, в который отправляется сообщение
+            request: Фабрика запроса; вызывается заново при каждой попытке,
+                чтобы файлы открывались и читались повторно
+            cost: Количество сообщений в запросе (для альбома - число элементов)
+
+        Raises:
+            RetryAfter: если лимит повторов исчерпан
+        """
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _ChatState(self.chat_rate_per_minute)
+
+        attempt = 0
+        while True:
+            await self._acquire(chat_id, chat, cost)
+            try:
+                return await request()
+            except RetryAfter as e:
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                self.retries += 1
+                # Ставим очередь чата на паузу: следующие сообщения подождут вместе с этим
+                chat.parked_until = max(chat.parked_until, time.monotonic() + float(e.retry_after))
+                logger.warning(
+                    "Flood control for chat %s: retry after %ss (attempt %s/%s, queue depth %s)",
+                    chat_id, e.retry_after, attempt, self.max_retries, self.waiting
+                )
+
+    async def _acquire(self, chat_id: Union[int, str], chat: _ChatState, cost: int) -> None:
+        """Ожидает паузу чата, токены чата и общие токены"""
+        started = time.monotonic()
+        self.waiting += 1
+        try:
+            # Блокировка чата сохраняет порядок сообщений внутри чата
+            async with chat.lock:
+                while True:
+                    delay = max(chat.parked_until - time.monotonic(), chat.bucket.delay(cost))
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+                chat.bucket.consume(cost)
+
+            async with self._global_lock:
+                while True:
+                    delay = self._global.delay(cost)
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+                self._global.consume(cost)
+        finally:
+            self.waiting -= 1
+
+        waited = time.monotonic() - started
+        self.requests += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        if waited >= SLOW_WAIT_SECONDS:
+            logger.info("Flood control delayed message to %s by %.1fs (queue depth %s)", chat_id, waited, self.waiting)
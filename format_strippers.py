@@ -0,0 +1,1246 @@
+"""
+Потоковое удаление метаданных на уровне контейнера без декодирования данных
+
+Каждая функция strip_* читает исходный файл из src и пишет очищенную копию
+в dst блоками фиксированного размера. Сжатые данные копируются без изменений,
+поэтому качество не теряется, а расход памяти не зависит от размера файла.
+
+Функции scan_* читают только заголовки сегментов, чанков и атомов и сообщают,
+какие классы метаданных есть в файле, чтобы пропускать очистку чистых файлов.
+"""
+
+import bisect
+import struct
+import zlib
+from typing import BinaryIO, List, Optional, Set, Tuple
+
+# Размер блока при потоковом копировании
+CHUNK_SIZE = 64 * 1024
+
+# Классы метаданных, которые сообщают функции scan_*
+METADATA_EXIF = 'exif'
+METADATA_GPS = 'gps'
+METADATA_XMP = 'xmp'
+METADATA_IPTC = 'iptc'
+METADATA_COMMENT = 'comment'
+METADATA_TEXT = 'text'
+METADATA_TIMESTAMP = 'timestamp'
+METADATA_TAGS = 'tags'
+METADATA_LOCATION = 'location'
+METADATA_PICTURE = 'picture'
+METADATA_TRAILER = 'trailer'
+METADATA_OTHER = 'other'
+
+
+class StripError(ValueError):
+    """Файл не удалось разобрать как контейнер ожидаемого формата"""
+
+
+def detect_format(header: bytes) -> Optional[str]:
+    """
+    Определяет формат файла по сигнатуре
+
+    Args:
+        header: Первые байты файла (достаточно 16)
+
+    Returns:
+        Название формата или None если формат не распознан
+    """
+    if header.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    if header[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'tiff'
+    if header.startswith(b'BM'):
+        return 'bmp'
+    if header.startswith((b'GIF87a', b'GIF89a')):
+        return 'gif'
+    if header[4:8] in _MP4_TOP_LEVEL_SIGNATURES:
+        return 'mp4'
+    if header.startswith(b'OggS'):
+        return 'ogg'
+    if header.startswith(b'fLaC'):
+        return 'flac'
+    if header.startswith(b'ID3') or (len(header) > 1 and header[0] == 0xFF and header[1] & 0xE0 == 0xE0):
+        return 'mp3'
+    return None
+
+
+def detect_stream_format(src: BinaryIO) -> Optional[str]:
+    """
+    Определяет формат файла по сигнатуре, пропуская теги ID3v2 в начале
+
+    ID3v2 встречается не только в MP3: некоторые программы дописывают его
+    и перед FLAC, поэтому формат определяется по данным после тега.
+
+    Args:
+        src: Файл, открытый на чтение с начала
+
+    Returns:
+        Название формата или None если формат не распознан
+    """
+    file_format = detect_format(src.read(16))
+    if file_format != 'mp3':
+        return file_format
+    try:
+        src.seek(_skip_id3v2(src))
+    except StripError:
+        return file_format
+    return 'flac' if src.read(4) == b'fLaC' else file_format
+
+
+class _Reader:
+    """Буферизованное чтение с возможностью просмотра вперед"""
+
+    def __init__(self, src: BinaryIO):
+        self.src = src
+        self.buf = b''
+
+    def fill(self) -> bool:
+        """Дочитывает следующий блок в буфер; False если файл закончился"""
+        chunk = self.src.read(CHUNK_SIZE)
+        if not chunk:
+            return False
+        self.buf += chunk
+        return True
+
+    def read_exact(self, size: int) -> bytes:
+        """Читает ровно size байт или выбрасывает StripError"""
+        while len(self.buf) < size:
+            if not self.fill():
+                raise StripError("Unexpected end of file")
+        data, self.buf = self.buf[:size], self.buf[size:]
+        return data
+
+
+def _read_exact(src: BinaryIO, size: int) -> bytes:
+    """Читает ровно size байт из файла или выбрасывает StripError"""
+    data = src.read(size)
+    if len(data) != size:
+        raise StripError("Unexpected end of file")
+    return data
+
+
+def _copy_exact(src: BinaryIO, dst: BinaryIO, size: int) -> None:
+    """Копирует ровно size байт блоками CHUNK_SIZE"""
+    while size > 0:
+        chunk = src.read(min(size, CHUNK_SIZE))
+        if not chunk:
+            raise StripError("Unexpected end of file")
+        dst.write(chunk)
+        size -= len(chunk)
+
+
+def _copy_rest(src: BinaryIO, dst: BinaryIO) -> None:
+    """Копирует остаток файла блоками CHUNK_SIZE"""
+    while True:
+        chunk = src.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        dst.write(chunk)
+
+
+def _write_zeros(dst: BinaryIO, offset: int, size: int) -> None:
+    """Затирает нулями область файла"""
+    dst.seek(offset)
+    while size > 0:
+        step = min(size, CHUNK_SIZE)
+        dst.write(bytes(step))
+        size -= step
+
+
+# --- JPEG ---------------------------------------------------------------
+
+# Маркеры JPEG без поля длины: TEM и RST0-RST7
+_JPEG_STANDALONE_MARKERS = {0x01} | set(range(0xD0, 0xD8))
+_JPEG_SOS = 0xDA
+_JPEG_EOI = 0xD9
+_JPEG_APP1 = 0xE1
+_JPEG_COM = 0xFE
+_EXIF_HEADER = b'Exif\x00\x00'
+_EXIF_ORIENTATION_TAG = 0x0112
+
+
+def _keep_jpeg_segment(marker: int, payload: bytes) -> bool:
+    """Решает, нужен ли сегмент для отображения изображения"""
+    if marker == 0xE0:
+        # APP0: JFIF/JFXX описывают плотность пикселей
+        return payload.startswith((b'JFIF\x00', b'JFXX\x00'))
+    if marker == 0xE2:
+        # APP2: оставляем только цветовой профиль ICC
+        return payload.startswith(b'ICC_PROFILE\x00')
+    if marker == 0xEE:
+        # APP14: Adobe задает цветовое преобразование для CMYK/YCCK
+        return payload.startswith(b'Adobe')
+    if 0xE0 <= marker <= 0xEF or marker == _JPEG_COM:
+        # EXIF, XMP, IPTC/Photoshop, MPF, комментарии и прочие APPn
+        return False
+    return True
+
+
+def _exif_orientation(tiff: bytes) -> Optional[int]:
+    """Извлекает тег Orientation из IFD0 блока EXIF"""
+    try:
+        if tiff[:2] == b'II':
+            order = '<'
+        elif tiff[:2] == b'MM':
+            order = '>'
+        else:
+            return None
+
+        ifd_offset = struct.unpack_from(order + 'I', tiff, 4)[0]
+        count = struct.unpack_from(order + 'H', tiff, ifd_offset)[0]
+        for index in range(count):
+            entry = ifd_offset + 2 + index * 12
+            tag, field_type = struct.unpack_from(order + 'HH', tiff, entry)
+            if tag == _EXIF_ORIENTATION_TAG and field_type == 3:
+                return struct.unpack_from(order + 'H', tiff, entry + 8)[0]
+    except struct.error:
+        return None
+    return None
+
+
+def _orientation_segment(orientation: int) -> bytes:
+    """Строит минимальный сегмент APP1 EXIF только с тегом Orientation"""
+    payload = (
+        _EXIF_HEADER
+        + b'MM\x00\x2a' + struct.pack('>I', 8)
+        + struct.pack('>H', 1)
+        + struct.pack('>HHIHH', _EXIF_ORIENTATION_TAG, 3, 1, orientation, 0)
+        + struct.pack('>I', 0)
+    )
+    return b'\xff' + bytes([_JPEG_APP1]) + struct.pack('>H', len(payload) + 2) + payload
+
+
+def _copy_jpeg_scan(reader: _Reader, dst: BinaryIO) -> bool:
+    """
+    Копирует энтропийно-кодированные данные скана до следующего маркера
+
+    Returns:
+        True если найден маркер (он остается в буфере), False если файл закончился
+    """
+    pos = 0
+    while True:
+        index = reader.buf.find(b'\xff', pos)
+        if index < 0 or index == len(reader.buf) - 1:
+            # Маркер не найден в буфере: сбрасываем все, кроме возможного 0xFF в конце
+            keep = len(reader.buf) - 1 if index >= 0 else len(reader.buf)
+            dst.write(reader.buf[:keep])
+            reader.buf = reader.buf[keep:]
+            pos = 0
+            if not reader.fill():
+                dst.write(reader.buf)
+                reader.buf = b''
+                return False
+            continue
+
+        following = reader.buf[index + 1]
+        if following == 0x00 or following == 0xFF or following in _JPEG_STANDALONE_MARKERS:
+            # Экранированный байт, байт-заполнитель или маркер RST внутри скана
+            pos = index + 1
+            continue
+
+        dst.write(reader.buf[:index])
+        reader.buf = reader.buf[index:]
+        return True
+
+
+def strip_jpeg(src: BinaryIO, dst: BinaryIO) -> None:
+    """
+    Переписывает JPEG по сегментам, удаляя EXIF, XMP, IPTC, комментарии и данные после EOI
+
+    Сохраняются таблицы, кадры, сканы, профиль ICC и ориентация изображения.
+
+    Raises:
+        StripError: если файл не является корректным JPEG
+    """
+    reader = _Reader(src)
+    if reader.read_exact(2) != b'\xff\xd8':
+        raise StripError("Not a JPEG file")
+    dst.write(b'\xff\xd8')
+
+    orientation_written = False
+    while True:
+        if reader.read_exact(1) != b'\xff':
+            raise StripError("JPEG marker expected")
+
+        marker = reader.read_exact(1)[0]
+        while marker == 0xFF:
+            marker = reader.read_exact(1)[0]
+
+        if marker == _JPEG_EOI:
+            # Все, что идет после EOI (превью, MPF-изображения), отбрасываем
+            dst.write(b'\xff\xd9')
+            return
+
+        if marker in _JPEG_STANDALONE_MARKERS:
+            dst.write(b'\xff' + bytes([marker]))
+            continue
+
+        length = struct.unpack('>H', reader.read_exact(2))[0]
+        if length < 2:
+            raise StripError("Invalid JPEG segment length")
+        payload = reader.read_exact(length - 2)
+
+        if _keep_jpeg_segment(marker, payload):
+            dst.write(b'\xff' + bytes([marker]) + struct.pack('>H', length) + payload)
+        elif marker == _JPEG_APP1 and payload.startswith(_EXIF_HEADER) and not orientation_written:
+            # Ориентация нужна для правильного отображения, сохраняем только ее
+            orientation = _exif_orientation(payload[len(_EXIF_HEADER):])
+            if orientation and orientation != 1:
+                dst.write(_orientation_segment(orientation))
+            orientation_written = True
+
+        if marker == _JPEG_SOS and not _copy_jpeg_scan(reader, dst):
+            # Файл оборван после данных скана: копируем как есть
+            return
+
+
+# --- PNG ----------------------------------------------------------------
+
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# Текстовые чанки, EXIF и время последнего изменения
+_PNG_METADATA_CHUNKS = {b'tEXt', b'zTXt', b'iTXt', b'eXIf', b'tIME'}
+
+
+def strip_png(src: BinaryIO, dst: BinaryIO) -> None:
+    """
+    Переписывает PNG по чанкам, удаляя tEXt, zTXt, iTXt, eXIf и tIME
+
+    Raises:
+        StripError: если файл не является корректным PNG
+    """
+    if src.read(8) != _PNG_SIGNATURE:
+        raise StripError("Not a PNG file")
+    dst.write(_PNG_SIGNATURE)
+
+    while True:
+        header = _read_exact(src, 8)
+        length, chunk_type = struct.unpack('>I4s', header)
+
+        # Данные чанка и CRC копируются без пересчета
+        if chunk_type in _PNG_METADATA_CHUNKS:
+            src.seek(length + 4, 1)
+        else:
+            dst.write(header)
+            _copy_exact(src, dst, length + 4)
+
+        if chunk_type == b'IEND':
+            return
+
+
+# --- WebP ---------------------------------------------------------------
+
+_WEBP_METADATA_CHUNKS = {b'EXIF', b'XMP '}
+# Флаги наличия EXIF и XMP в чанке VP8X
+_WEBP_VP8X_METADATA_FLAGS = 0x08 | 0x04
+
+
+def strip_webp(src: BinaryIO, dst: BinaryIO) -> None:
+    """
+    Переписывает контейнер RIFF/WebP, удаляя чанки EXIF и XMP
+
+    Raises:
+        StripError: если файл не является корректным WebP
+    """
+    header = _read_exact(src, 12)
+    if header[:4] != b'RIFF' or header[8:12] != b'WEBP':
+        raise StripError("Not a WebP file")
+    riff_end = 8 + struct.unpack('<I', header[4:8])[0]
+
+    # Первый проход читает только заголовки чанков, чтобы заранее вычислить размер RIFF
+    chunks = []
+    position = 12
+    while position + 8 <= riff_end:
+        src.seek(position)
+        fourcc, size = struct.unpack('<4sI', _read_exact(src, 8))
+        padded = size + (size & 1)
+        if fourcc not in _WEBP_METADATA_CHUNKS:
+            chunks.append((fourcc, position, padded))
+        position += 8 + padded
+
+    dst.write(b'RIFF' + struct.pack('<I', 4 + sum(8 + padded for _, _, padded in chunks)) + b'WEBP')
+    for fourcc, position, padded in chunks:
+        src.seek(position)
+        if fourcc == b'VP8X':
+            data = bytearray(_read_exact(src, 8 + padded))
+            data[8] &= ~_WEBP_VP8X_METADATA_FLAGS & 0xFF
+            dst.write(data)
+        else:
+            _copy_exact(src, dst, 8 + padded)
+
+
+# --- TIFF ---------------------------------------------------------------
+
+# Размер одного значения для каждого типа поля TIFF
+_TIFF_TYPE_SIZES = {
+    1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2,
+    9: 4, 10: 8, 11: 4, 12: 8, 13: 4, 16: 8, 17: 8, 18: 8,
+}
+# Указатели на вложенные IFD с метаданными: Exif, GPS, Interoperability
+_TIFF_METADATA_IFD_TAGS = {0x8769, 0x8825, 0xA005}
+# Теги с описательными метаданными, не влияющие на отображение
+_TIFF_METADATA_TAGS = _TIFF_METADATA_IFD_TAGS | {
+    0x010D,  # DocumentName
+    0x010E,  # ImageDescription
+    0x010F,  # Make
+    0x0110,  # Model
+    0x0131,  # Software
+    0x0132,  # DateTime
+    0x013B,  # Artist
+    0x013C,  # HostComputer
+    0x02BC,  # XMP
+    0x8298,  # Copyright
+    0x83BB,  # IPTC
+    0x8649,  # Photoshop
+    0x9C9B, 0x9C9C, 0x9C9D, 0x9C9E, 0x9C9F,  # XPTitle, XPComment, XPAuthor, XPKeywords, XPSubject
+    0xC4A5,  # PrintIM
+}
+_TIFF_MAX_IFDS = 1024
+
+
+class _TiffPruner:
+    """Удаляет теги метаданных из IFD на месте, не меняя смещения остальных данных"""
+
+    def __init__(self, src: BinaryIO, dst: BinaryIO, order: str, file_size: int):
+        self.src = src
+        self.dst = dst
+        self.order = order
+        self.file_size = file_size
+        self.visited = set()
+
+    def _read_ifd(self, offset: int):
+        """Читает записи IFD и смещение следующего IFD"""
+        if offset in self.visited or len(self.visited) >= _TIFF_MAX_IFDS:
+            raise StripError("Invalid TIFF IFD chain")
+        self.visited.add(offset)
+
+        self.src.seek(offset)
+        count = struct.unpack(self.order + 'H', _read_exact(self.src, 2))[0]
+        raw = _read_exact(self.src, count * 12 + 4)
+        entries = [raw[index * 12:(index + 1) * 12] for index in range(count)]
+        next_offset = struct.unpack(self.order + 'I', raw[-4:])[0]
+        return entries, next_offset
+
+    def _erase_value(self, entry: bytes) -> None:
+        """Затирает внешнее значение тега, а для указателей на IFD - весь вложенный IFD"""
+        tag, field_type, count, value = struct.unpack(self.order + 'HHII', entry)
+        if tag in _TIFF_METADATA_IFD_TAGS:
+            if 0 < value < self.file_size:
+                self._erase_ifd(value)
+            return
+
+        size = _TIFF_TYPE_SIZES.get(field_type, 1) * count
+        if size > 4 and value + size <= self.file_size:
+            _write_zeros(self.dst, value, size)
+
+    def _erase_ifd(self, offset: int) -> None:
+        """Затирает вложенный IFD вместе со значениями его тегов"""
+        entries, _ = self._read_ifd(offset)
+        for entry in entries:
+            self._erase_value(entry)
+        _write_zeros(self.dst, offset, 2 + len(entries) * 12 + 4)
+
+    def prune(self, offset: int) -> None:
+        """Проходит цепочку IFD и удаляет из каждого теги метаданных"""
+        while offset:
+            entries, next_offset = self._read_ifd(offset)
+            kept = []
+            for entry in entries:
+                tag = struct.unpack(self.order + 'H', entry[:2])[0]
+                if tag in _TIFF_METADATA_TAGS:
+                    self._erase_value(entry)
+                else:
+                    kept.append(entry)
+
+            if len(kept) != len(entries):
+                # Записи остаются отсортированными, освободившееся место заполняется нулями
+                self.dst.seek(offset)
+                self.dst.write(struct.pack(self.order + 'H', len(kept)))
+                self.dst.write(b''.join(kept))
+                self.dst.write(struct.pack(self.order + 'I', next_offset))
+                self.dst.write(bytes((len(entries) - len(kept)) * 12))
+            offset = next_offset
+
+
+def strip_tiff(src: BinaryIO, dst: BinaryIO) -> None:
+    """
+    Удаляет из TIFF описательные теги, Exif, GPS, XMP и IPTC
+
+    Файл копируется целиком блоками, затем IFD переписываются на месте
+    в выходном файле, поэтому смещения полос изображения не меняются.
+
+    Raises:
+        StripError: если файл не является поддерживаемым TIFF (в том числе BigTIFF)
+    """
+    header = _read_exact(src, 8)
+    if header[:4] == b'II*\x00':
+        order = '<'
+    elif header[:4] == b'MM\x00*':
+        order = '>'
+    else:
+        raise StripError("Not a classic TIFF file")
+
+    dst.write(header)
+    _copy_rest(src, dst)
+    file_size = src.tell()
+
+    first_ifd = struct.unpack(order + 'I', header[4:8])[0]
+    _TiffPruner(src, dst, order, file_size).prune(first_ifd)
+    dst.seek(0, 2)
+
+
+# --- MP4 / MOV (ISO BMFF) -----------------------------------------------
+
+# Атомы, с которых может начинаться файл MP4/MOV
+_MP4_TOP_LEVEL_SIGNATURES = {b'ftyp', b'moov', b'mdat', b'wide', b'free', b'skip'}
+# Контейнеры внутри moov, в которых ищутся атомы метаданных
+_MP4_CONTAINER_ATOMS = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'dinf', b'edts', b'mvex'}
+# Пользовательские данные (в том числе ©xyz с координатами) и iTunes-теги
+_MP4_METADATA_ATOMS = {b'udta', b'meta'}
+_MP4_XMP_UUID = bytes.fromhex('BE7ACFCB97A942E89C71999491E3AFAC')
+# Атомы с датами создания и изменения
+_MP4_TIMESTAMP_ATOMS = {b'mvhd', b'tkhd', b'mdhd'}
+# moov переписывается в памяти, поэтому его размер ограничен
+_MP4_MAX_MOOV_SIZE = 64 * 1024 * 1024
+
+
+def _parse_atom_header(data: bytes, offset: int, end: int) -> Tuple[bytes, int, int]:
+    """Разбирает заголовок атома: тип, полный размер и размер заголовка"""
+    if offset + 8 > end:
+        raise StripError("Truncated MP4 atom header")
+    size, atom_type = struct.unpack_from('>I4s', data, offset)
+    header_size = 8
+    if size == 1:
+        if offset + 16 > end:
+            raise StripError("Truncated MP4 atom header")
+        size = struct.unpack_from('>Q', data, offset + 8)[0]
+        header_size = 16
+    elif size == 0:
+        size = end - offset
+    if size < header_size or offset + size > end:
+        raise StripError("Invalid MP4 atom size")
+    return atom_type, size, header_size
+
+
+def _read_atom_header(head: bytes, offset: int, file_size: int) -> Tuple[bytes, int, int]:
+    """Разбирает заголовок атома по первым байтам, прочитанным с offset; end - граница родителя"""
+    if len(head) < 8:
+        raise StripError("Truncated MP4 atom header")
+    size, atom_type = struct.unpack_from('>I4s', head)
+    header_size = 8
+    if size == 1:
+        if len(head) < 16:
+            raise StripError("Truncated MP4 atom header")
+        size = struct.unpack_from('>Q', head, 8)[0]
+        header_size = 16
+    elif size == 0:
+        size = file_size - offset
+    if size < header_size:
+        raise StripError("Invalid MP4 atom size")
+    if offset + size > file_size:
+        # Оборванный mdat в конце файла допустим, остальные атомы - нет
+        if atom_type != b'mdat':
+            raise StripError("Truncated MP4 atom")
+        size = file_size - offset
+    return atom_type, size, header_size
+
+
+def _is_mp4_metadata_atom(atom_type: bytes, payload_head: bytes) -> bool:
+    """Проверяет, является ли атом метаданными"""
+    if atom_type in _MP4_METADATA_ATOMS or atom_type[0] == 0xA9:
+        return True
+    return atom_type == b'uuid' and payload_head[:16] == _MP4_XMP_UUID
+
+
+def _clear_mp4_timestamps(atom: bytearray, header_size: int) -> None:
+    """Обнуляет даты создания и изменения в mvhd, tkhd и mdhd"""
+    version = atom[header_size]
+    field_size = 8 if version == 1 else 4
+    start = header_size + 4
+    atom[start:start + field_size * 2] = bytes(field_size * 2)
+
+
+def _rewrite_mp4_children(data: bytes, base_offset: int, removed: List[Tuple[int, int]]) -> bytes:
+    """
+    Рекурсивно переписывает дочерние атомы контейнера, удаляя метаданные
+
+    Args:
+        data: Содержимое контейнера без заголовка
+        base_offset: Смещение data в исходном файле
+        removed: Список удаленных областей (смещение, размер), пополняется
+    """
+    result = []
+    offset = 0
+    while offset < len(data):
+        atom_type, size, header_size = _parse_atom_header(data, offset, len(data))
+        if _is_mp4_metadata_atom(atom_type, data[offset + header_size:offset + header_size + 16]):
+            removed.append((base_offset + offset, size))
+        elif atom_type in _MP4_CONTAINER_ATOMS:
+            children = _rewrite_mp4_children(
+                data[offset + header_size:offset + size], base_offset + offset + header_size, removed
+            )
+            if header_size == 16:
+                header = struct.pack('>I4sQ', 1, atom_type, 16 + len(children))
+            else:
+                header = struct.pack('>I4s', 8 + len(children), atom_type)
+            result.append(header + children)
+        elif atom_type in _MP4_TIMESTAMP_ATOMS:
+            atom = bytearray(data[offset:offset + size])
+            _clear_mp4_timestamps(atom, header_size)
+            result.append(bytes(atom))
+        else:
+            result.append(data[offset:offset + size])
+        offset += size
+    return b''.join(result)
+
+
+def _offset_shift(removed: List[Tuple[int, int]]):
+    """Возвращает функцию: на сколько байт сдвигается исходное смещение после удаления областей"""
+    removed = sorted(removed)
+    starts = [start for start, _ in removed]
+    shifts = [0]
+    for _, size in removed:
+        shifts.append(shifts[-1] + size)
+
+    def shift(position: int) -> int:
+        return shifts[bisect.bisect_left(starts, position)]
+
+    return shift
+
+
+def _patch_mp4_chunk_offsets(moov: bytearray, shift) -> None:
+    """Сдвигает абсолютные смещения чанков в stco/co64 на размер удаленных перед ними данных"""
+    def walk(offset: int, end: int) -> None:
+        while offset < end:
+            atom_type, size, header_size = _parse_atom_header(moov, offset, end)
+            body = offset + header_size
+            if atom_type in _MP4_CONTAINER_ATOMS:
+                walk(body, offset + size)
+            elif atom_type in (b'stco', b'co64'):
+                entry_format = '>I' if atom_type == b'stco' else '>Q'
+                entry_size = struct.calcsize(entry_format)
+                count = struct.unpack_from('>I', moov, body + 4)[0]
+                if body + 8 + count * entry_size > offset + size:
+                    raise StripError("Invalid MP4 chunk offset table")
+                for index in range(count):
+                    position = body + 8 + index * entry_size
+                    value = struct.unpack_from(entry_format, moov, position)[0]
+                    struct.pack_into(entry_format, moov, position, value - shift(value))
+            offset += size
+
+    atom_type, size, header_size = _parse_atom_header(moov, 0, len(moov))
+    walk(header_size, size)
+
+
+def _patch_mp4_fragment_offsets(moof: bytearray, shift) -> None:
+    """Сдвигает явно заданные абсолютные смещения base_data_offset в tfhd фрагмента"""
+    _, size, header_size = _parse_atom_header(moof, 0, len(moof))
+    offset = header_size
+    while offset < size:
+        atom_type, atom_size, atom_header = _parse_atom_header(moof, offset, size)
+        if atom_type == b'traf':
+            inner = offset + atom_header
+            while inner < offset + atom_size:
+                inner_type, inner_size, inner_header = _parse_atom_header(moof, inner, offset + atom_size)
+                body = inner + inner_header
+                if inner_type == b'tfhd' and struct.unpack_from('>I', moof, body)[0] & 0x000001:
+                    # version/flags (4 байта), track_ID (4 байта), base_data_offset (8 байт)
+                    if body + 16 > inner + inner_size:
+                        raise StripError("Invalid MP4 tfhd atom")
+                    value = struct.unpack_from('>Q', moof, body + 8)[0]
+                    struct.pack_into('>Q', moof, body + 8, value - shift(value))
+                inner += inner_size
+        offset += atom_size
+
+
+def strip_mp4(src: BinaryIO, dst: BinaryIO) -> None:
+    """
+    Удаляет из MP4/MOV атомы udta, meta, ©xyz и XMP, обнуляет даты создания
+
+    Атом moov переписывается в памяти, смещения чанков в stco/co64 и base_data_offset
+    во фрагментах moof исправляются на размер удаленных данных. Остальные атомы,
+    включая mdat, копируются блоками.
+
+    Raises:
+        StripError: если файл не является поддерживаемым MP4/MOV
+    """
+    src.seek(0, 2)
+    file_size = src.tell()
+
+    atoms = []
+    removed: List[Tuple[int, int]] = []
+    offset = 0
+    while offset < file_size:
+        src.seek(offset)
+        head = src.read(32)
+        atom_type, size, header_size = _read_atom_header(head, offset, file_size)
+        if _is_mp4_metadata_atom(atom_type, head[header_size:header_size + 16]):
+            removed.append((offset, size))
+        else:
+            atoms.append((atom_type, offset, size, header_size))
+        offset += size
+
+    if not any(atom_type == b'moov' for atom_type, _, _, _ in atoms):
+        raise StripError("MP4 file without moov atom")
+
+    rewritten = {}
+    for atom_type, offset, size, header_size in atoms:
+        if atom_type != b'moov':
+            continue
+        if size > _MP4_MAX_MOOV_SIZE:
+            raise StripError("MP4 moov atom is too large")
+        src.seek(offset)
+        data = _read_exact(src, size)
+        children = _rewrite_mp4_children(data[header_size:], offset + header_size, removed)
+        if header_size == 16:
+            rewritten[offset] = bytearray(struct.pack('>I4sQ', 1, b'moov', 16 + len(children)) + children)
+        else:
+            rewritten[offset] = bytearray(struct.pack('>I4s', 8 + len(children), b'moov') + children)
+
+    shift = _offset_shift(removed)
+    if removed:
+        for moov in rewritten.values():
+            _patch_mp4_chunk_offsets(moov, shift)
+
+    for atom_type, offset, size, _ in atoms:
+        if atom_type == b'mfra' and removed:
+            # Индекс фрагментов хранит абсолютные смещения и необязателен
+            continue
+        if offset in rewritten:
+            dst.write(rewritten[offset])
+        elif atom_type == b'moof' and removed:
+            src.seek(offset)
+            moof = bytearray(_read_exact(src, size))
+            _patch_mp4_fragment_offsets(moof, shift)
+            dst.write(moof)
+        else:
+            src.seek(offset)
+            _copy_exact(src, dst, size)
+
+
+# --- MP3 ------------------------------------------------------------------
+
+def _syncsafe_int(data: bytes) -> int:
+    """Декодирует синхробезопасное целое ID3v2"""
+    if any(byte & 0x80 for byte in data):
+        raise StripError("Invalid ID3v2 size")
+    value = 0
+    for byte in data:
+        value = (value << 7) | byte
+    return value
+
+
+def _skip_id3v2(src: BinaryIO) -> int:
+    """
+    Возвращает смещение данных после тегов ID3v2 в начале файла
+
+    Raises:
+        StripError: если заголовок ID3v2 поврежден
+    """
+    start = 0
+    src.seek(0)
+    header = src.read(10)
+    while len(header) == 10 and header[:3] == b'ID3':
+        footer = 10 if header[5] & 0x10 else 0
+        start += 10 + _syncsafe_int(header[6:10]) + footer
+        src.seek(start)
+        header = src.read(10)
+    return start
+
+
+def strip_mp3(src: BinaryIO, dst: BinaryIO) -> None:
+    """
+    Удаляет из MP3 теги ID3v2 в начале, ID3v1 и APEv2 в конце файла
+
+    Raises:
+        StripError: если заголовок ID3v2 поврежден
+    """
+    start = _skip_id3v2(src)
+
+    src.seek(0, 2)
+    end = src.tell()
+
+    # ID3v1 (128 байт) и расширенный ID3v1 "TAG+" (227 байт перед ним)
+    if end - start >= 128:
+        src.seek(end - 128)
+        if src.read(3) == b'TAG':
+            end -= 128
+            if end - start >= 227:
+                src.seek(end - 227)
+                if src.read(4) == b'TAG+':
+                    end -= 227
+
+    # APEv2: 32-байтовый футер, размер тега без заголовка
+    if end - start >= 32:
+        src.seek(end - 32)
+        footer = src.read(32)
+        if footer[:8] == b'APETAGEX':
+            tag_size, _, flags = struct.unpack('<III', footer[12:24])
+            tag_size += 32 if flags & 0x80000000 else 0
+            if tag_size <= end - start:
+                end -= tag_size
+
+    if end <= start:
+        raise StripError("MP3 file without audio frames")
+    src.seek(start)
+    _copy_exact(src, dst, end - start)
+
+
+# --- FLAC -----------------------------------------------------------------
+
+# Блоки метаданных FLAC: PADDING, VORBIS_COMMENT, PICTURE
+_FLAC_METADATA_BLOCKS = {1, 4, 6}
+
+
+def strip_flac(src: BinaryIO, dst: BinaryIO) -> None:
+    """
+    Удаляет из FLAC блоки VORBIS_COMMENT, PICTURE и PADDING и теги ID3v2 перед ними
+
+    Raises:
+        StripError: если файл не является корректным FLAC
+    """
+    start = _skip_id3v2(src)
+    src.seek(start)
+    if src.read(4) != b'fLaC':
+        raise StripError("Not a FLAC file")
+
+    blocks = []
+    offset = start + 4
+    while True:
+        src.seek(offset)
+        header = _read_exact(src, 4)
+        block_type = header[0] & 0x7F
+        length = int.from_bytes(header[1:4], 'big')
+        if block_type not in _FLAC_METADATA_BLOCKS:
+            blocks.append((block_type, offset, length))
+        offset += 4 + length
+        if header[0] & 0x80:
+            break
+
+    if not blocks:
+        raise StripError("FLAC file without STREAMINFO")
+
+    dst.write(b'fLaC')
+    for index, (block_type, block_offset, length) in enumerate(blocks):
+        # Флаг последнего блока ставится на последний оставшийся блок
+        is_last = 0x80 if index == len(blocks) - 1 else 0
+        dst.write(bytes([block_type | is_last]) + length.to_bytes(3, 'big'))
+        src.seek(block_offset + 4)
+        _copy_exact(src, dst, length)
+
+    src.seek(offset)
+    _copy_rest(src, dst)
+
+
+# --- Ogg (Opus, Vorbis) ---------------------------------------------------
+
+# Таблица для побитового разворота байтов
+_BIT_REVERSE = bytes(int(f'{byte:08b}'[::-1], 2) for byte in range(256))
+# Минимальные заголовки комментариев: пустой vendor и ни одного тега
+_OGG_EMPTY_COMMENTS = {
+    b'OpusTags': b'OpusTags' + struct.pack('<II', 0, 0),
+    b'\x03vorbis': b'\x03vorbis' + struct.pack('<II', 0, 0) + b'\x01',
+}
+
+
+def _ogg_crc(data: bytes) -> int:
+    """
+    CRC-32 страницы Ogg (полином 0x04C11DB7, без отражения, начальное значение 0)
+
+    Считается через zlib.crc32 на развернутых битах, чтобы не обрабатывать байты в Python.
+    """
+    crc = zlib.crc32(data.translate(_BIT_REVERSE), 0xFFFFFFFF) ^ 0xFFFFFFFF
+    return int(f'{crc:032b}'[::-1], 2)
+
+
+class _OggPage:
+    """Страница Ogg"""
+
+    def __init__(self, header_type: int, granule: int, serial: int, sequence: int, lacing: bytes, body: bytes,
+                 raw: bytes = b''):
+        # Исходные байты страницы, пока она не изменялась
+        self.raw = raw
+        self.header_type = header_type
+        self.granule = granule
+        self.serial = serial
+        self.sequence = sequence
+        self.lacing = lacing
+        self.body = body
+
+    def packets(self):
+        """Разбивает страницу на фрагменты пакетов: (данные, значения lacing, пакет завершен)"""
+        pieces = []
+        start = 0
+        segment_start = 0
+        for index, value in enumerate(self.lacing):
+            if value < 255:
+                end = start + sum(self.lacing[segment_start:index + 1])
+                pieces.append((self.body[start:end], self.lacing[segment_start:index + 1], True))
+                start = end
+                segment_start = index + 1
+        if segment_start < len(self.lacing):
+            pieces.append((self.body[start:], self.lacing[segment_start:], False))
+        return pieces
+
+    def to_bytes(self) -> bytes:
+        """Собирает страницу с пересчитанной контрольной суммой"""
+        header = b'OggS' + struct.pack(
+            '<BBqIIIB', 0, self.header_type, self.granule, self.serial, self.sequence, 0, len(self.lacing)
+        )
+        page = bytearray(header + self.lacing + self.body)
+        struct.pack_into('<I', page, 22, _ogg_crc(bytes(page)))
+        return bytes(page)
+
+
+def _read_ogg_page(src: BinaryIO) -> Optional[_OggPage]:
+    """Читает следующую страницу Ogg или возвращает None в конце файла"""
+    header = src.read(27)
+    if not header:
+        return None
+    if len(header) != 27 or header[:4] != b'OggS':
+        raise StripError("Invalid Ogg page")
+    _, header_type, granule, serial, sequence, _, segments = struct.unpack('<BBqIIIB', header[4:])
+    lacing = _read_exact(src, segments)
+    body = _read_exact(src, sum(lacing))
+    return _OggPage(header_type, granule, serial, sequence, lacing, body, header + lacing + body)
+
+
+def _lacing_for(length: int, complete: bool) -> bytes:
+    """Значения lacing для фрагмента пакета заданной длины"""
+    return bytes([255] * (length // 255) + ([length % 255] if complete else []))
+
+
+class _OggStream:
+    """Состояние логического потока при замене пакета комментариев"""
+
+    def __init__(self):
+        self.packets = 0
+        self.comment_parts: List[bytes] = []
+        self.consumed_pages = 0
+        self.sequence_delta = 0
+        self.done = False
+
+
+def strip_ogg(src: BinaryIO, dst: BinaryIO) -> None:
+    """
+    Заменяет в Ogg Opus/Vorbis пакет комментариев на пустой
+
+    Страницы, занятые старыми комментариями (например, обложкой), удаляются,
+    номера последующих страниц и их контрольные суммы пересчитываются.
+
+    Raises:
+        StripError: если файл не является корректным Ogg
+    """
+    streams = {}
+    while True:
+        page = _read_ogg_page(src)
+        if page is None:
+            return
+
+        stream = streams.setdefault(page.serial, _OggStream())
+        if stream.done:
+            if stream.sequence_delta:
+                page.sequence -= stream.sequence_delta
+                dst.write(page.to_bytes())
+            else:
+                dst.write(page.raw)
+            continue
+
+        pieces = []
+        touched_comment = False
+        for data, lacing, complete in page.packets():
+            if stream.packets != 1:
+                pieces.append((data, lacing))
+                stream.packets += complete
+                continue
+
+            # Второй пакет потока - комментарии
+            touched_comment = True
+            stream.comment_parts.append(data)
+            if complete:
+                comment = b''.join(stream.comment_parts)
+                replacement = next(
+                    (empty for magic, empty in _OGG_EMPTY_COMMENTS.items() if comment.startswith(magic)),
+                    comment
+                )
+                pieces.append((replacement, _lacing_for(len(replacement), True)))
+                stream.packets += 1
+
+        if touched_comment and stream.packets == 1:
+            # Пакет комментариев продолжается на следующей странице
+            if pieces:
+                raise StripError("Unsupported Ogg header layout")
+            stream.consumed_pages += 1
+            continue
+
+        if touched_comment:
+            lacing = b''.join(piece_lacing for _, piece_lacing in pieces)
+            if len(lacing) > 255:
+                raise StripError("Unsupported Ogg header layout")
+            if stream.consumed_pages:
+                # Первый фрагмент страницы теперь начало нового пакета комментариев
+                page.header_type &= ~0x01
+            stream.sequence_delta += stream.consumed_pages
+            page.sequence -= stream.sequence_delta
+            page.lacing = lacing
+            page.body = b''.join(data for data, _ in pieces)
+            stream.done = True
+            dst.write(page.to_bytes())
+        else:
+            dst.write(page.raw)
+
+
+# Потоковые обработчики по форматам
+STRIPPERS = {
+    'jpeg': strip_jpeg,
+    'png': strip_png,
+    'webp': strip_webp,
+    'tiff': strip_tiff,
+    'mp4': strip_mp4,
+    'mp3': strip_mp3,
+    'flac': strip_flac,
+    'ogg': strip_ogg,
+}
+
+
+# --- Проверка наличия метаданных --------------------------------------------
+
+def _exif_is_orientation_only(tiff: bytes) -> bool:
+    """Проверяет, что блок EXIF содержит только тег Orientation (как после очистки)"""
+    try:
+        order = '<' if tiff[:2] == b'II' else '>'
+        ifd_offset = struct.unpack_from(order + 'I', tiff, 4)[0]
+        count = struct.unpack_from(order + 'H', tiff, ifd_offset)[0]
+        tag = struct.unpack_from(order + 'H', tiff, ifd_offset + 2)[0]
+        next_ifd = struct.unpack_from(order + 'I', tiff, ifd_offset + 2 + count * 12)[0]
+    except struct.error:
+        return False
+    return count == 1 and tag == _EXIF_ORIENTATION_TAG and next_ifd == 0
+
+
+def scan_jpeg(src: BinaryIO) -> Set[str]:
+    """Находит сегменты метаданных JPEG до начала сканов и данные после EOI"""
+    found = set()
+    if src.read(2) != b'\xff\xd8':
+        raise StripError("Not a JPEG file")
+
+    while True:
+        prefix = _read_exact(src, 2)
+        if prefix[0] != 0xFF:
+            raise StripError("JPEG marker expected")
+        marker = prefix[1]
+        while marker == 0xFF:
+            marker = _read_exact(src, 1)[0]
+        if marker in _JPEG_STANDALONE_MARKERS:
+            continue
+        if marker == _JPEG_EOI:
+            break
+
+        length = struct.unpack('>H', _read_exact(src, 2))[0]
+        if length < 2:
+            raise StripError("Invalid JPEG segment length")
+        head = src.read(min(length - 2, 64))
+        if not _keep_jpeg_segment(marker, head):
+            if marker == _JPEG_APP1 and head.startswith(_EXIF_HEADER):
+                # Короткий EXIF может содержать только ориентацию
+                if length - 2 > len(head) or not _exif_is_orientation_only(head[len(_EXIF_HEADER):]):
+                    found.add(METADATA_EXIF)
+            elif marker == _JPEG_APP1:
+                found.add(METADATA_XMP)
+            elif marker == 0xED:
+                found.add(METADATA_IPTC)
+            elif marker == _JPEG_COM:
+                found.add(METADATA_COMMENT)
+            else:
+                found.add(METADATA_OTHER)
+        if marker == _JPEG_SOS:
+            break
+        src.seek(length - 2 - len(head), 1)
+
+    # Превью и MPF-изображения дописываются после EOI
+    src.seek(-2, 2)
+    if src.read(2) != b'\xff\xd9':
+        found.add(METADATA_TRAILER)
+    return found
+
+
+def scan_png(src: BinaryIO) -> Set[str]:
+    """Находит текстовые чанки, EXIF и время изменения в PNG по заголовкам чанков"""
+    classes = {b'tEXt': METADATA_TEXT, b'zTXt': METADATA_TEXT, b'iTXt': METADATA_TEXT,
+               b'eXIf': METADATA_EXIF, b'tIME': METADATA_TIMESTAMP}
+    found = set()
+    if src.read(8) != _PNG_SIGNATURE:
+        raise StripError("Not a PNG file")
+    while True:
+        length, chunk_type = struct.unpack('>I4s', _read_exact(src, 8))
+        if chunk_type in classes:
+            found.add(classes[chunk_type])
+        if chunk_type == b'IEND':
+            return found
+        src.seek(length + 4, 1)
+
+
+def scan_webp(src: BinaryIO) -> Set[str]:
+    """Находит чанки EXIF и XMP в WebP"""
+    header = _read_exact(src, 12)
+    if header[:4] != b'RIFF' or header[8:12] != b'WEBP':
+        raise StripError("Not a WebP file")
+    riff_end = 8 + struct.unpack('<I', header[4:8])[0]
+
+    found = set()
+    position = 12
+    while position + 8 <= riff_end:
+        src.seek(position)
+        fourcc, size = struct.unpack('<4sI', _read_exact(src, 8))
+        if fourcc == b'EXIF':
+            found.add(METADATA_EXIF)
+        elif fourcc == b'XMP ':
+            found.add(METADATA_XMP)
+        position += 8 + size + (size & 1)
+    return found
+
+
+def scan_tiff(src: BinaryIO) -> Set[str]:
+    """Находит теги метаданных во всех IFD файла TIFF"""
+    classes = {0x8769: METADATA_EXIF, 0x8825: METADATA_GPS, 0x02BC: METADATA_XMP,
+               0x83BB: METADATA_IPTC, 0x8649: METADATA_IPTC}
+    header = _read_exact(src, 8)
+    if header[:4] == b'II*\x00':
+        order = '<'
+    elif header[:4] == b'MM\x00*':
+        order = '>'
+    else:
+        raise StripError("Not a classic TIFF file")
+
+    src.seek(0, 2)
+    pruner = _TiffPruner(src, None, order, src.tell())
+    found = set()
+    offset = struct.unpack(order + 'I', header[4:8])[0]
+    while offset:
+        entries, offset = pruner._read_ifd(offset)
+        for entry in entries:
+            tag = struct.unpack(order + 'H', entry[:2])[0]
+            if tag in _TIFF_METADATA_TAGS:
+                found.add(classes.get(tag, METADATA_TEXT))
+    return found
+
+
+def _scan_mp4_children(src: BinaryIO, offset: int, end: int, found: Set[str]) -> None:
+    """Обходит дочерние атомы контейнера MP4, читая только заголовки"""
+    while offset < end:
+        src.seek(offset)
+        head = src.read(40)
+        atom_type, size, header_size = _read_atom_header(head, offset, end)
+        body = head[header_size:]
+        if atom_type in _MP4_METADATA_ATOMS or atom_type[0] == 0xA9:
+            found.add(METADATA_TAGS)
+            if atom_type == b'udta':
+                _scan_mp4_udta(src, offset + header_size, offset + size, found)
+        elif atom_type == b'uuid' and body[:16] == _MP4_XMP_UUID:
+            found.add(METADATA_XMP)
+        elif atom_type in _MP4_CONTAINER_ATOMS:
+            _scan_mp4_children(src, offset + header_size, offset + size, found)
+        elif atom_type in _MP4_TIMESTAMP_ATOMS:
+            field_size = 8 if body[:1] == b'\x01' else 4
+            if any(body[4:4 + field_size * 2]):
+                found.add(METADATA_TIMESTAMP)
+        offset += size
+
+
+def _scan_mp4_udta(src: BinaryIO, offset: int, end: int, found: Set[str]) -> None:
+    """Ищет атом координат ©xyz среди пользовательских данных"""
+    while offset + 8 <= end:
+        src.seek(offset)
+        size, atom_type = struct.unpack('>I4s', _read_exact(src, 8))
+        if atom_type == b'\xa9xyz':
+            found.add(METADATA_LOCATION)
+        if size < 8:
+            return
+        offset += size
+
+
+def scan_mp4(src: BinaryIO) -> Set[str]:
+    """Находит атомы udta, meta, ©xyz, XMP и даты создания в MP4/MOV"""
+    src.seek(0, 2)
+    file_size = src.tell()
+    found = set()
+    _scan_mp4_children(src, 0, file_size, found)
+    return found
+
+
+def scan_mp3(src: BinaryIO) -> Set[str]:
+    """Находит теги ID3v2, ID3v1 и APEv2 в MP3"""
+    found = set()
+    if src.read(3) == b'ID3':
+        found.add(METADATA_TAGS)
+    src.seek(0, 2)
+    size = src.tell()
+    if size >= 128:
+        src.seek(-128, 2)
+        if src.read(3) == b'TAG':
+            found.add(METADATA_TAGS)
+    if size >= 32:
+        src.seek(-32, 2)
+        if src.read(8) == b'APETAGEX':
+            found.add(METADATA_TAGS)
+    return found
+
+
+def scan_flac(src: BinaryIO) -> Set[str]:
+    """Находит блоки VORBIS_COMMENT и PICTURE и теги ID3v2 перед ними в FLAC"""
+    start = _skip_id3v2(src)
+    src.seek(start)
+    if src.read(4) != b'fLaC':
+        raise StripError("Not a FLAC file")
+    found = {METADATA_TAGS} if start else set()
+    while True:
+        header = _read_exact(src, 4)
+        block_type = header[0] & 0x7F
+        if block_type == 4:
+            found.add(METADATA_TAGS)
+        elif block_type == 6:
+            found.add(METADATA_PICTURE)
+        if header[0] & 0x80:
+            return found
+        src.seek(int.from_bytes(header[1:4], 'big'), 1)
+
+
+def scan_ogg(src: BinaryIO) -> Set[str]:
+    """Проверяет, есть ли теги в пакете комментариев первого потока Ogg"""
+    first = _read_ogg_page(src)
+    second = _read_ogg_page(src)
+    if first is None or second is None:
+        raise StripError("Truncated Ogg file")
+
+    if second.header_type & 0x02:
+        # Несколько мультиплексированных потоков: проверяем полной очисткой
+        return {METADATA_OTHER}
+
+    comment = second.body
+    for magic in _OGG_EMPTY_COMMENTS:
+        if comment.startswith(magic):
+            try:
+                vendor_length = struct.unpack_from('<I', comment, len(magic))[0]
+                count = struct.unpack_from('<I', comment, len(magic) + 4 + vendor_length)[0]
+            except struct.error:
+                # Комментарии не уместились на одной странице - значит их много
+                return {METADATA_TAGS}
+            return {METADATA_TAGS} if count else set()
+    return set()
+
+
+# Быстрые проверки наличия метаданных по форматам
+SCANNERS = {
+    'jpeg': scan_jpeg,
+    'png': scan_png,
+    'webp': scan_webp,
+    'tiff': scan_tiff,
+    'mp4': scan_mp4,
+    'mp3': scan_mp3,
+    'flac': scan_flac,
+    'ogg': scan_ogg,
+}
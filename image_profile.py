@@ -0,0 +1,167 @@
+import io
+import logging
+import os
+import tempfile
+from typing import Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Форматы вывода и параметры кодировщика Pillow
+OUTPUT_FORMATS = {
+    'jpeg': {'optimize': True, 'progressive': True},
+    'webp': {'method': 4},
+}
+# Сколько раз подбирать качество под целевой размер
+QUALITY_SEARCH_STEPS = 4
+# Документы, которые можно перекодировать без потери прозрачности: полноразмерные снимки телефонов
+DOCUMENT_MIME_TYPES = ('image/jpeg',)
+# Расширение имени файла после перекодирования
+OUTPUT_EXTENSIONS = {'jpeg': '.jpg', 'webp': '.webp'}
+
+
+class ImageProfile:
+    """
+    Профиль перекодирования фото перед загрузкой
+
+    Telegram хранит фото не больше 2560 пикселей по длинной стороне, поэтому
+    фото из сообщений уже помещаются в профиль и меняются только при заданном
+    target_size. Снимки телефонов в полном разрешении приходят документами:
+    они уменьшаются до max_edge и перекодируются с заданным качеством,
+    а при заданном target_size качество подбирается так, чтобы уложиться в него.
+    """
+
+    def __init__(self, max_edge: int = 2560, output_format: str = 'jpeg', quality: int = 87,
+                 target_size: int = 0, min_quality: int = 60):
+        """
+        Args:
+            max_edge: Максимальная длинная сторона в пикселях (0 - профиль отключен)
+            output_format: 'jpeg' или 'webp'
+            quality: Качество кодирования
+            target_size: Целевой размер в байтах (0 - не ограничен)
+            min_quality: Минимальное качество при подборе под target_size
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown image output format: {output_format}")
+        self.max_edge = max(0, max_edge)
+        self.output_format = output_format
+        self.quality = quality
+        self.target_size = max(0, target_size)
+        self.min_quality = min(min_quality, quality)
+
+    @property
+    def enabled(self) -> bool:
+        """Профиль включен"""
+        return self.max_edge > 0
+
+    def reencode_bytes(self, data: bytes) -> Tuple[bytes, int]:
+        """
+        Перекодирует фото в памяти
+
+        Returns:
+            Байты для загрузки и число сэкономленных байт (0 - оставлен исходный файл)
+        """
+        encoded = self._encode(io.BytesIO(data), len(data))
+        if encoded is None:
+            return data, 0
+        return encoded, len(data) - len(encoded)
+
+    def reencode_file(self, file_path: str, output_path: str) -> Tuple[str, int]:
+        """
+        Перекодирует фото на диске в output_path
+
+        Returns:
+            Путь к файлу для загрузки и число сэкономленных байт (0 - оставлен исходный файл)
+        """
+        size = os.path.getsize(file_path)
+        encoded = self._encode(file_path, size)
+        if encoded is None:
+            return file_path, 0
+
+        # Запись через временный файл: output_path не остается недописанным
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_path)), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(encoded)
+            os.replace(temp_path, output_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        return output_path, size - len(encoded)
+
+    def _encode(self, source: Union[io.BytesIO, str], size: int) -> Optional[bytes]:
+        """
+        Уменьшает и кодирует изображение
+
+        Returns:
+            Новые байты или None, если перекодирование не нужно или не уменьшает файл
+        """
+        try:
+            with Image.open(source) as img:
+                fits = max(img.size) <= self.max_edge
+                if fits and (not self.target_size or size <= self.target_size):
+                    # Фото уже помещается в профиль: лишнее перекодирование только теряет качество
+                    return None
+
+                if not fits:
+                    # JPEG декодируется сразу в уменьшенном масштабе (1/2, 1/4, 1/8), не меньше нужного
+                    scale = self.max_edge / max(img.size)
+                    img.draft('RGB', (max(1, round(img.width * scale)), max(1, round(img.height * scale))))
+
+                # Цветовой профиль (например, Display P3) сохраняется, иначе цвета исказятся;
+                # профиль CMYK после преобразования в RGB уже не подходит
+                icc_profile = img.info.get('icc_profile') if img.mode != 'CMYK' else None
+                # Ориентация из EXIF применяется к пикселям: при сохранении EXIF не переносится
+                image = ImageOps.exif_transpose(img)
+                if image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                image.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+                encoded = self._encode_to_target(image, icc_profile)
+        except Exception as e:
+            logger.warning(f"Cannot re-encode image, sending it unchanged: {e}")
+            return None
+
+        if len(encoded) >= size:
+            return None
+        return encoded
+
+    def file_name(self, file_name: Optional[str]) -> Optional[str]:
+        """Имя файла с расширением формата вывода"""
+        if not file_name:
+            return None
+        return os.path.splitext(file_name)[0] + OUTPUT_EXTENSIONS[self.output_format]
+
+    def _encode_to_target(self, image: Image.Image, icc_profile: Optional[bytes] = None) -> bytes:
+        """Кодирует с качеством quality, а если файл больше target_size - подбирает качество делением пополам"""
+        encoded = self._save(image, self.quality, icc_profile)
+        if not self.target_size or len(encoded) <= self.target_size:
+            return encoded
+
+        smallest = encoded
+        low, high = self.min_quality, self.quality - 1
+        for _ in range(QUALITY_SEARCH_STEPS):
+            if low > high:
+                break
+            quality = (low + high) // 2
+            candidate = self._save(image, quality, icc_profile)
+            if len(candidate) <= self.target_size:
+                # Укладывается: пробуем качество повыше
+                encoded = candidate
+                low = quality + 1
+            else:
+                high = quality - 1
+            if len(candidate) < len(smallest):
+                smallest = candidate
+
+        # Если целевой размер недостижим даже при min_quality, берем наименьший вариант
+        return encoded if len(encoded) <= self.target_size else smallest
+
+    def _save(self, image: Image.Image, quality: int, icc_profile: Optional[bytes] = None) -> bytes:
+        output = io.BytesIO()
+        options = dict(OUTPUT_FORMATS[self.output_format])
+        if icc_profile:
+            options['icc_profile'] = icc_profile
+        image.save(output, format=self.output_format.upper(), quality=quality, **options)
+        return output.getvalue()
@@ -0,0 +1,139 @@
+import json
+import logging
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, List, Optional
+
+# Формат текстовых логов
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Формат текстовых логов процесса-воркера
+WORKER_TEXT_FORMAT = '%(asctime)s - worker %(worker)s - %(name)s - %(levelname)s - %(message)s'
+
+# Стандартные атрибуты LogRecord; все остальные пришли через extra и попадают в JSON
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'taskName'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись одной строкой JSON вместе с полями из extra"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю DEBUG-записей; записи остальных уровней проходят всегда"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+class WorkerFilter(logging.Filter):
+    """Добавляет в запись номер процесса-воркера (поле worker)"""
+
+    def __init__(self, worker: int):
+        super().__init__()
+        self.worker = worker
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.worker = self.worker
+        return True
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Кладет запись в очередь без форматирования
+
+    Стандартный QueueHandler форматирует сообщение в вызывающем потоке;
+    здесь очередь живет в том же процессе, поэтому подстановка аргументов
+    и запись на диск выполняются в потоке QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+def setup_logging(level: str = 'INFO', log_format: str = 'text', log_file: Optional[str] = None,
+                  sample_rate: float = 1.0, worker: Optional[int] = None) -> QueueListener:
+    """
+    Настраивает логирование через очередь: обработчики работают в отдельном потоке
+
+    Записи процесса-воркера (worker задан) помечаются его номером.
+
+    Returns:
+        QueueListener, который нужно остановить при завершении, чтобы дописать очередь
+    """
+    text_format = TEXT_FORMAT if worker is None else WORKER_TEXT_FORMAT
+    formatter = JsonFormatter() if log_format == 'json' else logging.Formatter(text_format)
+
+    handlers: List[logging.Handler] = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+    if worker is not None:
+        queue_handler.addFilter(WorkerFilter(worker))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(getattr(logging, level.upper()))
+
+    listener = QueueListener(log_queue, *handlers)
+    listener.start()
+    return listener
+
+
+class _ForwardHandler(logging.Handler):
+    """Передает записи дочерних процессов логгерам родительского процесса"""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        logging.getLogger(record.name).handle(record)
+
+
+def configure_child_logging(log_queue: Any, level: int) -> None:
+    """
+    Инициализатор дочернего процесса пула: записи передаются родителю через log_queue
+
+    Процесс, созданный через fork, наследует обработчик с копией очереди,
+    которую никто не читает; без замены его записи терялись бы.
+    """
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(level)
+
+
+def forward_child_logs(log_queue: Any) -> QueueListener:
+    """
+    Запускает прием записей дочерних процессов из log_queue
+
+    Returns:
+        QueueListener, который нужно остановить вместе с пулом
+    """
+    listener = QueueListener(log_queue, _ForwardHandler())
+    listener.start()
+    return listener
@@ -0,0 +1,32 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBudget:
+    """
+    Общий лимит байтов, одновременно находящихся в памяти
+
+    Резервирование не блокирует: если лимит исчерпан, вызывающий код
+    обрабатывает файл на диске, а не ждет освобождения памяти.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(0, limit)
+        self.in_use = 0
+        self.peak = 0
+
+    def try_reserve(self, size: int) -> bool:
+        """Резервирует size байт, если они помещаются в лимит"""
+        if size <= 0 or self.in_use + size > self.limit:
+            return False
+        self.in_use += size
+        self.peak = max(self.peak, self.in_use)
+        return True
+
+    def release(self, size: int) -> None:
+        """Возвращает ранее зарезервированные байты"""
+        if size > self.in_use:
+            logger.warning(f"Releasing {size} bytes with only {self.in_use} reserved")
+            size = self.in_use
+        self.in_use -= size
@@ -1,11 +1,18 @@
 import os
 import io
+import tempfile
+from typing import Optional, Set, Tuple
 from PIL import Image, ExifTags
 from exifread import process_file
 import logging
 
+from format_strippers import METADATA_OTHER, SCANNERS, STRIPPERS, StripError, detect_stream_format
+
 logger = logging.getLogger(__name__)
 
+# Форматы, которые при ошибке разбора можно перекодировать через Pillow
+PILLOW_FORMATS = {'jpeg', 'png', 'webp', 'tiff'}
+
 class MetadataCleaner:
     """Класс для очистки метаданных из медиафайлов"""
     
@@ -26,10 +33,10 @@ class MetadataCleaner:
         
         try:
             with Image.open(image_path) as img:
-                # Создаем новое изображение без EXIF данных
-                data = list(img.getdata())
-                image_without_exif = Image.new(img.mode, img.size)
-                image_without_exif.putdata(data)
+                # Создаем новое изображение без EXIF данных (копируем пиксели одним буфером)
+                image_without_exif = Image.frombytes(img.mode, img.size, img.tobytes())
+                if img.mode == 'P':
+                    image_without_exif.putpalette(img.getpalette())
                 
                 # Сохраняем без EXIF
                 image_without_exif.save(output_path, format=img.format, quality=95)
@@ -41,6 +48,97 @@ class MetadataCleaner:
             logger.error(f"Error cleaning metadata from {image_path}: {e}")
             return image_path
     
+    @staticmethod
+    def clean_image_bytes(data: bytes) -> bytes:
+        """
+        Перекодирует изображение в памяти без EXIF данных (запасной путь для поврежденных файлов)
+        
+        Returns:
+            Очищенные байты или исходные при ошибке
+        """
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                image_without_exif = Image.frombytes(img.mode, img.size, img.tobytes())
+                if img.mode == 'P':
+                    image_without_exif.putpalette(img.getpalette())
+                
+                output = io.BytesIO()
+                image_without_exif.save(output, format=img.format, quality=95)
+                return output.getvalue()
+                
+        except Exception as e:
+            logger.error(f"Error cleaning metadata from image in memory: {e}")
+            return data
+    
+    @staticmethod
+    def clean_container_metadata(file_path: str, output_path: str = None, file_format: str = None) -> str:
+        """
+        Очищает метаданные на уровне контейнера без декодирования данных
+        
+        Блоки EXIF, XMP, IPTC, теги и текстовые поля удаляются, сжатые данные копируются
+        без изменений. Поврежденные изображения перекодируются через Pillow.
+        
+        Args:
+            file_path: Путь к исходному файлу
+            output_path: Путь для сохранения очищенного файла
+            file_format: Формат файла (ключ STRIPPERS); определяется автоматически если не указан
+            
+        Returns:
+            Путь к очищенному файлу
+        """
+        if output_path is None:
+            output_path = file_path
+        if file_format is None:
+            file_format = MetadataCleaner.detect_file_format(file_path)
+        
+        try:
+            MetadataCleaner._rewrite_file(STRIPPERS[file_format], file_path, output_path)
+            logger.info(f"Metadata stripped from {file_format}: {file_path}")
+            return output_path
+        except StripError as e:
+            if file_format in PILLOW_FORMATS:
+                logger.warning(f"Cannot parse {file_format} {file_path} ({e}), falling back to re-encoding")
+                return MetadataCleaner.clean_image_metadata(file_path, output_path)
+            logger.warning(f"Cannot parse {file_format} {file_path} ({e}), sending without cleaning")
+            return file_path
+        except Exception as e:
+            logger.error(f"Error cleaning metadata from {file_path}: {e}")
+            return file_path
+    
+    @staticmethod
+    def _rewrite_file(stripper, file_path: str, output_path: str) -> None:
+        """Пишет очищенную копию во временный файл и атомарно заменяет им output_path"""
+        output_dir = os.path.dirname(os.path.abspath(output_path))
+        fd, temp_path = tempfile.mkstemp(dir=output_dir, suffix='.part')
+        try:
+            with open(file_path, 'rb') as src, os.fdopen(fd, 'w+b') as dst:
+                stripper(src, dst)
+            os.replace(temp_path, output_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+    
+    @staticmethod
+    def detect_file_format(file_path: str) -> str:
+        """Определяет формат файла по сигнатуре, а если она неизвестна - по расширению"""
+        try:
+            with open(file_path, 'rb') as f:
+                file_format = detect_stream_format(f)
+        except OSError:
+            file_format = None
+        
+        if file_format:
+            return file_format
+        
+        ext = os.path.splitext(file_path)[1].lower()
+        return {
+            '.jpg': 'jpeg', '.jpeg': 'jpeg', '.png': 'png', '.webp': 'webp',
+            '.tif': 'tiff', '.tiff': 'tiff', '.bmp': 'bmp',
+            '.mp4': 'mp4', '.m4a': 'mp4', '.mov': 'mp4', '.mp3': 'mp3',
+            '.ogg': 'ogg', '.oga': 'ogg', '.opus': 'ogg', '.flac': 'flac'
+        }.get(ext, '')
+    
     @staticmethod
     def has_exif_data(file_path: str) -> bool:
         """
@@ -60,6 +158,94 @@ class MetadataCleaner:
             logger.error(f"Error checking EXIF data in {file_path}: {e}")
             return False
     
+    @staticmethod
+    def scan_file_metadata(file_path: str, file_format: str = None) -> Optional[Set[str]]:
+        """
+        Быстро проверяет наличие метаданных, читая только заголовки контейнера
+        
+        Args:
+            file_path: Путь к файлу
+            file_format: Формат файла; определяется автоматически если не указан
+            
+        Returns:
+            Множество найденных классов метаданных (exif, gps, xmp, tags, ...)
+            или None если формат не поддерживается
+        """
+        if file_format is None:
+            file_format = MetadataCleaner.detect_file_format(file_path)
+        scanner = SCANNERS.get(file_format)
+        if scanner is None:
+            return None
+        
+        try:
+            with open(file_path, 'rb') as f:
+                return scanner(f)
+        except (StripError, OSError) as e:
+            # Файл не удалось разобрать - пусть его проверит полная очистка
+            logger.debug(f"Cannot scan {file_format} {file_path}: {e}")
+            return {METADATA_OTHER}
+    
+    @staticmethod
+    def clean_file_metadata_if_needed(file_path: str, output_path: str = None) -> Tuple[str, Optional[Set[str]]]:
+        """
+        Очищает метаданные только если проверка заголовков их нашла
+        
+        Args:
+            file_path: Путь к исходному файлу
+            output_path: Путь для сохранения очищенного файла
+            
+        Returns:
+            Путь к файлу для отправки и найденные классы метаданных
+            (пустое множество - очистка пропущена, None - формат не поддерживается)
+        """
+        file_format = MetadataCleaner.detect_file_format(file_path)
+        found = MetadataCleaner.scan_file_metadata(file_path, file_format)
+        if not found:
+            return file_path, found
+        
+        logger.debug(f"Metadata found in {file_path}: {', '.join(sorted(found))}")
+        return MetadataCleaner.clean_container_metadata(file_path, output_path, file_format), found
+    
+    @staticmethod
+    def clean_bytes_metadata_if_needed(data: bytes) -> Tuple[bytes, Optional[Set[str]]]:
+        """
+        Проверяет и при необходимости очищает файл, целиком находящийся в памяти
+        
+        Args:
+            data: Содержимое файла
+            
+        Returns:
+            Байты для отправки и найденные классы метаданных
+            (пустое множество - очистка пропущена, None - формат не поддерживается)
+        """
+        file_format = detect_stream_format(io.BytesIO(data))
+        scanner = SCANNERS.get(file_format)
+        if scanner is None:
+            return data, None
+        
+        try:
+            found = scanner(io.BytesIO(data))
+        except StripError as e:
+            logger.debug(f"Cannot scan {file_format} in memory: {e}")
+            found = {METADATA_OTHER}
+        if not found:
+            return data, found
+        
+        try:
+            output = io.BytesIO()
+            STRIPPERS[file_format](io.BytesIO(data), output)
+            logger.info(f"Metadata stripped from {file_format} in memory")
+            return output.getvalue(), found
+        except StripError as e:
+            if file_format in PILLOW_FORMATS:
+                logger.warning(f"Cannot parse {file_format} in memory ({e}), falling back to re-encoding")
+                return MetadataCleaner.clean_image_bytes(data), found
+            logger.warning(f"Cannot parse {file_format} in memory ({e}), sending without cleaning")
+            return data, found
+        except Exception as e:
+            logger.error(f"Error cleaning metadata in memory: {e}")
+            return data, found
+    
     @staticmethod
     def clean_file_metadata(file_path: str, output_path: str = None) -> str:
         """
@@ -75,18 +261,14 @@ class MetadataCleaner:
         if output_path is None:
             output_path = file_path
         
-        # Проверяем тип файла
-        file_ext = os.path.splitext(file_path)[1].lower()
+        # Проверяем тип файла: временные файлы бота не имеют расширения,
+        # поэтому формат определяется по содержимому
+        file_format = MetadataCleaner.detect_file_format(file_path)
         
-        if file_ext in ['.jpg', '.jpeg', '.png', '.tiff', '.bmp']:
-            return MetadataCleaner.clean_image_metadata(file_path, output_path)
+        if file_format in STRIPPERS:
+            return MetadataCleaner.clean_container_metadata(file_path, output_path, file_format)
         else:
-            # Для других типов файлов просто копируем
-            try:
-                with open(file_path, 'rb') as src, open(output_path, 'wb') as dst:
-                    dst.write(src.read())
-                logger.info(f"File copied without metadata cleaning: {file_path}")
-                return output_path
-            except Exception as e:
-                logger.error(f"Error copying file {file_path}: {e}")
-                return file_path
+            # BMP, GIF и прочие форматы без поддерживаемых блоков метаданных
+            # отправляются как есть, без лишнего копирования
+            logger.info(f"File left without metadata cleaning: {file_path}")
+            return file_path
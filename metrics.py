@@ -0,0 +1,364 @@
+import logging
+import math
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# Границы корзин гистограмм задержки в секундах
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    """Форматирует число в текстовом формате Prometheus"""
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Форматирует метки: {name="value",...}"""
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class _CounterChild:
+    """Значение счетчика для одного набора меток"""
+
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+    def snapshot(self) -> float:
+        return self.value
+
+    def restore(self, data: float) -> None:
+        self.value = data
+
+
+class _GaugeChild:
+    """Значение показателя для одного набора меток"""
+
+    __slots__ = ("value", "function")
+
+    def __init__(self):
+        self.value = 0.0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Значение вычисляется при каждом чтении метрик"""
+        self.function = function
+
+    def get(self) -> float:
+        return self.function() if self.function else self.value
+
+    def snapshot(self) -> float:
+        return self.get()
+
+    def restore(self, data: float) -> None:
+        self.value = data
+
+
+class _HistogramChild:
+    """Гистограмма для одного набора меток; счетчики корзин хранятся без накопления"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        return list(self.counts), self.sum, self.count
+
+    def restore(self, data: Tuple[List[int], float, int]) -> None:
+        counts, self.sum, self.count = data
+        self.counts = list(counts)
+
+
+class _Metric:
+    """Метрика с метками; значения для каждого набора меток создаются при первом обращении"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Возвращает значение метрики для набора меток"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            child = self._children[values] = self._new_child()
+        return child
+
+    def items(self) -> List[Tuple[Tuple[str, ...], object]]:
+        """Возвращает пары (значения меток, значение метрики)"""
+        return list(self._children.items())
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Возвращает значения метрики в виде, который можно передать в другой процесс"""
+        samples = []
+        for values, child in self._children.items():
+            try:
+                samples.append((values, child.snapshot()))
+            except Exception as e:
+                logger.debug(f"Cannot read metric {self.name}: {e}")
+        return {
+            "name": self.name,
+            "kind": self.kind,
+            "documentation": self.documentation,
+            "labelnames": self.labelnames,
+            "buckets": getattr(self, "bounds", None),
+            "samples": samples
+        }
+
+    def render(self) -> List[str]:
+        """Возвращает строки метрики в текстовом формате Prometheus"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _render_child(self, values: Tuple[str, ...], child) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+
+    kind = "counter"
+
+    def _new_child(self) -> _CounterChild:
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Увеличивает счетчик без меток"""
+        self.labels().inc(amount)
+
+    def _render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"]
+
+
+class Gauge(_Metric):
+    """Текущее значение (глубина очереди, число заданий в работе)"""
+
+    kind = "gauge"
+
+    def _new_child(self) -> _GaugeChild:
+        return _GaugeChild()
+
+    def set(self, value: float) -> None:
+        """Устанавливает значение без меток"""
+        self.labels().set(value)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Вычисляет значение без меток при каждом чтении метрик"""
+        self.labels().set_function(function)
+
+    def _render_child(self, values, child) -> List[str]:
+        try:
+            value = child.get()
+        except Exception as e:
+            logger.debug(f"Cannot read gauge {self.name}: {e}")
+            return []
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными корзинами"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.bounds = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramChild:
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value: float) -> None:
+        """Добавляет наблюдение без меток"""
+        self.labels().observe(value)
+
+    def _render_child(self, values, child) -> List[str]:
+        lines = []
+        names = self.labelnames + ("le",)
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), child.counts):
+            cumulative += count
+            lines.append(f"{self.name}_bucket{_format_labels(names, values + (_format_value(bound),))} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Возвращает все метрики в текстовом формате Prometheus"""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Возвращает значения всех метрик для передачи в другой процесс"""
+        return [metric.snapshot() for metric in self._metrics.values()]
+
+
+def merge_snapshots(snapshots: Dict[str, List[Dict[str, Any]]], label: str = "worker") -> MetricsRegistry:
+    """
+    Собирает снимки метрик нескольких процессов в один набор
+
+    Значения каждого процесса получают дополнительную метку label,
+    поэтому суммы по процессам считаются на стороне Prometheus.
+    """
+    registry = MetricsRegistry()
+    for process, snapshot in sorted(snapshots.items()):
+        for entry in snapshot:
+            labelnames = tuple(entry["labelnames"]) + (label,)
+            if entry["kind"] == Histogram.kind:
+                metric = registry.histogram(entry["name"], entry["documentation"], labelnames, entry["buckets"])
+            elif entry["kind"] == Gauge.kind:
+                metric = registry.gauge(entry["name"], entry["documentation"], labelnames)
+            else:
+                metric = registry.counter(entry["name"], entry["documentation"], labelnames)
+            for values, data in entry["samples"]:
+                metric.labels(*values, process).restore(data)
+    return registry
+
+
+class RelayMetrics:
+    """Метрики этапов ретрансляции"""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        self.stage_seconds = registry.histogram(
+            "relay_stage_duration_seconds", "Duration of relay stages", ("stage", "media_type")
+        )
+        self.bytes_total = registry.counter(
+            "relay_bytes_total", "Bytes downloaded and uploaded", ("direction", "media_type")
+        )
+        self.messages_total = registry.counter(
+            "relay_messages_total", "Relayed messages by outcome", ("outcome",)
+        )
+        self.errors_total = registry.counter(
+            "relay_errors_total", "Relay errors by exception class", ("stage", "exception")
+        )
+        self.cleaning_total = registry.counter(
+            "relay_metadata_cleaning_total", "Metadata checks by outcome", ("outcome",)
+        )
+        self.image_bytes_saved = registry.counter(
+            "relay_image_profile_saved_bytes_total", "Upload bytes saved by re-encoding photos"
+        )
+        self.queue_depth = registry.gauge("relay_queue_depth", "Messages waiting for a relay worker")
+        self.in_flight = registry.gauge("relay_in_flight", "Messages accepted but not yet published")
+        self.flood_queue_depth = registry.gauge(
+            "relay_flood_control_queue_depth", "Requests waiting for Telegram rate limits"
+        )
+        self.upload_cache_hit_ratio = registry.gauge("relay_upload_cache_hit_ratio", "Upload cache hit ratio")
+
+    def observe_stage(self, stage: str, media_type: str, seconds: float) -> None:
+        """Записывает длительность этапа"""
+        self.stage_seconds.labels(stage, media_type).observe(seconds)
+
+    def record_error(self, stage: str, error: BaseException) -> None:
+        """Учитывает ошибку по классу исключения"""
+        self.errors_total.labels(stage, type(error).__name__).inc()
+
+
+class MetricsServer:
+    """HTTP-сервер, отдающий метрики в формате Prometheus на /metrics"""
+
+    def __init__(self, registry: MetricsRegistry, listen: str, port: int):
+        self.registry = registry
+        self.listen = listen
+        self.port = port
+        self._runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        """Запускает сервер"""
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logger.info(f"Metrics endpoint listening on {self.listen}:{self.port}/metrics")
+
+    async def stop(self) -> None:
+        """Останавливает сервер"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.registry.render(),
+            content_type="text/plain",
+            headers={"X-Content-Type-Options": "nosniff"}
+        )
+
+
+# Глобальный экземпляр метрик
+metrics = None
+
+def get_metrics() -> RelayMetrics:
+    """Возвращает экземпляр метрик ретрансляции"""
+    global metrics
+    if metrics is None:
+        metrics = RelayMetrics(MetricsRegistry())
+    return metrics
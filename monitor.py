@@ -1,8 +1,9 @@
 import asyncio
 import logging
+import tempfile
 import time
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, List, Optional
 import json
 import os
 
@@ -11,58 +12,179 @@ from config import Config
 
 logger = logging.getLogger(__name__)
 
+# Разрешения временных рядов: формат ключа корзины, шаг и срок хранения
+SERIES_RESOLUTIONS = {
+    "minute": ("%Y-%m-%dT%H:%M", timedelta(minutes=1), timedelta(hours=24)),
+    "hour": ("%Y-%m-%dT%H", timedelta(hours=1), timedelta(days=30)),
+    "day": ("%Y-%m-%d", timedelta(days=1), timedelta(days=365))
+}
+
 class BotMonitor:
     """Система мониторинга бота"""
     
     def __init__(self, bot_token: str):
         self.bot_token = bot_token
         self.bot = Bot(token=bot_token)
-        self.stats_file = "bot_stats.json"
+        self.stats_file = Config.STATS_FILE
         self.stats = self._load_stats()
+        # Счетчики меняются в памяти и сбрасываются в файл фоновой задачей
+        self._dirty = False
+        self._flusher: Optional[asyncio.Task] = None
         
     def _load_stats(self) -> Dict:
         """Загружает статистику из файла"""
+        stats = {
+            "messages_processed": 0,
+            "errors_count": 0,
+            "last_message_time": None,
+            "uptime_start": datetime.now().isoformat(),
+            "cleaning": {"cleaned": 0, "skipped": 0, "unsupported": 0},
+            "series": {}
+        }
+        
         if os.path.exists(self.stats_file):
             try:
                 with open(self.stats_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                    stats.update(json.load(f))
             except Exception as e:
                 logger.error(f"Error loading stats: {e}")
         
-        return {
-            "messages_processed": 0,
-            "errors_count": 0,
-            "last_message_time": None,
-            "uptime_start": datetime.now().isoformat(),
-            "daily_stats": {}
-        }
+        # Старый формат: неограниченный словарь daily_stats переносится в дневной ряд
+        daily_stats = stats.pop("daily_stats", None)
+        if daily_stats:
+            day_series = stats["series"].setdefault("messages", {}).setdefault("day", {})
+            for date, count in daily_stats.items():
+                day_series[date] = day_series.get(date, 0) + count
+        
+        for metric in stats["series"].values():
+            self._prune_series(metric)
+        return stats
     
     def _save_stats(self):
-        """Сохраняет статистику в файл"""
+        """Атомарно сохраняет статистику в файл (запись во временный файл и переименование)"""
+        self._write_stats(self._snapshot())
+    
+    def _snapshot(self) -> str:
+        """Сериализует текущую статистику и сбрасывает признак изменений"""
+        self._dirty = False
+        for metric in self.stats["series"].values():
+            self._prune_series(metric)
+        return json.dumps(self.stats, ensure_ascii=False, separators=(',', ':'))
+    
+    def _write_stats(self, data: str):
+        """Записывает сериализованную статистику через временный файл"""
+        stats_dir = os.path.dirname(os.path.abspath(self.stats_file))
         try:
-            with open(self.stats_file, 'w', encoding='utf-8') as f:
-                json.dump(self.stats, f, ensure_ascii=False, indent=2)
+            fd, temp_path = tempfile.mkstemp(dir=stats_dir, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.stats_file)
+            except BaseException:
+                os.unlink(temp_path)
+                raise
         except Exception as e:
             logger.error(f"Error saving stats: {e}")
     
+    def start(self, flush_interval: float = 30.0):
+        """Запускает периодическое сохранение статистики"""
+        if self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop(flush_interval))
+    
+    async def _flush_loop(self, flush_interval: float):
+        """Сохраняет статистику, если она изменилась"""
+        while True:
+            await asyncio.sleep(flush_interval)
+            if self._dirty:
+                # Снимок делается в цикле событий, запись на диск - в отдельном потоке
+                await asyncio.to_thread(self._write_stats, self._snapshot())
+    
+    async def stop(self):
+        """Останавливает периодическое сохранение и сохраняет статистику"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        self.flush()
+    
+    def flush(self):
+        """Сохраняет статистику, если она изменилась"""
+        if self._dirty:
+            self._save_stats()
+    
+    def _record_series(self, name: str, now: datetime, count: int = 1):
+        """Увеличивает счетчик метрики в корзинах минуты, часа и дня"""
+        metric = self.stats["series"].setdefault(name, {})
+        for resolution, (key_format, _, _) in SERIES_RESOLUTIONS.items():
+            buckets = metric.setdefault(resolution, {})
+            key = now.strftime(key_format)
+            buckets[key] = buckets.get(key, 0) + count
+    
+    @staticmethod
+    def _prune_series(metric: Dict):
+        """Удаляет корзины старше срока хранения своего разрешения"""
+        now = datetime.now()
+        for resolution, (key_format, _, retention) in SERIES_RESOLUTIONS.items():
+            buckets = metric.get(resolution)
+            if not buckets:
+                continue
+            # Ключи одного формата сравниваются как строки в хронологическом порядке
+            cutoff = (now - retention).strftime(key_format)
+            for key in [key for key in buckets if key < cutoff]:
+                del buckets[key]
+    
+    def get_series(self, name: str, resolution: str = "hour", count: int = 24) -> List[Dict]:
+        """
+        Возвращает последние count корзин метрики
+        
+        Args:
+            name: Метрика (messages, errors)
+            resolution: minute, hour или day
+            count: Количество корзин, начиная с текущей
+        """
+        key_format, step, _ = SERIES_RESOLUTIONS[resolution]
+        buckets = self.stats["series"].get(name, {}).get(resolution, {})
+        now = datetime.now()
+        result = []
+        for i in range(count):
+            key = (now - step * i).strftime(key_format)
+            result.append({"time": key, "count": buckets.get(key, 0)})
+        return result
+    
     def record_message_processed(self):
         """Записывает обработанное сообщение"""
+        now = datetime.now()
         self.stats["messages_processed"] += 1
-        self.stats["last_message_time"] = datetime.now().isoformat()
-        
-        # Обновляем дневную статистику
-        today = datetime.now().strftime("%Y-%m-%d")
-        if today not in self.stats["daily_stats"]:
-            self.stats["daily_stats"][today] = 0
-        self.stats["daily_stats"][today] += 1
-        
-        self._save_stats()
+        self.stats["last_message_time"] = now.isoformat()
+        self._record_series("messages", now)
+        self._dirty = True
     
     def record_error(self, error_msg: str):
         """Записывает ошибку"""
         self.stats["errors_count"] += 1
+        self._record_series("errors", datetime.now())
+        self._dirty = True
         logger.error(f"Bot error: {error_msg}")
-        self._save_stats()
+    
+    def record_cleaning(self, outcome: str):
+        """
+        Записывает результат проверки метаданных файла
+        
+        Args:
+            outcome: cleaned - метаданные найдены и удалены, skipped - метаданных нет,
+                unsupported - формат не поддерживается очисткой
+        """
+        cleaning = self.stats.setdefault("cleaning", {"cleaned": 0, "skipped": 0, "unsupported": 0})
+        cleaning[outcome] = cleaning.get(outcome, 0) + 1
+        self._dirty = True
+    
+    def get_cleaning_skip_rate(self) -> float:
+        """Возвращает долю файлов, для которых очистка была пропущена"""
+        cleaning = self.stats.get("cleaning", {})
+        checked = cleaning.get("cleaned", 0) + cleaning.get("skipped", 0)
+        return cleaning.get("skipped", 0) / checked if checked else 0.0
     
     def get_uptime(self) -> timedelta:
         """Возвращает время работы бота"""
@@ -71,12 +193,10 @@ class BotMonitor:
     
     def get_daily_stats(self, days: int = 7) -> List[Dict]:
         """Возвращает статистику за последние дни"""
-        result = []
-        for i in range(days):
-            date = (datetime.now() - timedelta(days=i)).strftime("%Y-%m-%d")
-            count = self.stats["daily_stats"].get(date, 0)
-            result.append({"date": date, "messages": count})
-        return result
+        return [
+            {"date": bucket["time"], "messages": bucket["count"]}
+            for bucket in self.get_series("messages", "day", days)
+        ]
     
     async def check_bot_health(self) -> Dict:
         """Проверяет состояние бота"""
@@ -84,18 +204,22 @@ class BotMonitor:
             # Проверяем подключение к Telegram
             bot_info = await self.bot.get_me()
             
-            # Проверяем доступность каналов
-            source_channel = await self.bot.get_chat(Config.SOURCE_CHANNEL_ID)
-            target_channel = await self.bot.get_chat(Config.TARGET_CHANNEL_ID)
+            # Проверяем доступность каналов всех маршрутов
+            routes = Config.get_routes()
+            target_ids = list(dict.fromkeys(target for targets in routes.values() for target in targets))
+            source_channels = [await self.bot.get_chat(chat_id) for chat_id in routes]
+            target_channels = [await self.bot.get_chat(chat_id) for chat_id in target_ids]
             
             return {
                 "status": "healthy",
                 "bot_username": bot_info.username,
-                "source_channel": source_channel.title,
-                "target_channel": target_channel.title,
+                "source_channel": ", ".join(channel.title for channel in source_channels),
+                "target_channel": ", ".join(channel.title for channel in target_channels),
+                "routes": len(routes),
                 "uptime": str(self.get_uptime()),
                 "messages_processed": self.stats["messages_processed"],
-                "errors_count": self.stats["errors_count"]
+                "errors_count": self.stats["errors_count"],
+                "cleaning_skip_rate": self.get_cleaning_skip_rate()
             }
             
         except Exception as e:
@@ -121,7 +245,8 @@ class BotMonitor:
             report += f"**Статус:** {'✅ Здоров' if health['status'] == 'healthy' else '❌ Проблемы'}\n"
             report += f"**Время работы:** {health['uptime']}\n"
             report += f"**Обработано сообщений:** {health['messages_processed']}\n"
-            report += f"**Ошибок:** {health['errors_count']}\n\n"
+            report += f"**Ошибок:** {health['errors_count']}\n"
+            report += f"**Пропущено очисток (нет метаданных):** {self.get_cleaning_skip_rate():.0%}\n\n"
             
             if health['status'] == 'healthy':
                 report += f"**Исходный канал:** {health['source_channel']}\n"
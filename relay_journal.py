@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import sqlite3
+import time
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Этапы ретрансляции сообщения
+STAGE_ACCEPTED = 'accepted'
+STAGE_PUBLISHED = 'published'
+STAGE_FAILED = 'failed'
+STAGE_SKIPPED = 'skipped'
+
+
+class RelayJournal:
+    """
+    Журнал ретрансляции в SQLite (WAL, только добавление записей)
+
+    Каждое принятое сообщение записывается вместе с исходным JSON, затем
+    отмечается как опубликованное, неудачное или пропущенное. Сообщения без отметки
+    о завершении после перезапуска ставятся в конвейер повторно.
+    Записи копятся в памяти и фиксируются пачками одной транзакцией.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, flush_interval: float = 0.05,
+                 compact_threshold: int = 10000):
+        """
+        Args:
+            db_path: Путь к базе данных (None - журнал отключен)
+            flush_interval: Максимальная задержка фиксации пачки в секундах
+            compact_threshold: После скольких завершенных записей удалять их из журнала
+        """
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.compact_threshold = compact_threshold
+        self._db: Optional[sqlite3.Connection] = None
+        self._pending: List[Tuple[int, int, str, Optional[str], float]] = []
+        self._waiters: List[asyncio.Future] = []
+        self._wakeup = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._closing = False
+        self._finished_since_compact = 0
+        self.written = 0
+
+    @property
+    def enabled(self) -> bool:
+        """Журнал включен"""
+        return bool(self.db_path)
+
+    def open(self) -> List[Tuple[int, int, str]]:
+        """
+        Открывает журнал и удаляет завершенные записи
+
+        Returns:
+            Незавершенные сообщения (chat_id, message_id, JSON) в порядке приема
+        """
+        if not self.enabled:
+            return []
+
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS relay_journal ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER NOT NULL, message_id INTEGER NOT NULL, "
+            "stage TEXT NOT NULL, payload TEXT, created_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS relay_journal_message ON relay_journal (chat_id, message_id)"
+        )
+        self._db.commit()
+        self._compact()
+
+        rows = self._db.execute(
+            "SELECT chat_id, message_id, payload FROM relay_journal j "
+            "WHERE stage = ? AND NOT EXISTS ("
+            "SELECT 1 FROM relay_journal d WHERE d.chat_id = j.chat_id AND d.message_id = j.message_id "
+            "AND d.stage IN (?, ?, ?)) ORDER BY id",
+            (STAGE_ACCEPTED, STAGE_PUBLISHED, STAGE_FAILED, STAGE_SKIPPED)
+        ).fetchall()
+        if rows:
+            logger.info(f"Relay journal: {len(rows)} unfinished messages to resume")
+        return rows
+
+    def start(self) -> None:
+        """Запускает фоновую фиксацию записей"""
+        if self.enabled and self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_loop(), name="relay-journal")
+
+    def accept(self, chat_id: int, message_id: int, payload: str) -> Optional[asyncio.Future]:
+        """
+        Записывает принятое сообщение без ожидания фиксации
+
+        Returns:
+            Future, завершающийся после фиксации пачки с записью (None - журнал отключен)
+        """
+        if not self.enabled:
+            return None
+        future = asyncio.get_running_loop().create_future()
+        # Ошибка записи уже в логе; Future, который никто не ждет, не должен выводить предупреждение
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._waiters.append(future)
+        self._append(chat_id, message_id, STAGE_ACCEPTED, payload)
+        return future
+
+    async def accepted(self, chat_id: int, message_id: int, payload: str) -> None:
+        """Записывает принятое сообщение и ждет фиксации пачки с ним"""
+        future = self.accept(chat_id, message_id, payload)
+        if future is not None:
+            await future
+
+    def finished(self, chat_id: int, message_id: int, stage: str) -> None:
+        """
+        Отмечает завершение обработки сообщения без ожидания фиксации
+
+        Потеря этой отметки при сбое приводит лишь к повторной публикации.
+        """
+        if not self.enabled:
+            return
+        self._append(chat_id, message_id, stage, None)
+
+    def _append(self, chat_id: int, message_id: int, stage: str, payload: Optional[str]) -> None:
+        """Добавляет запись в очередь на фиксацию"""
+        self._pending.append((chat_id, message_id, stage, payload, time.time()))
+        self._wakeup.set()
+
+    async def _flush_loop(self) -> None:
+        """Фиксирует накопленные записи не реже раза в flush_interval"""
+        while not self._closing:
+            await self._wakeup.wait()
+            if not self._closing:
+                # Даем накопиться пачке, чтобы фиксировать ее одной транзакцией
+                await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Записывает накопленные записи одной транзакцией"""
+        self._wakeup.clear()
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, []
+        waiters, self._waiters = self._waiters, []
+        try:
+            await asyncio.to_thread(self._write_batch, batch)
+        except Exception as e:
+            logger.error(f"Error writing relay journal: {e}")
+            for future in waiters:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future in waiters:
+            if not future.done():
+                future.set_result(None)
+
+    def _write_batch(self, batch: List[Tuple[int, int, str, Optional[str], float]]) -> None:
+        """Вставляет пачку записей (выполняется в отдельном потоке)"""
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO relay_journal (chat_id, message_id, stage, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+                batch
+            )
+        self.written += len(batch)
+
+        self._finished_since_compact += sum(1 for entry in batch if entry[2] != STAGE_ACCEPTED)
+        if self._finished_since_compact >= self.compact_threshold:
+            self._compact()
+
+    def _compact(self) -> None:
+        """Удаляет все записи сообщений, обработка которых завершена"""
+        with self._db:
+            self._db.execute(
+                "DELETE FROM relay_journal WHERE (chat_id, message_id) IN ("
+                "SELECT chat_id, message_id FROM relay_journal WHERE stage IN (?, ?, ?))",
+                (STAGE_PUBLISHED, STAGE_FAILED, STAGE_SKIPPED)
+            )
+        self._finished_since_compact = 0
+
+    async def close(self) -> None:
+        """Фиксирует оставшиеся записи и закрывает журнал"""
+        if self._flusher is not None:
+            # Фоновая задача завершается после текущей пачки, не прерывая запись
+            self._closing = True
+            self._wakeup.set()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+
+        if self._db is not None:
+            await self.flush()
+            self._db.close()
+            self._db = None
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RelayJob:
+    """Задание на ретрансляцию одного сообщения"""
+
+    def __init__(self, source_chat_id: int, message_id: int, sequence: int, payload: Any):
+        self.source_chat_id = source_chat_id
+        self.message_id = message_id
+        self.sequence = sequence
+        self.payload = payload
+        self.prepared: Any = None
+        self.error: Optional[BaseException] = None
+        # Задание опубликовано или завершилось ошибкой
+        self.done = False
+
+
+class _SourceState:
+    """Буфер переупорядочивания для одного исходного канала"""
+
+    def __init__(self):
+        self.next_sequence = 0
+        self.publish_sequence = 0
+        self.ready: Dict[int, RelayJob] = {}
+        self.publishing = False
+
+
+class RelayPipeline:
+    """
+    Конвейер ретрансляции: ограниченная очередь, пул воркеров для подготовки
+    (скачивание и очистка) и публикация строго в порядке поступления из канала
+
+    Ограничение queue_size действует до публикации: подготовленные задания,
+    ожидающие своей очереди на отправку, тоже занимают место.
+    """
+
+    def __init__(
+        self,
+        prepare: Callable[[Any], Awaitable[Any]],
+        publish: Callable[[RelayJob], Awaitable[None]],
+        workers: int = 4,
+        queue_size: int = 100,
+        on_error: Optional[Callable[[RelayJob, BaseException], None]] = None,
+        discard: Optional[Callable[[Any], None]] = None,
+    ):
+        """
+        Args:
+            prepare: Подготовка задания (скачивание и очистка)
+            publish: Публикация подготовленного задания
+            workers: Число воркеров подготовки
+            queue_size: Заданий от постановки до публикации
+            on_error: Вызывается для задания, завершившегося ошибкой
+            discard: Освобождает результат подготовки, который не будет опубликован
+        """
+        self._prepare = prepare
+        self._publish = publish
+        self._on_error = on_error
+        self._discard = discard
+        self.workers_count = max(1, workers)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+        # Места для заданий от постановки до публикации
+        self._slots = asyncio.Semaphore(max(1, queue_size))
+        self._sources: Dict[int, _SourceState] = {}
+        self._workers: List[asyncio.Task] = []
+        self._worker_index = 0
+        # Сколько воркеров должно завершиться после текущего задания (уменьшение пула)
+        self._retiring = 0
+        self._released = asyncio.Event()
+        self.in_flight = 0
+
+    @property
+    def queue_depth(self) -> int:
+        """Количество заданий, ожидающих воркера"""
+        return self.queue.qsize()
+
+    def start(self) -> None:
+        """Запускает воркеры"""
+        if self._workers:
+            return
+        for _ in range(self.workers_count):
+            self._spawn_worker()
+        logger.info(f"Relay pipeline started with {self.workers_count} workers")
+
+    def resize(self, workers: int) -> None:
+        """
+        Меняет число воркеров без прерывания заданий: новые воркеры запускаются
+        сразу, лишние завершаются, закончив текущее задание
+        """
+        workers = max(1, workers)
+        self._workers = [task for task in self._workers if not task.done()]
+        running = len(self._workers) - self._retiring
+        if workers > running:
+            # Сначала отменяем еще не состоявшееся завершение воркеров
+            kept = min(self._retiring, workers - running)
+            self._retiring -= kept
+            for _ in range(workers - running - kept):
+                self._spawn_worker()
+        else:
+            self._retiring += running - workers
+        self.workers_count = workers
+
+    def _spawn_worker(self) -> None:
+        self._workers.append(asyncio.create_task(self._worker(), name=f"relay-worker-{self._worker_index}"))
+        self._worker_index += 1
+
+    async def submit(self, source_chat_id: int, message_id: int, payload: Any) -> RelayJob:
+        """
+        Ставит сообщение в очередь. Порядковый номер выдается при постановке,
+        поэтому публикация идет в порядке поступления message_id из канала.
+        Если queue_size заданий еще не опубликованы, ожидает освобождения
+        места (обратное давление), поэтому медленная публикация не дает
+        скачивать файлы далеко впереди нее.
+        """
+        # Место занимается до выдачи номера: номера выдаются в порядке получения мест
+        await self._slots.acquire()
+        state = self._sources.get(source_chat_id)
+        if state is None:
+            state = self._sources[source_chat_id] = _SourceState()
+
+        job = RelayJob(source_chat_id, message_id, state.next_sequence, payload)
+        state.next_sequence += 1
+        self.in_flight += 1
+        await self.queue.put(job)
+        return job
+
+    async def wait_in_flight_below(self, limit: int) -> None:
+        """Ожидает, пока незавершенных заданий станет меньше limit"""
+        while self.in_flight >= max(1, limit):
+            self._released.clear()
+            await self._released.wait()
+
+    async def join(self) -> None:
+        """Ожидает обработки всех заданий в очереди"""
+        await self.queue.join()
+
+    async def stop(self, timeout: Optional[float] = None) -> bool:
+        """
+        Дожидается обработки очереди (не дольше timeout секунд) и останавливает воркеры
+
+        Returns:
+            True если все задания успели завершиться
+        """
+        drained = True
+        if self._workers:
+            try:
+                await asyncio.wait_for(self.join(), timeout)
+            except asyncio.TimeoutError:
+                drained = False
+                logger.warning(f"Relay pipeline stopped with {self.in_flight} unfinished jobs")
+
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+
+        # Подготовленные, но не опубликованные задания держат временные файлы и память
+        for state in self._sources.values():
+            for job in state.ready.values():
+                if job.prepared is not None and self._discard:
+                    self._discard(job.prepared)
+            state.ready.clear()
+        return drained
+
+    @staticmethod
+    def _is_cancelled() -> bool:
+        """Отменена ли текущая задача; CancelledError из вызванного кода без отмены - обычная ошибка"""
+        task = asyncio.current_task()
+        return task is not None and task.cancelling() > 0
+
+    async def _worker(self) -> None:
+        """Воркер: подготавливает задания и передает их в буфер публикации"""
+        while True:
+            if self._retiring:
+                self._retiring -= 1
+                return
+            job = await self.queue.get()
+            try:
+                try:
+                    job.prepared = await self._prepare(job.payload)
+                except asyncio.CancelledError as e:
+                    if self._is_cancelled():
+                        raise
+                    # Иначе задание без номера в буфере остановило бы публикацию канала
+                    job.error = e
+                except Exception as e:
+                    job.error = e
+
+                await self._release(job)
+            finally:
+                self.queue.task_done()
+
+    async def _release(self, job: RelayJob) -> None:
+        """Кладет задание в буфер и публикует все готовые задания по порядку"""
+        state = self._sources[job.source_chat_id]
+        state.ready[job.sequence] = job
+
+        # Публикацию выполняет только один воркер канала; остальные оставляют
+        # готовые задания в буфере и сразу берут следующие из очереди
+        if state.publishing:
+            return
+
+        state.publishing = True
+        try:
+            while state.publish_sequence in state.ready:
+                ready_job = state.ready.pop(state.publish_sequence)
+                state.publish_sequence += 1
+                try:
+                    if ready_job.error is None:
+                        await self._publish(ready_job)
+                except asyncio.CancelledError as e:
+                    if self._is_cancelled():
+                        raise
+                    ready_job.error = e
+                except Exception as e:
+                    ready_job.error = e
+                finally:
+                    ready_job.done = True
+                    self.in_flight -= 1
+                    self._slots.release()
+                    self._released.set()
+
+                if ready_job.error is not None:
+                    self._report_error(ready_job)
+        finally:
+            state.publishing = False
+
+    def _report_error(self, job: RelayJob) -> None:
+        """Сообщает об ошибке обработки задания"""
+        if self._on_error:
+            self._on_error(job, job.error)
+        else:
+            logger.error("Error relaying message %s: %s", job.message_id, job.error)
@@ -3,6 +3,7 @@
 Скрипт запуска бота-ретранслятора
 """
 
+import argparse
 import asyncio
 import logging
 import signal
@@ -12,16 +13,8 @@ from pathlib import Path
 from telegram_bot import TelegramRelayBot
 from monitor import get_monitor
 from config import Config
-
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=getattr(logging, Config.LOG_LEVEL.upper()),
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('bot.log', encoding='utf-8')
-    ]
-)
+from logging_setup import setup_logging
+from supervisor import Supervisor
 
 logger = logging.getLogger(__name__)
 
@@ -55,9 +48,13 @@ class BotRunner:
     
     def _setup_signal_handlers(self):
         """Настраивает обработчики сигналов для корректного завершения"""
+        loop = asyncio.get_running_loop()
+        
         def signal_handler(signum, frame):
             logger.info(f"Received signal {signum}, shutting down...")
             self.running = False
+            # Бот перестает принимать обновления и дообрабатывает принятые сообщения
+            loop.call_soon_threadsafe(self.bot.request_stop)
             
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
@@ -94,13 +91,15 @@ async def main():
     """Главная функция"""
     runner = BotRunner()
     
+    # Фоновые задачи останавливаются вместе с ботом
+    background_tasks = [
+        asyncio.create_task(runner.health_check_loop()),
+        asyncio.create_task(runner.cleanup_loop())
+    ]
+    
     try:
-        # Запускаем бота и фоновые задачи
-        await asyncio.gather(
-            runner.start(),
-            runner.health_check_loop(),
-            runner.cleanup_loop()
-        )
+        # Запускаем бота
+        await runner.start()
     except KeyboardInterrupt:
         logger.info("Received keyboard interrupt, shutting down...")
     except Exception as e:
@@ -108,20 +107,68 @@ async def main():
         runner.monitor.record_error(f"Unexpected error: {e}")
     finally:
         runner.running = False
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        runner.monitor.flush()
         logger.info("Bot stopped")
 
+async def supervise(workers: int):
+    """Запускает прием обновлений и процессы-воркеры"""
+    supervisor = Supervisor(workers)
+    loop = asyncio.get_running_loop()
+    
+    # Проверка здоровья и очистка TEMP_DIR выполняются в процессе приема, как и в режиме одного процесса
+    runner = BotRunner()
+    runner.running = True
+    background_tasks = [
+        asyncio.create_task(runner.health_check_loop()),
+        asyncio.create_task(runner.cleanup_loop())
+    ]
+    
+    def signal_handler(signum, frame):
+        logger.info(f"Received signal {signum}, shutting down...")
+        # Прием останавливается, воркеры дообрабатывают принятые сообщения
+        loop.call_soon_threadsafe(supervisor.request_stop)
+    
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    
+    try:
+        await supervisor.run()
+    finally:
+        runner.running = False
+        for task in background_tasks:
+            task.cancel()
+        await asyncio.gather(*background_tasks, return_exceptions=True)
+        runner.monitor.flush()
+
 if __name__ == "__main__":
-    # Проверяем наличие .env файла
-    env_file = Path(".env")
-    if not env_file.exists():
-        logger.error("No .env file found! Please create one based on env_example.txt")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Telegram Relay Bot")
+    parser.add_argument(
+        '--workers', type=int, default=Config.WORKERS,
+        help="Number of worker processes; channels are sharded between them (default: WORKERS)"
+    )
+    args = parser.parse_args()
+    
+    # Логи пишутся из отдельного потока, цикл событий не ждет вывода на диск
+    log_listener = setup_logging(Config.LOG_LEVEL, Config.LOG_FORMAT, Config.LOG_FILE, Config.LOG_SAMPLE_RATE)
     
-    # Запускаем бота
     try:
-        asyncio.run(main())
-    except KeyboardInterrupt:
-        logger.info("Bot stopped by user")
-    except Exception as e:
-        logger.error(f"Failed to run bot: {e}")
-        sys.exit(1)
+        # Проверяем наличие .env файла
+        env_file = Path(".env")
+        if not env_file.exists():
+            logger.error("No .env file found! Please create one based on env_example.txt")
+            sys.exit(1)
+        
+        # Запускаем бота; при нескольких воркерах этот процесс только принимает обновления
+        try:
+            asyncio.run(supervise(args.workers) if args.workers > 1 else main())
+        except KeyboardInterrupt:
+            logger.info("Bot stopped by user")
+        except Exception as e:
+            logger.error(f"Failed to run bot: {e}")
+            sys.exit(1)
+    finally:
+        # Дописываем записи, оставшиеся в очереди
+        log_listener.stop()
@@ -0,0 +1,489 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from telegram import Update
+
+from catchup import MAX_BATCH_SIZE
+from config import Config
+from logging_setup import setup_logging
+from metrics import MetricsRegistry, MetricsServer, merge_snapshots
+from telegram_bot import TelegramRelayBot, build_proxy_url, create_application
+from webhook_server import WebhookServer
+
+logger = logging.getLogger(__name__)
+
+# Секунд между heartbeat воркера (вместе с ним передается снимок метрик)
+HEARTBEAT_INTERVAL = 5.0
+# Секунд между проверками состояния воркеров
+WATCH_INTERVAL = 1.0
+# Обновлений, которые воркер забирает из очереди за один раз
+RECEIVE_BATCH = 100
+# Пауза перед перезапуском упавшего воркера; удваивается при повторных падениях
+RESTART_BACKOFF = 1.0
+MAX_RESTART_BACKOFF = 60.0
+# Секунд работы, после которых воркер считается стабильным и пауза сбрасывается
+STABLE_UPTIME = 60.0
+# Секунд ожидания подтверждения разосланных обновлений при остановке
+ACK_TIMEOUT = 10.0
+# Секунд между проверками подтверждений при догоняющей обработке
+CATCHUP_ACK_INTERVAL = 0.05
+
+
+def shard_for(chat_id: int, workers: int) -> int:
+    """
+    Номер воркера для исходного канала
+
+    Не зависит от запуска: канал всегда обрабатывается одним воркером,
+    поэтому порядок публикации сохраняется, а незавершенные сообщения
+    остаются в журнале того же воркера.
+    """
+    return zlib.crc32(str(chat_id).encode()) % workers
+
+
+def worker_path(path: str, index: int) -> str:
+    """Путь к файлу воркера: relay_journal.db -> relay_journal.worker1.db"""
+    if not path:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.worker{index}{ext}"
+
+
+class WorkerChannel:
+    """Очереди между процессом приема и воркером (сторона воркера)"""
+
+    def __init__(self, index: int, inbox: multiprocessing.Queue, status: multiprocessing.Queue):
+        self.index = index
+        self.inbox = inbox
+        self.status = status
+        # Получена команда остановки: обновлений больше не будет
+        self.stopped = False
+
+    def receive(self, timeout: float) -> List[Tuple[int, str]]:
+        """
+        Ожидает пачку обновлений (блокирующий вызов, выполняется в потоке)
+
+        Returns:
+            Пары (update_id, JSON обновления); пустой список, если за timeout ничего не пришло
+        """
+        batch: List[Tuple[int, str]] = []
+        try:
+            item = self.inbox.get(timeout=timeout)
+            while True:
+                if item is None:
+                    self.stopped = True
+                    break
+                batch.append(item)
+                if len(batch) >= RECEIVE_BATCH:
+                    break
+                item = self.inbox.get_nowait()
+        except queue.Empty:
+            pass
+        return batch
+
+    def ack(self, update_ids: List[int]) -> None:
+        """Подтверждает, что обновления записаны в журнал воркера"""
+        self.status.put(('ack', self.index, update_ids))
+
+    def heartbeat(self, snapshot: List[Dict[str, Any]]) -> None:
+        """Сообщает, что цикл событий воркера работает, и передает снимок метрик"""
+        self.status.put(('heartbeat', self.index, snapshot))
+
+
+def _configure_worker(index: int, workers: int) -> None:
+    """Настройки процесса-воркера, отличающиеся от общих"""
+    # У каждого воркера свой журнал и файл статистики: SQLite журнала пишет один процесс
+    Config.JOURNAL_PATH = worker_path(Config.JOURNAL_PATH, index)
+    Config.STATS_FILE = worker_path(Config.STATS_FILE, index)
+    # /metrics воркеров отдает supervisor, накопившиеся обновления забирает процесс приема
+    Config.METRICS_PORT = 0
+    Config.CATCHUP_ENABLED = False
+    if not Config.CLEANER_WORKERS:
+        # Ядра делятся между воркерами, а не занимаются пулом очистки каждого из них
+        Config.CLEANER_WORKERS = max(1, (os.cpu_count() or 1) // workers)
+
+
+async def _heartbeat_loop(bot: TelegramRelayBot, channel: WorkerChannel) -> None:
+    """Отправляет heartbeat и останавливает воркер, если supervisor завершился"""
+    parent = os.getppid()
+    while True:
+        channel.heartbeat(bot.metrics.registry.snapshot())
+        if os.getppid() != parent:
+            logger.error("Supervisor process exited, stopping worker")
+            bot.request_stop()
+            return
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+
+async def _run_worker(channel: WorkerChannel) -> None:
+    bot = TelegramRelayBot(updates=channel)
+    heartbeat = asyncio.create_task(_heartbeat_loop(bot, channel), name="worker-heartbeat")
+    try:
+        await bot.start()
+    finally:
+        heartbeat.cancel()
+        await asyncio.gather(heartbeat, return_exceptions=True)
+        # Итоговые метрики после дообработки
+        channel.heartbeat(bot.metrics.registry.snapshot())
+
+
+def run_worker(index: int, workers: int, inbox: multiprocessing.Queue, status: multiprocessing.Queue) -> None:
+    """Точка входа процесса-воркера"""
+    # Сигналы остановки приходят всей группе процессов; воркер останавливает supervisor,
+    # когда все принятые обновления переданы, иначе они потерялись бы
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    _configure_worker(index, workers)
+    listener = setup_logging(Config.LOG_LEVEL, Config.LOG_FORMAT, Config.LOG_FILE, Config.LOG_SAMPLE_RATE, worker=index)
+    try:
+        asyncio.run(_run_worker(WorkerChannel(index, inbox, status)))
+    except Exception as e:
+        logger.error(f"Worker {index} failed: {e}")
+        raise SystemExit(1)
+    finally:
+        listener.stop()
+
+
+class _WorkerHandle:
+    """Состояние процесса-воркера на стороне supervisor"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.label = str(index)
+        self.process: Optional[multiprocessing.Process] = None
+        self.inbox: Optional[multiprocessing.Queue] = None
+        # Переданные, но еще не записанные в журнал обновления: update_id -> JSON обновления
+        self.unacked: "OrderedDict[int, str]" = OrderedDict()
+        self.started_at = 0.0
+        self.last_heartbeat = 0.0
+        # Время запланированного перезапуска (0 - воркер работает)
+        self.restart_at = 0.0
+        self.backoff = RESTART_BACKOFF
+        self.snapshot: List[Dict[str, Any]] = []
+
+    def is_up(self, heartbeat_timeout: float) -> bool:
+        return (
+            not self.restart_at and self.process is not None and self.process.is_alive()
+            and time.monotonic() - self.last_heartbeat <= heartbeat_timeout
+        )
+
+
+class _AggregatedMetrics:
+    """Метрики supervisor и последние снимки метрик воркеров для /metrics"""
+
+    def __init__(self, registry: MetricsRegistry, workers: List[_WorkerHandle]):
+        self.registry = registry
+        self.workers = workers
+
+    def render(self) -> str:
+        snapshots = {worker.label: worker.snapshot for worker in self.workers if worker.snapshot}
+        return self.registry.render() + merge_snapshots(snapshots).render()
+
+
+class Supervisor:
+    """
+    Горизонтальное масштабирование по процессам
+
+    Главный процесс получает обновления (polling или webhook) и раздает их
+    процессам-воркерам через локальные очереди, распределяя по исходному каналу:
+    все сообщения канала обрабатывает один воркер, поэтому их порядок сохраняется.
+    Воркер подтверждает обновления после записи в свой журнал; неподтвержденные
+    обновления повторно передаются воркеру после его перезапуска. Упавшие и
+    зависшие (без heartbeat) воркеры перезапускаются. Обновления, накопившиеся
+    за время простоя, до запуска приема забираются пачками getUpdates.
+    """
+
+    def __init__(self, workers: int):
+        self.config = Config()
+        self.config.validate()
+        self.routes = self.config.get_routes()
+
+        # spawn: воркер не наследует цикл событий и потоки главного процесса
+        self.context = multiprocessing.get_context('spawn')
+        self.status = self.context.Queue()
+        self.workers = [_WorkerHandle(index) for index in range(max(1, workers))]
+        self.heartbeat_timeout = self.config.WORKER_HEARTBEAT_TIMEOUT
+
+        self.application = None
+        self.webhook_server: Optional[WebhookServer] = None
+        self.metrics_server: Optional[MetricsServer] = None
+        self._stop_event = asyncio.Event()
+
+        self.registry = MetricsRegistry()
+        self.dispatched = self.registry.counter(
+            "relay_supervisor_updates_total", "Updates dispatched to worker processes", ("worker",)
+        )
+        self.restarts = self.registry.counter(
+            "relay_worker_restarts_total", "Worker process restarts", ("worker",)
+        )
+        worker_up = self.registry.gauge(
+            "relay_worker_up", "Worker process is alive and sends heartbeats", ("worker",)
+        )
+        unacked = self.registry.gauge(
+            "relay_worker_unacked_updates", "Updates dispatched to a worker and not yet journaled", ("worker",)
+        )
+        for worker in self.workers:
+            worker_up.labels(worker.label).set_function(
+                lambda worker=worker: float(worker.is_up(self.heartbeat_timeout))
+            )
+            unacked.labels(worker.label).set_function(lambda worker=worker: len(worker.unacked))
+
+    def request_stop(self) -> None:
+        """Запрашивает остановку: прием прекращается, воркеры дообрабатывают принятые сообщения"""
+        self._stop_event.set()
+
+    async def run(self) -> None:
+        """Запускает воркеры и прием обновлений, работает до запроса остановки"""
+        logger.info(f"Starting supervisor with {len(self.workers)} worker processes")
+        for worker in self.workers:
+            self._spawn(worker)
+
+        status_reader = asyncio.create_task(self._read_status(), name="supervisor-status")
+        watchdog = asyncio.create_task(self._watch_workers(), name="supervisor-watchdog")
+
+        if self.config.METRICS_PORT:
+            self.metrics_server = MetricsServer(
+                _AggregatedMetrics(self.registry, self.workers),
+                listen=self.config.METRICS_LISTEN,
+                port=self.config.METRICS_PORT
+            )
+            await self.metrics_server.start()
+
+        # Приложение только получает обновления: они читаются из update_queue без обработчиков
+        self.application = create_application(self.config, build_proxy_url(self.config))
+        await self.application.initialize()
+        dispatcher = asyncio.create_task(self._dispatch_updates(), name="supervisor-dispatch")
+        try:
+            if self.config.CATCHUP_ENABLED:
+                await self._catch_up()
+            await self._start_updates()
+            bot_info = await self.application.bot.get_me()
+            logger.info(f"Supervisor started: @{bot_info.username}")
+            await self._stop_event.wait()
+        finally:
+            await self._stop_updates()
+            dispatcher.cancel()
+            await asyncio.gather(dispatcher, return_exceptions=True)
+            # Обновления, полученные до остановки приема, тоже передаются воркерам
+            while not self.application.update_queue.empty():
+                self._dispatch(self.application.update_queue.get_nowait())
+
+            await self._wait_acked()
+            watchdog.cancel()
+            await asyncio.gather(watchdog, return_exceptions=True)
+            await self._stop_workers()
+
+            status_reader.cancel()
+            await asyncio.gather(status_reader, return_exceptions=True)
+            # Итоговые снимки метрик, отправленные воркерами при остановке
+            while True:
+                try:
+                    self._handle_status(*self.status.get_nowait())
+                except queue.Empty:
+                    break
+            if self.metrics_server is not None:
+                await self.metrics_server.stop()
+            await self.application.shutdown()
+            logger.info("Supervisor stopped")
+
+    async def _catch_up(self) -> None:
+        """Забирает накопившиеся обновления пачками и раздает их воркерам"""
+        bot = self.application.bot
+        try:
+            info = await bot.get_webhook_info()
+            if info.url:
+                # getUpdates недоступен, пока установлен webhook; накопленные обновления сохраняются
+                await bot.delete_webhook(drop_pending_updates=False)
+            if not info.pending_update_count:
+                logger.info("No pending updates, catch-up skipped")
+                return
+
+            logger.info(f"Catching up on {info.pending_update_count} pending updates")
+            started = time.monotonic()
+            batch_size = min(max(1, self.config.CATCHUP_BATCH), MAX_BATCH_SIZE)
+            offset = None
+            fetched = 0
+            drained = False
+            try:
+                while not self._stop_event.is_set():
+                    # Следующая пачка запрашивается, когда воркеры записали в журнал предыдущие:
+                    # накопленные обновления не переезжают целиком в очереди воркеров
+                    await self._wait_unacked_below(batch_size)
+                    updates = await bot.get_updates(offset=offset, limit=batch_size, timeout=0)
+                    if not updates:
+                        drained = True
+                        break
+                    offset = updates[-1].update_id + 1
+                    fetched += len(updates)
+                    for update in updates:
+                        self._dispatch(update)
+            finally:
+                if offset is not None and not drained:
+                    # Подтверждаем розданные пачки, чтобы они не пришли повторно
+                    try:
+                        await bot.get_updates(offset=offset, limit=1, timeout=0)
+                    except Exception as e:
+                        logger.warning(f"Cannot confirm caught-up updates: {e}")
+            logger.info(f"Catch-up dispatched {fetched} updates in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            # Оставшиеся обновления придут обычным путем после запуска приема
+            logger.error(f"Catch-up failed: {e}")
+
+    async def _wait_unacked_below(self, limit: int) -> None:
+        """Ожидает, пока у каждого воркера останется не больше limit неподтвержденных обновлений"""
+        while (any(len(worker.unacked) > limit for worker in self.workers)
+               and not self._stop_event.is_set()):
+            await asyncio.sleep(CATCHUP_ACK_INTERVAL)
+
+    async def _start_updates(self) -> None:
+        """Запускает прием обновлений через polling или webhook"""
+        if self.config.UPDATE_MODE != 'webhook':
+            await self.application.updater.start_polling()
+            return
+
+        self.webhook_server = WebhookServer(
+            self.application,
+            listen=self.config.WEBHOOK_LISTEN,
+            port=self.config.WEBHOOK_PORT,
+            path=self.config.WEBHOOK_PATH,
+            secret_token=self.config.WEBHOOK_SECRET
+        )
+        await self.webhook_server.start()
+
+        webhook_url = self.config.WEBHOOK_URL.rstrip('/') + self.config.WEBHOOK_PATH
+        await self.application.bot.set_webhook(url=webhook_url, secret_token=self.config.WEBHOOK_SECRET)
+        logger.info(f"Webhook set: {webhook_url}")
+
+    async def _stop_updates(self) -> None:
+        """Останавливает прием обновлений"""
+        if self.webhook_server is not None:
+            await self.webhook_server.stop()
+            self.webhook_server = None
+        elif self.application.updater.running:
+            await self.application.updater.stop()
+
+    async def _dispatch_updates(self) -> None:
+        """Раздает полученные обновления воркерам"""
+        while True:
+            update = await self.application.update_queue.get()
+            self._dispatch(update)
+
+    def _dispatch(self, update: object) -> None:
+        """Передает обновление воркеру его исходного канала"""
+        if not isinstance(update, Update):
+            return
+        message = update.message or update.channel_post
+        if not message or message.chat_id not in self.routes:
+            logger.debug("Update %s skipped: no message from a routed channel", update.update_id)
+            return
+
+        worker = self.workers[shard_for(message.chat_id, len(self.workers))]
+        payload = update.to_json()
+        worker.unacked[update.update_id] = payload
+        worker.inbox.put((update.update_id, payload))
+        self.dispatched.labels(worker.label).inc()
+
+    def _spawn(self, worker: _WorkerHandle) -> None:
+        """Запускает процесс воркера и передает ему неподтвержденные обновления"""
+        if worker.inbox is not None:
+            # Старая очередь больше не читается: ее содержимое повторяется из unacked
+            worker.inbox.cancel_join_thread()
+            worker.inbox.close()
+        worker.inbox = self.context.Queue()
+        worker.process = self.context.Process(
+            target=run_worker,
+            args=(worker.index, len(self.workers), worker.inbox, self.status),
+            name=f"relay-worker-{worker.index}"
+        )
+        worker.process.start()
+        worker.started_at = worker.last_heartbeat = time.monotonic()
+        worker.restart_at = 0.0
+        worker.snapshot = []
+
+        if worker.unacked:
+            logger.info(f"Resending {len(worker.unacked)} unacknowledged updates to worker {worker.index}")
+        for update_id, payload in worker.unacked.items():
+            worker.inbox.put((update_id, payload))
+
+    async def _read_status(self) -> None:
+        """Принимает heartbeat и подтверждения воркеров"""
+        while True:
+            try:
+                message = await asyncio.to_thread(self.status.get, True, WATCH_INTERVAL)
+            except queue.Empty:
+                continue
+            self._handle_status(*message)
+
+    def _handle_status(self, kind: str, index: int, data: Any) -> None:
+        worker = self.workers[index]
+        if kind == 'heartbeat':
+            worker.last_heartbeat = time.monotonic()
+            worker.snapshot = data
+        elif kind == 'ack':
+            for update_id in data:
+                worker.unacked.pop(update_id, None)
+
+    async def _watch_workers(self) -> None:
+        """Перезапускает завершившиеся и зависшие воркеры"""
+        while True:
+            await asyncio.sleep(WATCH_INTERVAL)
+            now = time.monotonic()
+            for worker in self.workers:
+                if worker.restart_at:
+                    if now >= worker.restart_at:
+                        logger.info(f"Restarting worker {worker.index}")
+                        self.restarts.labels(worker.label).inc()
+                        self._spawn(worker)
+                    continue
+
+                if worker.process.is_alive():
+                    if now - worker.last_heartbeat <= self.heartbeat_timeout:
+                        continue
+                    logger.error(
+                        f"Worker {worker.index} sent no heartbeat for {self.heartbeat_timeout:.0f}s, killing it"
+                    )
+                    worker.process.kill()
+                    await asyncio.to_thread(worker.process.join, 5)
+                else:
+                    logger.error(f"Worker {worker.index} exited with code {worker.process.exitcode}")
+
+                # Воркер, падающий сразу после запуска, перезапускается все реже
+                if now - worker.started_at >= STABLE_UPTIME:
+                    worker.backoff = RESTART_BACKOFF
+                worker.restart_at = now + worker.backoff
+                worker.backoff = min(worker.backoff * 2, MAX_RESTART_BACKOFF)
+
+    async def _wait_acked(self) -> None:
+        """Ожидает, пока воркеры запишут в журнал все переданные обновления"""
+        deadline = time.monotonic() + ACK_TIMEOUT
+        while any(worker.unacked for worker in self.workers) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+
+        unacked = sum(len(worker.unacked) for worker in self.workers)
+        if unacked:
+            logger.warning(f"{unacked} updates were not acknowledged by workers before shutdown")
+
+    async def _stop_workers(self) -> None:
+        """Просит воркеры остановиться и ждет дообработки принятых сообщений"""
+        for worker in self.workers:
+            if worker.process is not None and worker.process.is_alive():
+                worker.inbox.put(None)
+
+        # Воркер дообрабатывает сообщения не дольше SHUTDOWN_TIMEOUT
+        timeout = self.config.SHUTDOWN_TIMEOUT + 15
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            await asyncio.to_thread(worker.process.join, timeout)
+            if worker.process.is_alive():
+                logger.warning(f"Worker {worker.index} did not stop in time, terminating it")
+                worker.process.terminate()
+                await asyncio.to_thread(worker.process.join, 5)
@@ -1,44 +1,173 @@
 import asyncio
+import errno
+import io
+import json
 import logging
 import os
+import shutil
 import tempfile
-from typing import Optional, Union
+import time
+from contextlib import ExitStack
+from typing import TYPE_CHECKING, Awaitable, BinaryIO, Callable, Dict, List, Optional, Tuple, Union
 from pathlib import Path
 
-from telegram import Update, Message, Bot
+from telegram import (
+    Update, Message, Bot, File, InputFile,
+    InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo
+)
 from telegram.ext import Application, MessageHandler, filters, ContextTypes
 from telegram.constants import ParseMode
 from telegram.error import TelegramError
 
+from album_aggregator import Album, AlbumAggregator
+from bandwidth import BandwidthScheduler
+from catchup import BacklogCatchUp, FilePrefetcher
+from cleaning_pool import CleaningExecutor
 from config import Config
-from metadata_cleaner import MetadataCleaner
+from dedup_index import DedupIndex, content_key, file_key, perceptual_key, text_key
+from flood_control import FloodControl
+from image_profile import DOCUMENT_MIME_TYPES, ImageProfile
+from logging_setup import setup_logging
+from memory_budget import MemoryBudget
+from metrics import MetricsServer, get_metrics
+from monitor import get_monitor
+from relay_journal import STAGE_FAILED, STAGE_PUBLISHED, STAGE_SKIPPED, RelayJournal
+from relay_pipeline import RelayJob, RelayPipeline
+from upload_cache import UploadCache
+from webhook_server import WebhookServer
+
+if TYPE_CHECKING:
+    from supervisor import WorkerChannel
 
-# Настройка логирования
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=getattr(logging, Config.LOG_LEVEL.upper())
-)
 logger = logging.getLogger(__name__)
 
+# Типы медиа, которые всегда приходят в форматах, поддерживаемых очисткой
+ALWAYS_CLEANED_MEDIA_TYPES = {'photo', 'video_note', 'voice'}
+
+# MIME-типы, из которых очистка умеет удалять метаданные
+CLEANABLE_MIME_TYPES = {
+    'image/jpeg', 'image/png', 'image/webp', 'image/tiff',
+    'video/mp4', 'video/quicktime',
+    'audio/mpeg', 'audio/mp4', 'audio/x-m4a', 'audio/ogg', 'audio/flac', 'audio/x-flac',
+    'application/ogg'
+}
+
+# Типы медиа, которые можно отправить одним альбомом через send_media_group
+ALBUM_MEDIA_TYPES = {
+    'photo': InputMediaPhoto,
+    'video': InputMediaVideo,
+    'document': InputMediaDocument,
+    'audio': InputMediaAudio
+}
+
+# Секунд ожидания пачки обновлений от процесса приема (в режиме воркера)
+RECEIVE_TIMEOUT = 1.0
+
+
+def build_proxy_url(config: Config) -> Optional[str]:
+    """Возвращает URL прокси с авторизацией или None, если прокси не задан"""
+    if not config.PROXY_URL:
+        return None
+    proxy_url = config.PROXY_URL
+    if config.PROXY_USERNAME and config.PROXY_PASSWORD:
+        # Формируем URL с авторизацией
+        protocol, rest = proxy_url.split('://', 1)
+        proxy_url = f"{protocol}://{config.PROXY_USERNAME}:{config.PROXY_PASSWORD}@{rest}"
+    return proxy_url
+
+
+def create_application(config: Config, proxy_url: Optional[str]) -> Application:
+    """Создает приложение Telegram с настройками сервера Bot API и прокси"""
+    builder = Application.builder().token(config.BOT_TOKEN)
+    
+    if config.BOT_API_BASE_URL:
+        # Собственный сервер Bot API: нет лимита 20 MB на скачивание
+        base_url = config.BOT_API_BASE_URL.rstrip('/')
+        builder = builder.base_url(base_url)
+        file_url = config.BOT_API_FILE_URL
+        if not file_url and base_url.endswith('/bot'):
+            file_url = base_url[:-len('/bot')] + '/file/bot'
+        if file_url:
+            builder = builder.base_file_url(file_url.rstrip('/'))
+        # В режиме --local get_file возвращает путь к файлу на диске сервера
+        builder = builder.local_mode(config.BOT_API_LOCAL_MODE)
+        logger.info(f"Using Bot API server {base_url} (local mode: {config.BOT_API_LOCAL_MODE})")
+    
+    if proxy_url:
+        builder = builder.proxy_url(proxy_url)
+    
+    return builder.build()
+
+class PreparedMedia:
+    """Медиафайл к отправке: очищенный файл на диске или в памяти либо file_id без скачивания"""
+    
+    def __init__(self, media_type: str, file_id: str, file_unique_id: str, file_path: Optional[str] = None,
+                 source=None, cached: bool = False, data: Optional[bytes] = None,
+                 file_name: Optional[str] = None):
+        self.media_type = media_type
+        self.file_id = file_id
+        self.file_unique_id = file_unique_id
+        self.file_path = file_path
+        # Очищенное содержимое небольшого файла, обработанного в памяти
+        self.data = data
+        # Исходный объект медиа (PhotoSize, Video, ...) для повторной обработки
+        self.source = source
+        # file_id взят из кэша загрузок, а не из исходного сообщения
+        self.cached = cached
+        # Имя файла для загрузки, если оно отличается от исходного (документ перекодирован)
+        self.file_name = file_name
+        # Ключи индекса дубликатов: исходный файл и хеши очищенного содержимого
+        self.dedup_keys: List[str] = [file_key(file_unique_id)]
+
+class PreparedMessage:
+    """Сообщение, подготовленное к публикации: текст и скачанные/очищенные файлы"""
+    
+    def __init__(self, source_message: Message, text: str, parse_mode: str):
+        self.source_message = source_message
+        self.text = text
+        self.parse_mode = parse_mode
+        self.has_media = False
+        # Сообщение собрано из элементов альбома и публикуется через send_media_group
+        self.is_album = False
+        # Сообщение не требует обработки и копируется через copy_message
+        self.copy_directly = False
+        # Элементы: PreparedMedia
+        self.media: list = []
+        # Все временные файлы, которые нужно удалить после публикации
+        self.temp_files: list = []
+        # Байты из общего лимита памяти, которые нужно вернуть после публикации
+        self.reserved_bytes = 0
+        # Длительность этапов в секундах для структурированного лога
+        self.timings: dict = {}
+        # Байт, сэкономленных перекодированием фото
+        self.bytes_saved = 0
+    
+    def add_timing(self, stage: str, seconds: float) -> None:
+        """Добавляет длительность этапа (этапы нескольких файлов суммируются)"""
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
 class TelegramRelayBot:
     """Бот для ретрансляции сообщений между каналами"""
     
-    def __init__(self):
+    def __init__(self, updates: Optional["WorkerChannel"] = None):
+        """
+        Args:
+            updates: Очередь обновлений от процесса приема (режим воркера);
+                None - бот сам получает обновления через polling или webhook
+        """
         self.config = Config()
         self.config.validate()
         
+        # Таблица маршрутов: ID исходного канала -> ID целевых каналов
+        self.routes = self.config.get_routes()
+        
         # Создаем временную директорию
         self.temp_dir = Path(self.config.TEMP_DIR)
         self.temp_dir.mkdir(exist_ok=True)
         
         # Настраиваем прокси если указан (опционально для тестирования)
-        self.proxy_url = None
-        if self.config.PROXY_URL:
-            self.proxy_url = self.config.PROXY_URL
-            if self.config.PROXY_USERNAME and self.config.PROXY_PASSWORD:
-                # Формируем URL с авторизацией
-                protocol, rest = self.proxy_url.split('://', 1)
-                self.proxy_url = f"{protocol}://{self.config.PROXY_USERNAME}:{self.config.PROXY_PASSWORD}@{rest}"
+        self.proxy_url = build_proxy_url(self.config)
+        if self.proxy_url:
             logger.info(f"Using proxy: {self.proxy_url.split('@')[-1] if '@' in self.proxy_url else self.proxy_url}")
         else:
             logger.info("Running without proxy (suitable for testing)")
@@ -46,50 +175,217 @@ class TelegramRelayBot:
         # Создаем приложение с прокси
         self.application = self._create_application()
         
-    def _create_application(self) -> Application:
-        """Создает приложение Telegram с настройками прокси"""
-        builder = Application.builder().token(self.config.BOT_TOKEN)
+        # Конвейер ретрансляции: параллельная подготовка, публикация по порядку
+        self.pipeline = RelayPipeline(
+            prepare=self._prepare_message,
+            publish=self._publish_message,
+            workers=self.config.RELAY_WORKERS,
+            queue_size=self.config.RELAY_QUEUE_SIZE,
+            on_error=self._on_relay_error,
+            discard=self._release_prepared
+        )
         
-        if self.proxy_url:
-            builder = builder.proxy_url(self.proxy_url)
+        self.monitor = get_monitor()
+        
+        # Метрики этапов ретрансляции; сервер /metrics запускается, если задан METRICS_PORT
+        self.metrics = get_metrics()
+        self.metrics_server: Optional[MetricsServer] = None
+        
+        # Журнал принятых сообщений: незавершенные публикуются после перезапуска
+        self.journal = RelayJournal(
+            db_path=self.config.JOURNAL_PATH or None,
+            flush_interval=self.config.JOURNAL_FLUSH_INTERVAL
+        )
+        # Сообщения, восстановленные из журнала (повторная доставка того же update пропускается)
+        self._resumed = set()
+        # Фиксация записи о приеме: (chat_id, message_id) -> Future; публикация ждет ее перед отправкой
+        self._commits: Dict[Tuple[int, int], asyncio.Future] = {}
+        self._stop_event = asyncio.Event()
+        
+        # Сервер для приема обновлений в режиме webhook
+        self.webhook_server: Optional[WebhookServer] = None
+        
+        # В режиме воркера обновления приходят от процесса приема
+        self.updates = updates
+        self._updates_consumer: Optional[asyncio.Task] = None
+        
+        # Сборка элементов альбомов в одно задание конвейера
+        self.albums = AlbumAggregator(self.config.ALBUM_WINDOW)
         
-        return builder.build()
+        # Догоняющая обработка накопившихся обновлений при запуске
+        self.file_prefetcher = FilePrefetcher(self.config.CATCHUP_PREFETCH)
+        self.catchup: Optional[BacklogCatchUp] = None
+        
+        # Кэш загрузок: повторно публикуемые файлы отправляются по file_id
+        self.upload_cache = UploadCache(
+            capacity=self.config.UPLOAD_CACHE_SIZE,
+            db_path=self.config.UPLOAD_CACHE_DB or None
+        )
+        
+        # Индекс недавно опубликованного содержимого: повторы не загружаются
+        self.dedup = DedupIndex(
+            window=self.config.DEDUP_WINDOW,
+            capacity=self.config.DEDUP_INDEX_SIZE,
+            db_path=self.config.DEDUP_DB or None
+        )
+        
+        # Лимит памяти для файлов, которые скачиваются и очищаются без записи на диск
+        self.memory_budget = MemoryBudget(self.config.MEMORY_BUDGET)
+        
+        # Планировщик отправки с учетом лимитов Telegram
+        self.flood_control = FloodControl(
+            global_rate=self.config.FLOOD_GLOBAL_RATE,
+            chat_rate_per_minute=self.config.FLOOD_CHAT_RATE,
+            max_retries=self.config.FLOOD_MAX_RETRIES
+        )
+        
+        # Бюджеты трафика: большие файлы пропускают вперед небольшие посты
+        self.download_bandwidth = BandwidthScheduler(self.config.DOWNLOAD_BUDGET_PER_MINUTE, 'download')
+        self.upload_bandwidth = BandwidthScheduler(self.config.UPLOAD_BUDGET_PER_MINUTE, 'upload')
+        
+        # Профиль перекодирования фото: Telegram все равно уменьшает их до 2560 пикселей
+        self.image_profile = ImageProfile(
+            max_edge=self.config.IMAGE_MAX_EDGE,
+            output_format=self.config.IMAGE_FORMAT,
+            quality=self.config.IMAGE_QUALITY,
+            target_size=self.config.IMAGE_TARGET_SIZE,
+            min_quality=self.config.IMAGE_MIN_QUALITY
+        )
+        
+        # Пул для очистки метаданных, чтобы не блокировать цикл событий
+        self.cleaner = CleaningExecutor(
+            kind=self.config.CLEANER_EXECUTOR,
+            workers=self.config.CLEANER_WORKERS,
+            timeout=self.config.CLEANER_TIMEOUT
+        )
+        
+        # Показатели очередей вычисляются при чтении метрик
+        self.metrics.queue_depth.set_function(lambda: self.pipeline.queue_depth)
+        self.metrics.in_flight.set_function(lambda: self.pipeline.in_flight)
+        self.metrics.flood_queue_depth.set_function(lambda: self.flood_control.queue_depth)
+        self.metrics.upload_cache_hit_ratio.set_function(lambda: self.upload_cache.hit_rate)
+        
+    def _create_application(self) -> Application:
+        """Создает приложение Telegram с настройками прокси"""
+        return create_application(self.config, self.proxy_url)
     
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Обрабатывает входящие сообщения из исходного канала"""
-        # Логируем все обновления для отладки
-        logger.info(f"Received update: {update}")
-        logger.info(f"Update type: {update.message is not None and 'message' or 'no message'}")
-        
         # Получаем сообщение из update (может быть message или channel_post)
         message = update.message or update.channel_post
         
         if not message:
-            logger.warning("No message in update")
+            logger.warning("No message in update %s", update.update_id)
             return
         
-        # Логируем все входящие сообщения
-        logger.info(f"Received message from chat_id: {message.chat_id}, expected: {self.config.SOURCE_CHANNEL_ID}")
-        logger.info(f"Message type: {message.chat.type}, Message ID: {message.message_id}")
+        # Запись на каждое обновление: форматируется только если DEBUG включен и попал в выборку
+        logger.debug(
+            "Received update %s: message %s from chat %s", update.update_id, message.message_id, message.chat_id,
+            extra={'update_id': update.update_id, 'message_id': message.message_id, 'chat_id': message.chat_id}
+        )
         
-        # Проверяем, что сообщение из нужного канала
-        if str(message.chat_id) != str(self.config.SOURCE_CHANNEL_ID):
-            logger.debug(f"Message from unexpected channel: {message.chat_id}, expected: {self.config.SOURCE_CHANNEL_ID}")
+        if not self._should_relay(message):
             return
         
-        logger.info(f"Processing message from source channel: {message.message_id}")
+        # Запись в журнал фиксируется пачкой в фоне: прием следующих обновлений ее не ждет,
+        # а публикация начинается только после фиксации
+        commit = self.journal.accept(message.chat_id, message.message_id, message.to_json())
+        if commit is not None:
+            self._commits[(message.chat_id, message.message_id)] = commit
+        await self._enqueue_message(message)
+    
+    def _should_relay(self, message: Message) -> bool:
+        """Проверяет, что сообщение пришло из канала маршрута и еще не восстановлено из журнала"""
+        # Проверяем, что сообщение из исходного канала одного из маршрутов
+        if message.chat_id not in self.routes:
+            logger.debug("Message from unexpected channel: %s", message.chat_id)
+            return False
         
-        try:
-            # Копируем сообщение в целевой канал
-            await self._copy_message_to_target(message)
-            logger.info(f"Successfully copied message {message.message_id}")
-            
-        except Exception as e:
-            logger.error(f"Error copying message {message.message_id}: {e}")
+        if (message.chat_id, message.message_id) in self._resumed:
+            logger.info("Message %s already resumed from journal, skipping", message.message_id)
+            return False
+        return True
     
-    async def _copy_message_to_target(self, source_message: Message) -> None:
-        """Копирует сообщение в целевой канал с полным копированием контента"""
+    async def _accept_batch(self, messages: List[Message]) -> List[Message]:
+        """Отбирает сообщения для ретрансляции и фиксирует их в журнале одной пачкой"""
+        accepted = [message for message in messages if self._should_relay(message)]
+        await asyncio.gather(
+            *(self.journal.accepted(message.chat_id, message.message_id, message.to_json()) for message in accepted)
+        )
+        return accepted
+    
+    async def _enqueue_message(self, message: Message) -> Optional[RelayJob]:
+        """
+        Ставит сообщение или альбом в конвейер ретрансляции
+        
+        Returns:
+            Задание конвейера или None, если сообщение добавлено к уже поставленному альбому
+        """
+        if message.media_group_id:
+            # Элемент альбома: в конвейер ставится только первый элемент,
+            # остальные добавляются к уже поставленному альбому
+            album = self.albums.add(message)
+            if album is None:
+                return None
+            return await self.pipeline.submit(message.chat_id, message.message_id, album)
         
+        # Ставим сообщение в конвейер; при переполненной очереди ждем (обратное давление)
+        return await self.pipeline.submit(message.chat_id, message.message_id, message)
+    
+    def _job_messages(self, job: RelayJob) -> List[Message]:
+        """Исходные сообщения задания"""
+        return job.payload.messages if isinstance(job.payload, Album) else [job.payload]
+    
+    async def _wait_committed(self, job: RelayJob) -> None:
+        """Ждет фиксации записей о приеме сообщений задания в журнале"""
+        commits = [self._commits.pop((message.chat_id, message.message_id), None) for message in self._job_messages(job)]
+        commits = [commit for commit in commits if commit is not None]
+        if commits:
+            await asyncio.gather(*commits)
+    
+    def _on_relay_error(self, job: RelayJob, error: BaseException) -> None:
+        """Обрабатывает ошибку ретрансляции сообщения"""
+        for message in self._job_messages(job):
+            self._commits.pop((message.chat_id, message.message_id), None)
+        self.monitor.record_error(f"Error copying message {job.message_id}: {error}")
+        self.metrics.record_error('relay', error)
+        self.metrics.messages_total.labels('failed').inc()
+        self._finish_job(job, STAGE_FAILED)
+    
+    def _finish_job(self, job: RelayJob, stage: str) -> None:
+        """Отмечает в журнале завершение обработки всех сообщений задания"""
+        for message in self._job_messages(job):
+            self.journal.finished(message.chat_id, message.message_id, stage)
+    
+    async def _resume_pending(self, pending: list) -> None:
+        """Ставит в конвейер сообщения, не завершенные до перезапуска"""
+        for chat_id, message_id, payload in pending:
+            try:
+                message = Message.de_json(json.loads(payload), self.application.bot)
+            except Exception as e:
+                logger.error(f"Cannot restore message {message_id} from journal: {e}")
+                self.journal.finished(chat_id, message_id, STAGE_FAILED)
+                continue
+            
+            self._resumed.add((chat_id, message_id))
+            await self._enqueue_message(message)
+    
+    def request_stop(self) -> None:
+        """Запрашивает остановку бота с дообработкой принятых сообщений"""
+        self._stop_event.set()
+    
+    async def _prepare_message(self, source_message: Union[Message, Album]) -> PreparedMessage:
+        """Подготавливает сообщение: скачивает медиафайлы и очищает метаданные"""
+        started = time.perf_counter()
+        if isinstance(source_message, Album):
+            prepared = await self._prepare_album(source_message)
+        else:
+            prepared = await self._prepare_single_message(source_message)
+        prepared.add_timing('prepare', time.perf_counter() - started)
+        return prepared
+    
+    async def _prepare_single_message(self, source_message: Message) -> PreparedMessage:
+        """Подготавливает одиночное сообщение"""
         # Получаем бота из контекста
         bot = self.application.bot
         
@@ -97,87 +393,416 @@ class TelegramRelayBot:
         text = source_message.text or source_message.caption or ""
         parse_mode = getattr(source_message, 'parse_mode', None) or ParseMode.HTML
         
+        prepared = PreparedMessage(source_message, text, parse_mode)
+        
         # Обрабатываем медиафайлы
+        media_files = self._extract_media(source_message)
+        
+        # Обрабатываем медиафайлы если они есть
+        if media_files:
+            prepared.has_media = True
+            if not any(self._needs_cleaning(media_type, media) for media_type, media in media_files):
+                # Очищать нечего: копируем сообщение на стороне Telegram без скачивания
+                prepared.copy_directly = True
+            else:
+                try:
+                    await self._process_media_files(bot, media_files, prepared)
+                except BaseException:
+                    # Уже скачанные файлы и зарезервированная память иначе остались бы занятыми
+                    self._release_prepared(prepared)
+                    raise
+        
+        return prepared
+    
+    async def _prepare_album(self, album: Album) -> PreparedMessage:
+        """Дожидается всех элементов альбома и параллельно готовит их медиафайлы"""
+        bot = self.application.bot
+        messages = await album.wait_closed()
+        
+        # Подпись альбома хранится в одном из элементов, обычно в первом
+        caption_message = next((message for message in messages if message.caption), messages[0])
+        parse_mode = getattr(caption_message, 'parse_mode', None) or ParseMode.HTML
+        
+        prepared = PreparedMessage(messages[0], caption_message.caption or "", parse_mode)
+        prepared.is_album = True
+        prepared.has_media = True
+        
+        media_files = [item for message in messages for item in self._extract_media(message)]
+        try:
+            results = await asyncio.gather(
+                *(self._prepare_media(bot, media_type, media, prepared) for media_type, media in media_files)
+            )
+        except BaseException:
+            self._release_prepared(prepared)
+            raise
+        prepared.media = [media for media in results if media]
+        
+        return prepared
+    
+    @staticmethod
+    def _extract_media(message: Message) -> list:
+        """Возвращает медиафайлы сообщения в виде списка (тип, объект медиа)"""
         media_files = []
         
-        if source_message.photo:
+        if message.photo:
             # Обрабатываем фото
-            photo = source_message.photo[-1]  # Берем самое большое фото
-            media_files.append(('photo', photo.file_id, photo.file_unique_id))
+            photo = message.photo[-1]  # Берем самое большое фото
+            media_files.append(('photo', photo))
             
-        elif source_message.video:
+        elif message.video:
             # Обрабатываем видео
-            video = source_message.video
-            media_files.append(('video', video.file_id, video.file_unique_id))
+            video = message.video
+            media_files.append(('video', video))
             
-        elif source_message.document:
+        elif message.document:
             # Обрабатываем документ
-            document = source_message.document
-            media_files.append(('document', document.file_id, document.file_unique_id))
+            document = message.document
+            media_files.append(('document', document))
             
-        elif source_message.animation:
+        elif message.animation:
             # Обрабатываем GIF/анимацию
-            animation = source_message.animation
-            media_files.append(('animation', animation.file_id, animation.file_unique_id))
+            animation = message.animation
+            media_files.append(('animation', animation))
             
-        elif source_message.video_note:
+        elif message.video_note:
             # Обрабатываем видеосообщение
-            video_note = source_message.video_note
-            media_files.append(('video_note', video_note.file_id, video_note.file_unique_id))
+            video_note = message.video_note
+            media_files.append(('video_note', video_note))
             
-        elif source_message.voice:
+        elif message.voice:
             # Обрабатываем голосовое сообщение
-            voice = source_message.voice
-            media_files.append(('voice', voice.file_id, voice.file_unique_id))
+            voice = message.voice
+            media_files.append(('voice', voice))
             
-        elif source_message.audio:
+        elif message.audio:
             # Обрабатываем аудио
-            audio = source_message.audio
-            media_files.append(('audio', audio.file_id, audio.file_unique_id))
+            audio = message.audio
+            media_files.append(('audio', audio))
         
-        # Обрабатываем медиафайлы если они есть
-        if media_files:
-            await self._process_media_files(bot, media_files, text, parse_mode)
-        else:
-            # Отправляем только текст
-            await bot.send_message(
-                chat_id=self.config.TARGET_CHANNEL_ID,
-                text=text,
-                parse_mode=parse_mode
+        return media_files
+    
+    def _media_file_ids(self, message: Message) -> List[str]:
+        """file_id медиа сообщения, которые будут скачиваться для очистки"""
+        return [
+            media.file_id for media_type, media in self._extract_media(message)
+            if self._needs_cleaning(media_type, media)
+            and not (media.file_size and media.file_size > self.config.MAX_FILE_SIZE)
+        ]
+    
+    def _needs_cleaning(self, media_type: str, media) -> bool:
+        """Решает, нужно ли скачивать медиафайл для очистки метаданных"""
+        if not self.config.ENABLE_METADATA_CLEANING:
+            return False
+        if media_type in ALWAYS_CLEANED_MEDIA_TYPES:
+            return True
+        
+        # Без известного MIME-типа формат можно определить только по содержимому
+        mime_type = getattr(media, 'mime_type', None)
+        if not mime_type or mime_type == 'application/octet-stream':
+            return True
+        return mime_type in CLEANABLE_MIME_TYPES
+    
+    async def _publish_message(self, job: RelayJob) -> None:
+        """Публикует подготовленное сообщение во все целевые каналы маршрута"""
+        prepared: PreparedMessage = job.prepared
+        bot = self.application.bot
+        source = prepared.source_message
+        targets = self.routes.get(source.chat_id, [])
+        dedup_parts = self._dedup_parts(prepared) if self.dedup.enabled else []
+        # Повтором считается только содержимое, уже опубликованное в те же целевые каналы
+        dedup_scope = ','.join(str(chat_id) for chat_id in sorted(targets))
+        # Медиафайлы, действительно отправленные в целевые каналы (None - пост отправлен целиком)
+        sent_media: Optional[List[PreparedMedia]] = None
+        
+        try:
+            # Сообщение публикуется только после записи в журнал: при сбое оно будет восстановлено
+            await self._wait_committed(job)
+            started = time.perf_counter()
+            if not targets:
+                logger.warning("No route for channel %s, message %s skipped", source.chat_id, job.message_id)
+            elif await self.dedup.is_duplicate(dedup_parts, dedup_scope):
+                # Повтор недавно опубликованного поста отбрасывается до загрузки
+                logger.info("Message %s duplicates recently published content, skipped", job.message_id)
+                self.metrics.messages_total.labels('duplicate').inc()
+                self._finish_job(job, STAGE_SKIPPED)
+                return
+            elif prepared.copy_directly:
+                # Копируем сообщение целиком, подпись и ее разметка сохраняются
+                await self._send_to_targets(targets, lambda chat_id: self._copy_to_target(bot, chat_id, source))
+            elif prepared.is_album:
+                sent_media = await self._publish_album(bot, targets, prepared)
+            elif prepared.has_media:
+                sent_media = await self._publish_each(bot, targets, prepared, first_caption_only=False)
+            else:
+                # Отправляем только текст
+                await self._send_to_targets(targets, lambda chat_id: self._send_text_to_target(bot, chat_id, prepared))
+            
+            prepared.add_timing('publish', time.perf_counter() - started)
+            if self.dedup.enabled:
+                # Запоминаются только отправленные части: неотправленный файл можно будет опубликовать повторно
+                self.dedup.remember(
+                    dedup_parts if sent_media is None else self._dedup_parts(prepared, sent_media), dedup_scope
+                )
+            logger.info(
+                "Successfully copied message %s", job.message_id,
+                extra={
+                    'message_id': job.message_id,
+                    'chat_id': source.chat_id,
+                    'stage_ms': {stage: round(seconds * 1000, 1) for stage, seconds in prepared.timings.items()},
+                    'bytes_saved': prepared.bytes_saved
+                }
             )
+            self.monitor.record_message_processed()
+            self.metrics.messages_total.labels('published').inc()
+            self._finish_job(job, STAGE_PUBLISHED)
+        finally:
+            self._release_prepared(prepared)
+    
+    def _release_prepared(self, prepared: PreparedMessage) -> None:
+        """Удаляет временные файлы подготовленного сообщения и освобождает его память"""
+        self._cleanup_temp_files(prepared.temp_files)
+        prepared.temp_files = []
+        for media in prepared.media:
+            media.data = None
+        self.memory_budget.release(prepared.reserved_bytes)
+        prepared.reserved_bytes = 0
     
-    async def _process_media_files(self, bot: Bot, media_files: list, caption: str, parse_mode: str) -> None:
-        """Обрабатывает медиафайлы с очисткой метаданных"""
+    def _dedup_parts(self, prepared: PreparedMessage,
+                     media_items: Optional[List[PreparedMedia]] = None) -> List[List[str]]:
+        """
+        Части поста для индекса дубликатов: ключи каждого медиафайла и нормализованного текста
         
-        for media_type, file_id, file_unique_id in media_files:
-            try:
-                # Скачиваем файл
-                file_path = await self._download_file(bot, file_id, media_type)
-                
-                if not file_path:
-                    logger.error(f"Failed to download {media_type}: {file_id}")
-                    continue
-                
-                # Очищаем метаданные если включено
-                if self.config.ENABLE_METADATA_CLEANING:
-                    cleaned_path = self._clean_file_metadata(file_path)
-                else:
-                    cleaned_path = file_path
-                
-                # Отправляем файл в целевой канал
-                await self._send_media_to_target(bot, media_type, cleaned_path, caption, parse_mode)
-                
-                # Удаляем временные файлы
-                self._cleanup_temp_files([file_path, cleaned_path])
+        Args:
+            media_items: Учитываемые медиафайлы (None - все медиафайлы поста)
+        """
+        if prepared.copy_directly:
+            # Файлы не скачивались: известен только исходный файл Telegram
+            parts = [[file_key(media.file_unique_id)] for _, media in self._extract_media(prepared.source_message)]
+        else:
+            parts = [media.dedup_keys for media in (prepared.media if media_items is None else media_items)]
+        
+        key = text_key(prepared.text) if self.config.DEDUP_TEXT and prepared.text else None
+        if key:
+            parts.append([key])
+        return parts
+    
+    async def _add_content_keys(self, prepared_media: PreparedMedia, content: Union[bytes, str]) -> None:
+        """Добавляет к ключам медиафайла хеш очищенного содержимого и dHash для фото"""
+        def compute() -> List[str]:
+            keys = [content_key(content)]
+            if prepared_media.media_type == 'photo' and self.config.DEDUP_PERCEPTUAL:
+                key = perceptual_key(content)
+                if key:
+                    keys.append(key)
+            return keys
+        
+        started = time.perf_counter()
+        prepared_media.dedup_keys.extend(await asyncio.to_thread(compute))
+        self.metrics.observe_stage('hash', prepared_media.media_type, time.perf_counter() - started)
+    
+    async def _process_media_files(self, bot: Bot, media_files: list, prepared: PreparedMessage) -> None:
+        """Скачивает медиафайлы и очищает метаданные"""
+        
+        for media_type, media in media_files:
+            prepared_media = await self._prepare_media(bot, media_type, media, prepared)
+            if prepared_media:
+                prepared.media.append(prepared_media)
+    
+    async def _prepare_media(self, bot: Bot, media_type: str, media, prepared: PreparedMessage,
+                             use_cache: bool = True) -> Optional[PreparedMedia]:
+        """Готовит один медиафайл: из кэша загрузок, по file_id или скачиванием с очисткой"""
+        file_id = media.file_id
+        
+        if not self._needs_cleaning(media_type, media):
+            # Файл не требует очистки: отправляем по file_id без скачивания
+            return PreparedMedia(media_type, file_id, media.file_unique_id, source=media)
+        
+        if use_cache:
+            cached_file_id = await self.upload_cache.get(media.file_unique_id)
+            if cached_file_id:
+                # Очищенная копия уже загружалась: скачивание и очистка не нужны
+                return PreparedMedia(media_type, cached_file_id, media.file_unique_id, source=media, cached=True)
+        
+        try:
+            # Размер известен из сообщения: слишком большой файл не запрашиваем вовсе
+            if self._is_too_large(media.file_size, file_id):
+                return None
+            
+            # Во время догоняющей обработки get_file обычно уже выполнен заранее
+            file = await self.file_prefetcher.get_file(bot, file_id)
+            if self._is_too_large(file.file_size, file_id):
+                return None
+            
+            # Локальный сервер Bot API отдает путь к файлу: он уже на диске и не скачивается
+            local = self._is_local_file(file)
+            if not local:
+                await self.download_bandwidth.acquire(file.file_size or media.file_size)
+            
+            if not local and self._reserve_memory(file.file_size, prepared):
+                # Небольшой файл: скачиваем, очищаем и отправляем из памяти
+                started = time.perf_counter()
+                data = await self._download_to_memory(file, file_id)
+                if data is None:
+                    logger.error("Failed to download %s: %s", media_type, file_id)
+                    return None
+                self._observe_transfer('download', media_type, started, len(data), prepared)
                 
-            except Exception as e:
-                logger.error(f"Error processing {media_type} {file_id}: {e}")
+                started = time.perf_counter()
+                cleaned_data = await self._clean_bytes_metadata(data)
+                self._observe_stage('clean', media_type, started, prepared)
+                file_name = None
+                if self._uses_image_profile(media_type, media):
+                    profiled_data = await self._apply_image_profile(cleaned_data, file_id, media_type, prepared)
+                    if profiled_data is not cleaned_data:
+                        cleaned_data, file_name = profiled_data, self._profiled_file_name(media_type, media)
+                prepared_media = PreparedMedia(media_type, file_id, media.file_unique_id, source=media, data=cleaned_data,
+                                               file_name=file_name)
+                if self.dedup.enabled:
+                    await self._add_content_keys(prepared_media, cleaned_data)
+                return prepared_media
+            
+            # Скачиваем файл
+            started = time.perf_counter()
+            file_path = await self._download_file(file, file_id, media_type)
+            
+            if not file_path:
+                logger.error("Failed to download %s: %s", media_type, file_id)
+                return None
+            self._observe_transfer('download', media_type, started, os.path.getsize(file_path), prepared)
+            
+            # Очищаем метаданные
+            started = time.perf_counter()
+            cleaned_path = await self._clean_file_metadata(file_path)
+            self._observe_stage('clean', media_type, started, prepared)
+            prepared.temp_files.extend([file_path, cleaned_path])
+            
+            file_name = None
+            if self._uses_image_profile(media_type, media):
+                profiled_path = await self._apply_image_profile(cleaned_path, file_id, media_type, prepared)
+                if profiled_path != cleaned_path:
+                    prepared.temp_files.append(profiled_path)
+                    cleaned_path, file_name = profiled_path, self._profiled_file_name(media_type, media)
+            prepared_media = PreparedMedia(media_type, file_id, media.file_unique_id, cleaned_path, source=media,
+                                           file_name=file_name)
+            if self.dedup.enabled:
+                await self._add_content_keys(prepared_media, cleaned_path)
+            return prepared_media
+            
+        except Exception as e:
+            logger.error("Error processing %s %s: %s", media_type, file_id, e)
+            self.metrics.record_error('prepare', e)
+            return None
+    
+    def _uses_image_profile(self, media_type: str, media) -> bool:
+        """Перекодируются фото и, если включено IMAGE_DOCUMENTS, JPEG-документы"""
+        if not self.image_profile.enabled:
+            return False
+        if media_type == 'photo':
+            return True
+        return (media_type == 'document' and self.config.IMAGE_DOCUMENTS
+                and getattr(media, 'mime_type', None) in DOCUMENT_MIME_TYPES)
+    
+    def _profiled_file_name(self, media_type: str, media) -> Optional[str]:
+        """Имя перекодированного документа с расширением нового формата"""
+        if media_type != 'document':
+            return None
+        return self.image_profile.file_name(getattr(media, 'file_name', None) or media_type)
     
-    async def _download_file(self, bot: Bot, file_id: str, media_type: str) -> Optional[str]:
-        """Скачивает файл с серверов Telegram"""
+    async def _apply_image_profile(self, content: Union[bytes, str], file_id: str, media_type: str,
+                                   prepared: PreparedMessage) -> Union[bytes, str]:
+        """Уменьшает и перекодирует очищенное изображение в пуле воркеров; content - байты или путь к файлу"""
+        started = time.perf_counter()
         try:
-            file = await bot.get_file(file_id)
+            if isinstance(content, bytes):
+                result, saved = await self.cleaner.run(self.image_profile.reencode_bytes, content)
+            else:
+                result, saved = await self.cleaner.run(self.image_profile.reencode_file, content, content + "_profiled")
+        except Exception as e:
+            logger.error("Error re-encoding %s %s: %s", media_type, file_id, e)
+            self.metrics.record_error('reencode', e)
+            return content
+        self._observe_stage('reencode', media_type, started, prepared)
+        
+        if saved:
+            logger.info("%s %s re-encoded, %s bytes saved", media_type.capitalize(), file_id, saved,
+                        extra={'bytes_saved': saved})
+            self.metrics.image_bytes_saved.inc(saved)
+            prepared.bytes_saved += saved
+        return result
+    
+    def _observe_stage(self, stage: str, media_type: str, started: float,
+                       prepared: Optional[PreparedMessage] = None) -> None:
+        """Записывает длительность этапа в метрики и в тайминги сообщения"""
+        seconds = time.perf_counter() - started
+        self.metrics.observe_stage(stage, media_type, seconds)
+        if prepared is not None:
+            prepared.add_timing(stage, seconds)
+    
+    def _observe_transfer(self, direction: str, media_type: str, started: float, size: int,
+                          prepared: Optional[PreparedMessage] = None) -> None:
+        """Записывает длительность и объем скачивания или загрузки"""
+        self._observe_stage(direction, media_type, started, prepared)
+        self.metrics.bytes_total.labels(direction, media_type).inc(size)
+    
+    def _is_local_file(self, file: File) -> bool:
+        """Проверяет, что file_path указывает на файл локального сервера Bot API"""
+        return (
+            self.config.BOT_API_LOCAL_MODE
+            and bool(file.file_path)
+            and os.path.isabs(file.file_path)
+            and os.path.isfile(file.file_path)
+        )
+    
+    def _is_too_large(self, file_size: Optional[int], file_id: str) -> bool:
+        """Проверяет известный до скачивания размер файла"""
+        if file_size and file_size > self.config.MAX_FILE_SIZE:
+            logger.warning("File too large, skipping download of %s: %s bytes", file_id, file_size)
+            return True
+        return False
+    
+    def _reserve_memory(self, file_size: Optional[int], prepared: PreparedMessage) -> bool:
+        """Резервирует память под файл, если он не больше порога и помещается в общий лимит"""
+        if not file_size or file_size > self.config.MEMORY_SPILL_THRESHOLD:
+            return False
+        if not self.memory_budget.try_reserve(file_size):
+            logger.debug("Memory budget exhausted (%s bytes in use), using disk", self.memory_budget.in_use)
+            return False
+        prepared.reserved_bytes += file_size
+        return True
+    
+    async def _download_to_memory(self, file: File, file_id: str) -> Optional[bytes]:
+        """Скачивает файл с серверов Telegram в память"""
+        try:
+            buffer = io.BytesIO()
+            await file.download_to_memory(buffer)
             
+            # Проверяем размер файла
+            file_size = buffer.tell()
+            if file_size > self.config.MAX_FILE_SIZE:
+                logger.warning("File too large: %s bytes", file_size)
+                return None
+            
+            return buffer.getvalue()
+            
+        except Exception as e:
+            logger.error("Error downloading file %s: %s", file_id, e)
+            self.metrics.record_error('download', e)
+            return None
+    
+    @staticmethod
+    def _link_or_copy(source: str, destination: str) -> None:
+        """Создает жесткую ссылку на файл, а если это невозможно (другая ФС, запрет ссылок) - копию"""
+        os.unlink(destination)
+        try:
+            os.link(source, destination)
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM):
+                raise
+            shutil.copyfile(source, destination)
+    
+    async def _download_file(self, file: File, file_id: str, media_type: str) -> Optional[str]:
+        """Скачивает файл с серверов Telegram или связывает файл локального сервера Bot API с temp_dir"""
+        try:
             # Создаем временный файл
             temp_file = tempfile.NamedTemporaryFile(
                 dir=self.temp_dir,
@@ -187,91 +812,382 @@ class TelegramRelayBot:
             temp_path = temp_file.name
             temp_file.close()
             
-            # Скачиваем файл
-            await file.download_to_drive(temp_path)
+            if self._is_local_file(file):
+                # Очистка только читает исходный файл и пишет результат в новый, а удаление
+                # временного пути убирает лишь ссылку: файл сервера не меняется
+                await asyncio.to_thread(self._link_or_copy, file.file_path, temp_path)
+            else:
+                # Скачиваем файл
+                await file.download_to_drive(temp_path)
             
             # Проверяем размер файла
             file_size = os.path.getsize(temp_path)
             if file_size > self.config.MAX_FILE_SIZE:
-                logger.warning(f"File too large: {file_size} bytes")
+                logger.warning("File too large: %s bytes", file_size)
                 os.unlink(temp_path)
                 return None
             
             return temp_path
             
         except Exception as e:
-            logger.error(f"Error downloading file {file_id}: {e}")
+            logger.error("Error downloading file %s: %s", file_id, e)
+            self.metrics.record_error('download', e)
             return None
     
-    def _clean_file_metadata(self, file_path: str) -> str:
-        """Очищает метаданные из файла"""
+    async def _clean_file_metadata(self, file_path: str) -> str:
+        """Очищает метаданные из файла в пуле воркеров"""
         try:
             # Создаем путь для очищенного файла
             cleaned_path = file_path + "_cleaned"
             
-            # Очищаем метаданные
-            return MetadataCleaner.clean_file_metadata(file_path, cleaned_path)
+            # Проверяем заголовки и очищаем метаданные только если они есть
+            result_path, found = await self.cleaner.clean_file(file_path, cleaned_path)
+            self._record_cleaning(found)
+            return result_path
             
+        except asyncio.TimeoutError as e:
+            logger.error("Timed out cleaning metadata from %s", file_path)
+            self.metrics.record_error('clean', e)
+            return file_path
         except Exception as e:
-            logger.error(f"Error cleaning metadata from {file_path}: {e}")
+            logger.error("Error cleaning metadata from %s: %s", file_path, e)
+            self.metrics.record_error('clean', e)
             return file_path
     
-    async def _send_media_to_target(self, bot: Bot, media_type: str, file_path: str, caption: str, parse_mode: str) -> None:
-        """Отправляет медиафайл в целевой канал"""
+    async def _clean_bytes_metadata(self, data: bytes) -> bytes:
+        """Очищает метаданные из файла в памяти в пуле воркеров"""
+        try:
+            cleaned_data, found = await self.cleaner.clean_bytes(data)
+            self._record_cleaning(found)
+            return cleaned_data
+            
+        except asyncio.TimeoutError as e:
+            logger.error("Timed out cleaning metadata in memory")
+            self.metrics.record_error('clean', e)
+            return data
+        except Exception as e:
+            logger.error("Error cleaning metadata in memory: %s", e)
+            self.metrics.record_error('clean', e)
+            return data
+    
+    def _record_cleaning(self, found: Optional[set]) -> None:
+        """Учитывает результат проверки метаданных в статистике"""
+        if found is None:
+            outcome = 'unsupported'
+        elif found:
+            outcome = 'cleaned'
+        else:
+            outcome = 'skipped'
+        self.monitor.record_cleaning(outcome)
+        self.metrics.cleaning_total.labels(outcome).inc()
+    
+    async def _send_to_targets(self, targets: List[int], send: Callable[[int], Awaitable]) -> list:
+        """
+        Выполняет отправку во все целевые каналы параллельно
+        
+        Ошибка в одном канале не мешает остальным; исключение поднимается,
+        только если отправка не удалась ни в один канал.
+        """
+        results = await asyncio.gather(*(send(chat_id) for chat_id in targets), return_exceptions=True)
+        errors = []
+        for chat_id, result in zip(targets, results):
+            if isinstance(result, Exception):
+                logger.error("Error sending to target channel %s: %s", chat_id, result)
+                self.metrics.record_error('send', result)
+                errors.append(result)
+        if errors and len(errors) == len(targets):
+            raise errors[0]
+        return results
+    
+    async def _copy_to_target(self, bot: Bot, chat_id: int, source: Message):
+        """Копирует исходное сообщение в целевой канал на стороне Telegram"""
+        return await self.flood_control.call(chat_id, lambda: bot.copy_message(
+            chat_id=chat_id,
+            from_chat_id=source.chat_id,
+            message_id=source.message_id
+        ))
+    
+    async def _send_text_to_target(self, bot: Bot, chat_id: int, prepared: PreparedMessage) -> Message:
+        """Отправляет текст сообщения в целевой канал"""
+        return await self.flood_control.call(chat_id, lambda: bot.send_message(
+            chat_id=chat_id,
+            text=prepared.text,
+            parse_mode=prepared.parse_mode
+        ))
+    
+    async def _publish_media(self, bot: Bot, targets: List[int], media: PreparedMedia, prepared: PreparedMessage,
+                             caption: Optional[str] = None) -> Optional[PreparedMedia]:
+        """
+        Отправляет медиафайл во все целевые каналы
+        
+        Файл загружается один раз в первый канал, остальным каналам он
+        параллельно отправляется по file_id, полученному при загрузке.
+        
+        Returns:
+            Отправленный медиафайл или None, если его не удалось подготовить повторно
+        """
+        if caption is None:
+            caption = prepared.text
+        first_target, other_targets = targets[0], targets[1:]
+        
         try:
-            with open(file_path, 'rb') as file:
-                if media_type == 'photo':
-                    await bot.send_photo(
-                        chat_id=self.config.TARGET_CHANNEL_ID,
-                        photo=file,
-                        caption=caption,
-                        parse_mode=parse_mode
-                    )
-                elif media_type == 'video':
-                    await bot.send_video(
-                        chat_id=self.config.TARGET_CHANNEL_ID,
-                        video=file,
-                        caption=caption,
-                        parse_mode=parse_mode
-                    )
-                elif media_type == 'document':
-                    await bot.send_document(
-                        chat_id=self.config.TARGET_CHANNEL_ID,
-                        document=file,
-                        caption=caption,
-                        parse_mode=parse_mode
-                    )
-                elif media_type == 'animation':
-                    await bot.send_animation(
-                        chat_id=self.config.TARGET_CHANNEL_ID,
-                        animation=file,
-                        caption=caption,
-                        parse_mode=parse_mode
-                    )
-                elif media_type == 'video_note':
-                    await bot.send_video_note(
-                        chat_id=self.config.TARGET_CHANNEL_ID,
-                        video_note=file
-                    )
-                elif media_type == 'voice':
-                    await bot.send_voice(
-                        chat_id=self.config.TARGET_CHANNEL_ID,
-                        voice=file,
-                        caption=caption,
-                        parse_mode=parse_mode
-                    )
-                elif media_type == 'audio':
-                    await bot.send_audio(
-                        chat_id=self.config.TARGET_CHANNEL_ID,
-                        audio=file,
-                        caption=caption,
-                        parse_mode=parse_mode
-                    )
+            sent = await self._send_media_to_target(bot, first_target, media, caption, prepared.parse_mode)
+        except TelegramError as e:
+            if not media.cached:
+                raise
+            # file_id из кэша устарел: обрабатываем файл заново
+            logger.warning("Cached file_id for %s rejected (%s), uploading again", media.file_unique_id, e)
+            self.upload_cache.invalidate(media.file_unique_id)
+            media = await self._prepare_media(bot, media.media_type, media.source, prepared, use_cache=False)
+            if not media:
+                return None
+            sent = await self._send_media_to_target(bot, first_target, media, caption, prepared.parse_mode)
+        
+        self._remember_upload(media, sent)
+        
+        if other_targets:
+            uploaded = self._uploaded_media(media, sent)
+            await self._send_to_targets(
+                other_targets,
+                lambda chat_id: self._send_media_to_target(bot, chat_id, uploaded, caption, prepared.parse_mode)
+            )
+        return media
+    
+    async def _publish_each(self, bot: Bot, targets: List[int], prepared: PreparedMessage,
+                            first_caption_only: bool) -> List[PreparedMedia]:
+        """
+        Отправляет медиафайлы по одному; ошибка одного файла не прерывает отправку остальных
+        
+        Returns:
+            Отправленные медиафайлы
+        
+        Raises:
+            Ошибку последнего файла или RuntimeError, если не отправлен ни один файл
+        """
+        sent = []
+        error: Optional[Exception] = None
+        for index, media in enumerate(prepared.media):
+            caption = prepared.text if index == 0 or not first_caption_only else ""
+            try:
+                published = await self._publish_media(bot, targets, media, prepared, caption)
+                if published is not None:
+                    sent.append(published)
+            except Exception as e:
+                logger.error("Error processing %s %s: %s", media.media_type, media.file_id, e)
+                self.metrics.record_error('publish', e)
+                error = e
+        
+        if not sent:
+            # Сообщение не опубликовано: в журнал пишется неудача, а не публикация
+            raise error or RuntimeError(f"No media of message {prepared.source_message.message_id} was sent")
+        return sent
+    
+    async def _publish_album(self, bot: Bot, targets: List[int], prepared: PreparedMessage) -> List[PreparedMedia]:
+        """
+        Публикует альбом одним вызовом send_media_group с подписью на первом элементе
+        
+        Returns:
+            Отправленные элементы альбома
+        """
+        if len(prepared.media) < 2 or any(media.media_type not in ALBUM_MEDIA_TYPES for media in prepared.media):
+            # Один элемент или типы, которые нельзя сгруппировать: отправляем по одному
+            return await self._publish_each(bot, targets, prepared, first_caption_only=True)
+        
+        first_target, other_targets = targets[0], targets[1:]
+        try:
+            sent = await self._send_media_group(bot, first_target, prepared.media, prepared)
+        except TelegramError as e:
+            if not any(media.cached for media in prepared.media):
+                raise
+            # file_id из кэша устарел: заново обрабатываем элементы из кэша
+            logger.warning(
+                "Cached file_id rejected in album %s (%s), uploading again", prepared.source_message.media_group_id, e
+            )
+            media_items = []
+            for media in prepared.media:
+                if media.cached:
+                    self.upload_cache.invalidate(media.file_unique_id)
+                    media = await self._prepare_media(bot, media.media_type, media.source, prepared, use_cache=False)
+                if media:
+                    media_items.append(media)
+            prepared.media = media_items
+            return await self._publish_album(bot, targets, prepared)
+        
+        for media, message in zip(prepared.media, sent):
+            self._remember_upload(media, message)
+        
+        if other_targets:
+            # Альбом загружен один раз: остальным каналам отправляем его по file_id
+            uploaded = [self._uploaded_media(media, message) for media, message in zip(prepared.media, sent)]
+            await self._send_to_targets(
+                other_targets,
+                lambda chat_id: self._send_media_group(bot, chat_id, uploaded, prepared)
+            )
+        return list(prepared.media)
+    
+    async def _send_media_group(self, bot: Bot, chat_id: int, media_items: List[PreparedMedia],
+                                prepared: PreparedMessage) -> tuple:
+        """Отправляет элементы альбома в целевой канал одним сообщением"""
+        upload_size = sum(
+            len(media.data) if media.data is not None else os.path.getsize(media.file_path)
+            for media in media_items if media.data is not None or media.file_path
+        )
+        await self.upload_bandwidth.acquire(upload_size)
+        
+        async def send() -> tuple:
+            started = time.perf_counter()
+            # Файлы открываются заново при каждой попытке
+            with ExitStack() as stack:
+                input_media = []
+                for index, media in enumerate(media_items):
+                    filename = None
+                    if media.data is not None:
+                        content = media.data
+                        filename = self._upload_filename(media)
+                    elif media.file_path and self.config.BOT_API_LOCAL_MODE:
+                        # Локальный сервер читает файл с диска сам
+                        content = Path(media.file_path)
+                    elif media.file_path:
+                        content = stack.enter_context(open(media.file_path, 'rb'))
+                        filename = media.file_name
+                    else:
+                        content = media.file_id
+                    
+                    input_media.append(ALBUM_MEDIA_TYPES[media.media_type](
+                        media=content,
+                        caption=prepared.text if index == 0 and prepared.text else None,
+                        parse_mode=prepared.parse_mode,
+                        filename=filename
+                    ))
+                
+                sent = await bot.send_media_group(
+                    chat_id=chat_id,
+                    media=input_media
+                )
+            self._observe_transfer('upload', 'album', started, upload_size)
+            return sent
+        
+        return await self.flood_control.call(chat_id, send, cost=len(media_items))
+    
+    def _remember_upload(self, media: PreparedMedia, sent: Message) -> None:
+        """Запоминает file_id загруженной очищенной копии в кэше загрузок"""
+        if media.file_path or media.data is not None:
+            sent_file_id = self._sent_file_id(sent, media.media_type)
+            if sent_file_id:
+                self.upload_cache.put(media.file_unique_id, sent_file_id)
+    
+    def _uploaded_media(self, media: PreparedMedia, sent: Message) -> PreparedMedia:
+        """Возвращает медиафайл для повторной отправки по file_id загруженной копии"""
+        sent_file_id = self._sent_file_id(sent, media.media_type)
+        if not sent_file_id:
+            # Без file_id копии файл придется загрузить заново; исходный file_id не подходит
+            return media
+        return PreparedMedia(media.media_type, sent_file_id, media.file_unique_id, source=media.source)
+    
+    @staticmethod
+    def _upload_filename(media: PreparedMedia) -> str:
+        """Имя файла для загрузки из памяти или с диска"""
+        return media.file_name or getattr(media.source, 'file_name', None) or media.media_type
+    
+    @staticmethod
+    def _sent_file_id(message: Message, media_type: str) -> Optional[str]:
+        """Извлекает file_id загруженного файла из отправленного сообщения"""
+        if media_type == 'photo':
+            return message.photo[-1].file_id if message.photo else None
+        media = getattr(message, media_type, None)
+        return media.file_id if media else None
+    
+    async def _send_media_to_target(self, bot: Bot, chat_id: int, media: PreparedMedia, caption: str, parse_mode: str) -> Message:
+        """Отправляет медиафайл в целевой канал из памяти, локального файла или по file_id"""
+        
+        if media.data is not None:
+            upload_size = len(media.data)
+        elif media.file_path:
+            upload_size = os.path.getsize(media.file_path)
+        else:
+            upload_size = 0
+        
+        async def send() -> Message:
+            # Файл открывается заново при каждой попытке
+            started = time.perf_counter()
+            if media.data is not None:
+                file = InputFile(media.data, filename=self._upload_filename(media))
+                sent = await self._send_media(bot, chat_id, media.media_type, file, caption, parse_mode)
+            elif media.file_path and self.config.BOT_API_LOCAL_MODE:
+                # Локальный сервер читает файл с диска сам: передаем путь вместо содержимого
+                sent = await self._send_media(bot, chat_id, media.media_type, Path(media.file_path), caption, parse_mode)
+            elif media.file_path and media.file_name:
+                # Перекодированный документ: имя с расширением нового формата вместо имени временного файла
+                with open(media.file_path, 'rb') as f:
+                    file = InputFile(f, filename=media.file_name)
+                    sent = await self._send_media(bot, chat_id, media.media_type, file, caption, parse_mode)
+            elif media.file_path:
+                with open(media.file_path, 'rb') as file:
+                    sent = await self._send_media(bot, chat_id, media.media_type, file, caption, parse_mode)
+            else:
+                sent = await self._send_media(bot, chat_id, media.media_type, media.file_id, caption, parse_mode)
+            self._observe_transfer('upload', media.media_type, started, upload_size)
+            return sent
+        
+        try:
+            await self.upload_bandwidth.acquire(upload_size)
+            return await self.flood_control.call(chat_id, send)
                     
         except Exception as e:
-            logger.error(f"Error sending {media_type} to target channel: {e}")
+            logger.error("Error sending %s to target channel %s: %s", media.media_type, chat_id, e)
             raise
     
+    async def _send_media(self, bot: Bot, chat_id: int, media_type: str, file: Union[str, Path, BinaryIO, InputFile], caption: str, parse_mode: str) -> Message:
+        """Вызывает метод отправки для типа медиа; file - открытый файл, путь (локальный сервер) или file_id"""
+        if media_type == 'photo':
+            return await bot.send_photo(
+                chat_id=chat_id,
+                photo=file,
+                caption=caption,
+                parse_mode=parse_mode
+            )
+        elif media_type == 'video':
+            return await bot.send_video(
+                chat_id=chat_id,
+                video=file,
+                caption=caption,
+                parse_mode=parse_mode
+            )
+        elif media_type == 'document':
+            return await bot.send_document(
+                chat_id=chat_id,
+                document=file,
+                caption=caption,
+                parse_mode=parse_mode
+            )
+        elif media_type == 'animation':
+            return await bot.send_animation(
+                chat_id=chat_id,
+                animation=file,
+                caption=caption,
+                parse_mode=parse_mode
+            )
+        elif media_type == 'video_note':
+            return await bot.send_video_note(
+                chat_id=chat_id,
+                video_note=file
+            )
+        elif media_type == 'voice':
+            return await bot.send_voice(
+                chat_id=chat_id,
+                voice=file,
+                caption=caption,
+                parse_mode=parse_mode
+            )
+        elif media_type == 'audio':
+            return await bot.send_audio(
+                chat_id=chat_id,
+                audio=file,
+                caption=caption,
+                parse_mode=parse_mode
+            )
+        raise ValueError(f"Unsupported media type: {media_type}")
+    
     def _cleanup_temp_files(self, file_paths: list) -> None:
         """Удаляет временные файлы"""
         for file_path in file_paths:
@@ -279,7 +1195,7 @@ class TelegramRelayBot:
                 if os.path.exists(file_path):
                     os.unlink(file_path)
             except Exception as e:
-                logger.error(f"Error deleting temp file {file_path}: {e}")
+                logger.error("Error deleting temp file %s: %s", file_path, e)
     
     def setup_handlers(self) -> None:
         """Настраивает обработчики сообщений"""
@@ -291,6 +1207,86 @@ class TelegramRelayBot:
             )
         )
     
+    async def _start_updates(self) -> None:
+        """Запускает прием обновлений через polling или webhook"""
+        if self.config.UPDATE_MODE != 'webhook':
+            await self.application.updater.start_polling()
+            return
+        
+        # Сервер запускается до setWebhook, чтобы первые обновления не получили ошибку
+        self.webhook_server = WebhookServer(
+            self.application,
+            listen=self.config.WEBHOOK_LISTEN,
+            port=self.config.WEBHOOK_PORT,
+            path=self.config.WEBHOOK_PATH,
+            secret_token=self.config.WEBHOOK_SECRET
+        )
+        await self.webhook_server.start()
+        
+        webhook_url = self.config.WEBHOOK_URL.rstrip('/') + self.config.WEBHOOK_PATH
+        await self.application.bot.set_webhook(url=webhook_url, secret_token=self.config.WEBHOOK_SECRET)
+        logger.info(f"Webhook set: {webhook_url}")
+    
+    async def _catch_up(self) -> None:
+        """Забирает накопившиеся обновления пачками и ставит их в конвейер"""
+        self.catchup = BacklogCatchUp(
+            self.application.bot,
+            self.pipeline,
+            self.albums,
+            accept=self._accept_batch,
+            enqueue=self._enqueue_message,
+            media_file_ids=self._media_file_ids,
+            prefetcher=self.file_prefetcher,
+            batch_size=self.config.CATCHUP_BATCH,
+            prefetch=self.config.CATCHUP_PREFETCH
+        )
+        try:
+            await self.catchup.run(self._stop_event)
+        except Exception as e:
+            # Оставшиеся обновления придут обычным путем после запуска приема
+            logger.error(f"Catch-up failed: {e}")
+    
+    async def _consume_updates(self) -> None:
+        """Принимает пачки обновлений от процесса приема (режим воркера)"""
+        while not self.updates.stopped:
+            batch = await asyncio.to_thread(self.updates.receive, RECEIVE_TIMEOUT)
+            if not batch:
+                continue
+            
+            messages = []
+            for update_id, payload in batch:
+                try:
+                    update = Update.de_json(json.loads(payload), self.application.bot)
+                except Exception as e:
+                    logger.error(f"Cannot decode update {update_id}: {e}")
+                    continue
+                message = update.message or update.channel_post
+                if message:
+                    messages.append(message)
+            
+            accepted = await self._accept_batch(messages)
+            # Подтверждение после записи в журнал: процессу приема больше не нужно хранить эти обновления
+            self.updates.ack([update_id for update_id, _ in batch])
+            for message in accepted:
+                await self._enqueue_message(message)
+        
+        # Процесс приема передал все обновления и запросил остановку
+        self.request_stop()
+    
+    async def _stop_updates(self) -> None:
+        """Останавливает прием обновлений"""
+        if self._updates_consumer is not None:
+            if not self._updates_consumer.done():
+                self._updates_consumer.cancel()
+            await asyncio.gather(self._updates_consumer, return_exceptions=True)
+            self._updates_consumer = None
+        elif self.webhook_server is not None:
+            # Webhook не удаляется: пока бот остановлен, Telegram копит обновления
+            await self.webhook_server.stop()
+            self.webhook_server = None
+        elif self.application.updater.running:
+            await self.application.updater.stop()
+    
     async def start(self) -> None:
         """Запускает бота"""
         logger.info("Starting Telegram Relay Bot...")
@@ -298,36 +1294,84 @@ class TelegramRelayBot:
         # Настраиваем обработчики
         self.setup_handlers()
         
+        # Открываем журнал и находим сообщения, не опубликованные до перезапуска
+        pending = self.journal.open()
+        self.journal.start()
+        self.monitor.start(self.config.STATS_FLUSH_INTERVAL)
+        
+        if self.config.METRICS_PORT:
+            self.metrics_server = MetricsServer(
+                self.metrics.registry,
+                listen=self.config.METRICS_LISTEN,
+                port=self.config.METRICS_PORT
+            )
+            await self.metrics_server.start()
+        
         # Запускаем бота
         await self.application.initialize()
         await self.application.start()
+        self.pipeline.start()
+        
+        # Незавершенные сообщения ставятся в конвейер раньше новых
+        await self._resume_pending(pending)
         
         # Получаем информацию о боте
         bot_info = await self.application.bot.get_me()
         logger.info(f"Bot started: @{bot_info.username}")
         
-        # Запускаем polling
-        await self.application.updater.start_polling()
+        if self.updates is not None:
+            # Воркер: обновления получает процесс приема, в том числе накопившиеся за время простоя
+            self._updates_consumer = asyncio.create_task(self._consume_updates(), name="worker-updates")
+        else:
+            # Накопившиеся за время простоя обновления забираются пачками до запуска приема
+            if self.config.CATCHUP_ENABLED:
+                await self._catch_up()
+            
+            # Запускаем прием обновлений
+            await self._start_updates()
         
         logger.info("Bot is running. Press Ctrl+C to stop.")
         
-        # Ждем завершения
+        # Ждем запроса остановки
         try:
-            await asyncio.Event().wait()
+            await self._stop_event.wait()
         except KeyboardInterrupt:
             logger.info("Stopping bot...")
         finally:
+            # Перестаем принимать обновления и дообрабатываем принятые не дольше SHUTDOWN_TIMEOUT
+            await self._stop_updates()
+            if self.catchup is not None:
+                await self.catchup.stop()
+            if not await self.pipeline.stop(self.config.SHUTDOWN_TIMEOUT):
+                logger.warning("Unfinished messages remain in the journal and will be resumed on next start")
+            await self.journal.close()
+            self.cleaner.shutdown()
+            logger.info(
+                f"Upload cache: {self.upload_cache.hits} hits, {self.upload_cache.misses} misses "
+                f"({self.upload_cache.hit_rate:.0%})"
+            )
+            await self.upload_cache.close()
+            if self.dedup.enabled:
+                logger.info(f"Dedup index: {self.dedup.duplicates} duplicate messages skipped")
+            await self.dedup.close()
+            logger.info(f"Flood control: {self.flood_control.stats()}")
+            await self.monitor.stop()
+            if self.metrics_server is not None:
+                await self.metrics_server.stop()
             await self.application.stop()
             await self.application.shutdown()
 
 def main():
     """Главная функция"""
+    listener = setup_logging(Config.LOG_LEVEL, Config.LOG_FORMAT, Config.LOG_FILE, Config.LOG_SAMPLE_RATE)
     try:
         bot = TelegramRelayBot()
         asyncio.run(bot.start())
     except Exception as e:
         logger.error(f"Failed to start bot: {e}")
         raise
+    finally:
+        listener.stop()
 
 if __name__ == "__main__":
     main()
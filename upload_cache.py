@@ -0,0 +1,154 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class UploadCache:
+    """
+    Кэш загрузок: file_unique_id исходного файла -> file_id очищенной копии
+
+    Повторные публикации, пересылки и повторы того же файла отправляются
+    по file_id без скачивания, очистки и загрузки. В памяти хранится
+    ограниченное число записей (LRU), опционально - в SQLite между перезапусками.
+    Запросы к SQLite выполняются в отдельном потоке, а изменения записываются
+    в базу пачками в фоне, поэтому кэш не блокирует цикл событий.
+    """
+
+    def __init__(self, capacity: int = 1024, db_path: Optional[str] = None):
+        self.capacity = max(1, capacity)
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Изменения, еще не записанные в базу (file_id None - удаление): ожидающие и записываемые сейчас
+        self._pending: Dict[str, Tuple[Optional[str], float]] = {}
+        self._writing: Dict[str, Tuple[Optional[str], float]] = {}
+        self._writer: Optional[asyncio.Task] = None
+
+        self._db: Optional[sqlite3.Connection] = None
+        # Соединение используется из потоков asyncio.to_thread
+        self._db_lock = threading.Lock()
+        if db_path:
+            self._db = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS upload_cache ("
+                "file_unique_id TEXT PRIMARY KEY, file_id TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    async def get(self, file_unique_id: str) -> Optional[str]:
+        """Возвращает file_id очищенной копии или None"""
+        file_id = self._entries.get(file_unique_id)
+        if file_id is not None:
+            self._entries.move_to_end(file_unique_id)
+            self.hits += 1
+            return file_id
+
+        if self._db is not None:
+            unsaved = self._unsaved(file_unique_id)
+            if unsaved is None:
+                try:
+                    file_id = await asyncio.to_thread(self._load, file_unique_id)
+                except sqlite3.Error as e:
+                    logger.error(f"Error reading upload cache: {e}")
+                    file_id = None
+                # Запись могла измениться, пока шел запрос к базе
+                unsaved = self._unsaved(file_unique_id)
+            if unsaved is not None:
+                file_id = unsaved[0]
+            if file_id:
+                self._remember(file_unique_id, file_id)
+                self.hits += 1
+                return file_id
+
+        self.misses += 1
+        return None
+
+    def put(self, file_unique_id: str, file_id: str) -> None:
+        """Запоминает file_id, полученный при первой загрузке очищенного файла"""
+        self._remember(file_unique_id, file_id)
+        self._schedule(file_unique_id, file_id)
+
+    def invalidate(self, file_unique_id: str) -> None:
+        """Удаляет запись, например если Telegram больше не принимает file_id"""
+        self._entries.pop(file_unique_id, None)
+        self._schedule(file_unique_id, None)
+
+    def _unsaved(self, file_unique_id: str) -> Optional[Tuple[Optional[str], float]]:
+        """Возвращает последнее еще не записанное в базу изменение записи"""
+        return self._pending.get(file_unique_id) or self._writing.get(file_unique_id)
+
+    def _load(self, file_unique_id: str) -> Optional[str]:
+        """Читает запись из базы (выполняется в отдельном потоке)"""
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT file_id FROM upload_cache WHERE file_unique_id = ?", (file_unique_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _schedule(self, file_unique_id: str, file_id: Optional[str]) -> None:
+        """Ставит изменение в очередь фоновой записи в базу"""
+        if self._db is None:
+            return
+        self._pending[file_unique_id] = (file_id, time.time())
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._write_pending(), name="upload-cache-writer")
+
+    async def _write_pending(self) -> None:
+        """Записывает накопленные изменения, пока они появляются"""
+        while self._pending and self._db is not None:
+            self._writing, self._pending = self._pending, {}
+            try:
+                await asyncio.to_thread(self._write_batch, list(self._writing.items()))
+            except sqlite3.Error as e:
+                logger.error(f"Error saving upload cache entries: {e}")
+            finally:
+                self._writing = {}
+
+    def _write_batch(self, batch: List[Tuple[str, Tuple[Optional[str], float]]]) -> None:
+        """Применяет пачку изменений одной транзакцией (выполняется в отдельном потоке)"""
+        with self._db_lock:
+            self._db.execute("BEGIN")
+            try:
+                for file_unique_id, (file_id, created_at) in batch:
+                    if file_id is None:
+                        self._db.execute("DELETE FROM upload_cache WHERE file_unique_id = ?", (file_unique_id,))
+                    else:
+                        self._db.execute(
+                            "INSERT OR REPLACE INTO upload_cache (file_unique_id, file_id, created_at) VALUES (?, ?, ?)",
+                            (file_unique_id, file_id, created_at)
+                        )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def _remember(self, file_unique_id: str, file_id: str) -> None:
+        """Добавляет запись в память, вытесняя самую давно использованную"""
+        self._entries[file_unique_id] = file_id
+        self._entries.move_to_end(file_unique_id)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    @property
+    def hit_rate(self) -> float:
+        """Доля обращений, найденных в кэше"""
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    async def close(self) -> None:
+        """Дописывает накопленные изменения и закрывает базу данных"""
+        if self._writer is not None:
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+        if self._db is not None:
+            if self._pending:
+                await self._write_pending()
+            self._db.close()
+            self._db = None
@@ -0,0 +1,69 @@
+import hmac
+import json
+import logging
+from typing import Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+# Заголовок, в котором Telegram передает secret_token из setWebhook
+SECRET_TOKEN_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookServer:
+    """
+    HTTP-сервер для приема обновлений через webhook
+
+    Проверяет секретный токен, кладет обновление в очередь приложения
+    и сразу отвечает Telegram; обработка идет уже вне HTTP-запроса.
+    """
+
+    def __init__(self, application: Application, listen: str, port: int, path: str, secret_token: str):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret_token = secret_token.encode()
+        self._runner: Optional[web.AppRunner] = None
+        self.received = 0
+        self.rejected = 0
+
+    async def start(self) -> None:
+        """Запускает сервер"""
+        app = web.Application()
+        app.router.add_post(self.path, self._handle_update)
+        # Журнал доступа отключен: на каждое обновление он пишет строку в лог
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port)
+        await site.start()
+        logger.info(f"Webhook server listening on {self.listen}:{self.port}{self.path}")
+
+    async def stop(self) -> None:
+        """Останавливает сервер"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+            logger.info(f"Webhook server stopped: {self.received} updates received, {self.rejected} rejected")
+
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        """Принимает обновление от Telegram"""
+        token = request.headers.get(SECRET_TOKEN_HEADER, '').encode()
+        if not hmac.compare_digest(token, self.secret_token):
+            self.rejected += 1
+            logger.warning(f"Webhook request with invalid secret token from {request.remote}")
+            return web.Response(status=403)
+
+        try:
+            update = Update.de_json(json.loads(await request.read()), self.application.bot)
+        except Exception as e:
+            self.rejected += 1
+            logger.warning(f"Invalid webhook payload: {e}")
+            return web.Response(status=400)
+
+        self.received += 1
+        await self.application.update_queue.put(update)
+        return web.Response()